@@ -2,11 +2,21 @@
 import os
 import json
 import re
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv, find_dotenv
-from openai import OpenAI
 from langchain_community.vectorstores import FAISS
 # from langchain.schema import Document
-from langchain_community.embeddings import HuggingFaceEmbeddings
+
+import resources
+from llm_client import chat_completion, stream_chat_completion
+from embedding_cache import normalize_text
+from prompt_builder import CHUNK_SEPARATOR, build_messages
+from conversation_memory import ConversationMemory, drop_last_turn
+from property_frame import PropertyFrame
+from ttl_cache import TTLCache
+from sparse_index import reciprocal_rank_fusion
 
 # 导入function模块
 try:
@@ -55,10 +65,91 @@ def load_api_key():
 API_KEY = load_api_key()
 
 # 配置常量
-INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "database", "faiss_index")
-EMBEDDING_REPO = "qwen/Qwen3-Embedding-0.6B"
-DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+INDEX_DIR = resources.INDEX_DIR
+EMBEDDING_REPO = resources.EMBEDDING_REPO
 QWEN_MODEL = "qwen-vl-max-latest"
+# 检索模式：dense（仅向量）、sparse（仅 BM25）、hybrid（两者倒数排名融合，关键词查询走稀疏快速路径）
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# 混合检索时每路召回 top_k 的多少倍再融合
+HYBRID_CANDIDATE_FACTOR = 4
+# 单个工具调用的超时（秒）
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "45"))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "256"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "600"))
+
+# 检索结果缓存，进程内所有会话共享；键为 (索引版本, 检索模式, 规范化查询, top_k)
+_retrieval_cache = TTLCache(maxsize=RETRIEVAL_CACHE_SIZE, ttl=RETRIEVAL_CACHE_TTL)
+_retrieval_cache_version = None
+
+
+def get_retrieval_cache_stats() -> dict:
+    """检索缓存的命中统计，用于调整 RETRIEVAL_CACHE_SIZE / RETRIEVAL_CACHE_TTL"""
+    return {**_retrieval_cache.stats(), "index_version": _retrieval_cache_version}
+
+
+def contains_chinese(text: str) -> bool:
+    """检测文本是否包含中文字符"""
+    for char in text:
+        if '\u4e00' <= char <= '\u9fff':
+            return True
+    return False
+
+
+AGENT_FUNCTIONS_PROMPT = """You are a helpful rental assistant with access to real estate database functions.
+
+## Available Functions:
+1. **search_properties_from_questionnaire**: Use this when you have questionnaire data from the user. This function accepts the complete questionnaire data structure and automatically handles parameter conversion.
+
+2. **search_properties**: Use this for direct parameter searches when you don't have complete questionnaire data.
+
+3. **analyze_properties_by_region_from_questionnaire**: Use this for regional analysis when you have questionnaire data.
+
+4. **analyze_properties_by_region**: Use this for regional analysis with direct parameters.
+
+## Function Usage Guidelines:
+- **PRIORITIZE questionnaire-based functions** when questionnaire data or updated requirements are available
+- When calling questionnaire-based functions, pass the COMPLETE questionnaire data object, not individual parameters
+- The questionnaire data structure includes: budget_min, budget_max, room_type, commute_time, includes_bills, includes_furniture, total_budget, consider_sharing, move_in_date, lease_duration, accept_premium, accept_small_room
+- Use updated requirements from inquiry agent when available - they take priority over original questionnaire data
+- Always consider the user's language preference and context when making recommendations
+
+## Example Function Call:
+When you have questionnaire data, call:
+search_properties_from_questionnaire(questionnaire_data={...complete questionnaire object...})
+
+NOT:
+search_properties(min_price=660, max_price=860, ...)"""
+
+# 角色说明和回答要求（原先在每次的用户提示中重复）
+AGENT_ROLE_PROMPTS = {
+    "chinese": """你是一名专业的租房中介助手，根据公司知识库信息为用户提供租房建议。请仔细阅读用户消息中的知识库内容、用户问卷信息、需求分析师的评估结果，结合对话历史和用户当前问题，提供专业的租房建议。
+
+# 要求
+- 请用中文回答
+- 结合用户问卷信息和需求分析师的评估结果提供建议
+- 根据知识库信息提供具体的租房建议
+- 包含具体的地区、价格、房型等信息
+- 如果信息不足，请询问用户更多细节
+- 保持专业、友好的语调
+- 充分考虑用户的预算、房型偏好和特殊需求""",
+    "english": """You are a professional rental assistant. Based on the knowledge base information in the user message, provide rental suggestions for users.
+
+# Requirements
+- Please respond in user's language
+- Provide recommendations based on user questionnaire and requirement analyst assessment
+- Provide specific rental recommendations based on the knowledge base
+- Include specific areas, prices, property types, etc.
+- If information is insufficient, ask for more details from the user
+- Maintain a professional and friendly tone
+- Consider user's budget, room type preferences, and special requirements"""
+}
+
+# 系统提示只取决于语言，导入时生成一次；对话摘要、历史和本轮上下文都附加在其后，
+# 前缀保持不变，可以命中服务端的前缀缓存
+AGENT_SYSTEM_PROMPTS = {
+    language: AGENT_FUNCTIONS_PROMPT + "\n\n" + role_prompt
+    for language, role_prompt in AGENT_ROLE_PROMPTS.items()
+}
 
 
 class QrentAgent:
@@ -66,19 +157,20 @@ class QrentAgent:
         self.vector_store = None
         self.embed_model = None
         self.history = []
+        # 较早的对话轮次在后台并入摘要，提示词只带 摘要 + 最近几轮原文
+        self.memory = ConversationMemory(API_KEY, caller="agent-memory")
         self.questionnaire_data = None
         self.inquiry_agent_history = None
         self.inquiry_updated_requirements = None
+        # 最近一次组装提示词的 token 统计
+        self.last_prompt_stats = None
         self._initialize()
     
     def _initialize(self):
-        """初始化嵌入模型和向量存储"""
+        """初始化嵌入模型和向量存储（进程内共享，只在首次使用时加载）"""
         try:
-            # 初始化嵌入模型
-            self.embed_model = HuggingFaceEmbeddings(
-                model_name=EMBEDDING_REPO,
-                model_kwargs={"device": "cpu"}
-            )
+            # 嵌入模型带磁盘缓存，与索引构建共用，重复查询跳过模型推理
+            self.embed_model = resources.get_embed_model()
             
             # 加载向量存储
             self.vector_store = self._load_vector_store()
@@ -93,17 +185,9 @@ class QrentAgent:
         try:
             if not self.embed_model:
                 raise ValueError("Embedding model not initialized")
-                
-            # 检查索引目录是否存在且非空
-            if not os.path.isdir(INDEX_DIR) or not os.listdir(INDEX_DIR):
-                raise ValueError(f"Vector store not found at {INDEX_DIR}. Please build the vector store first.")
             
-            # 载入FAISS向量存储
-            return FAISS.load_local(
-                folder_path=INDEX_DIR,
-                embeddings=self.embed_model,
-                allow_dangerous_deserialization=True
-            )
+            # 载入共享的FAISS向量存储
+            return resources.get_vector_store(INDEX_DIR)
         except Exception as e:
             print(f"Error loading vector store: {e}")
             raise
@@ -117,151 +201,235 @@ class QrentAgent:
         if inquiry_updated_requirements is not None:
             self.inquiry_updated_requirements = inquiry_updated_requirements
     
-    def retrieve_vector_context(self, query: str, top_k: int = 5):
-        """从向量存储中检索相关上下文"""
+    def _search_documents(self, query: str, top_k: int, mode: str) -> list:
+        """按检索模式返回 top_k 个分块"""
+        sparse = resources.get_sparse_index(INDEX_DIR) if mode != "dense" else None
+        if sparse is None:
+            return resources.get_retriever(INDEX_DIR).invoke(query, k=top_k)
+        
+        depth = top_k * HYBRID_CANDIDATE_FACTOR
+        sparse_hits = sparse.search(query, depth)
+        if mode == "sparse" or (sparse.is_keyword_query(query) and len(sparse_hits) >= top_k):
+            # 关键词查询直接使用 BM25 结果，省去查询嵌入和向量检索
+            positions = [position for position, _ in sparse_hits[:top_k]]
+        else:
+            vector = np.asarray([self.embed_model.embed_query(query)], dtype=np.float32)
+            _, dense = self.vector_store.index.search(vector, depth)
+            dense_positions = [int(position) for position in dense[0] if position != -1]
+            fused = reciprocal_rank_fusion([dense_positions, [position for position, _ in sparse_hits]])
+            positions = [position for position, _ in fused[:top_k]]
+        
+        store = self.vector_store
+        return [store.docstore.search(store.index_to_docstore_id[position]) for position in positions]
+    
+    def retrieve_vector_chunks(self, query: str, top_k: int = 5, mode: str = RETRIEVAL_MODE):
+        """检索相关分块，按得分从高到低返回 (分块文本列表, 文档ID列表)，mode 为 dense / sparse / hybrid"""
         if not self.vector_store:
             raise ValueError("向量存储未初始化")
         
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": top_k})
-        docs = retriever.invoke(query)
-        context = "\n---\n".join([d.page_content for d in docs])
+        global _retrieval_cache_version
+        # 磁盘上的索引重建后重新加载，版本变化时清空旧结果
+        resources.refresh_if_changed()
+        self.vector_store = self._load_vector_store()
+        version = resources.index_version()
+        if version != _retrieval_cache_version:
+            _retrieval_cache.clear()
+            _retrieval_cache_version = version
+        
+        key = (version, mode, normalize_text(query), top_k)
+        cached = _retrieval_cache.get(key)
+        if cached is not None:
+            chunks, ids = cached
+            return list(chunks), list(ids)
+        
+        docs = self._search_documents(query, top_k, mode)
+        chunks = [d.page_content for d in docs]
         ids = [d.metadata.get("id") for d in docs if d.metadata.get("id")]
-        return context, ids
+        _retrieval_cache.set(key, (tuple(chunks), tuple(ids)))
+        return chunks, ids
+    
+    def retrieve_vector_context(self, query: str, top_k: int = 5, mode: str = RETRIEVAL_MODE):
+        """从向量存储中检索相关上下文，返回拼接后的上下文和文档ID"""
+        chunks, ids = self.retrieve_vector_chunks(query, top_k, mode)
+        return CHUNK_SEPARATOR.join(chunks), ids
+    
+    def _parse_tool_arguments(self, arguments_str: str) -> dict:
+        """解析模型返回的工具参数，容忍 markdown 代码块和 JSON 后的多余内容"""
+        print(f"Debug: Parsing function arguments: {arguments_str}")
+        
+        # 尝试清理可能的格式问题
+        arguments_str = arguments_str.strip()
+        
+        # 移除可能的markdown代码块标记
+        if arguments_str.startswith('```json'):
+            arguments_str = arguments_str.replace('```json', '').replace('```', '').strip()
+        elif arguments_str.startswith('```'):
+            arguments_str = arguments_str.replace('```', '').strip()
+        
+        # 查找第一个有效的JSON对象
+        try:
+            # 首先尝试直接解析
+            function_args = json.loads(arguments_str)
+        except json.JSONDecodeError:
+            # 如果失败，尝试查找第一个完整的JSON对象
+            decoder = json.JSONDecoder()
+            try:
+                function_args, idx = decoder.raw_decode(arguments_str)
+                print(f"Debug: Found JSON object ending at position {idx}, total length: {len(arguments_str)}")
+                if idx < len(arguments_str.strip()):
+                    print(f"Debug: Extra data after JSON: '{arguments_str[idx:].strip()}'")
+            except json.JSONDecodeError:
+                # 最后的尝试：查找{}括起来的内容
+                json_match = re.search(r'\{.*\}', arguments_str, re.DOTALL)
+                if json_match:
+                    json_part = json_match.group(0)
+                    function_args = json.loads(json_part)
+                    print(f"Debug: Extracted JSON from regex: {json_part}")
+                else:
+                    raise
+        return function_args
+    
+    def _execute_tool_calls(self, calls: list) -> list:
+        """
+        并发执行工具调用：每个调用一个线程，全部同时开始，
+        每个调用从开始起有独立的 TOOL_CALL_TIMEOUT 超时（不会排队等待其他调用让出线程）。
+        
+        Args:
+            calls: [(原始位置, 函数名, 参数)] 列表
+        
+        Returns:
+            [(原始位置, 结果字典)]，结果字典带有 elapsed_ms
+        """
+        if not calls:
+            return []
+        
+        def run(function_name, function_args):
+            start = time.perf_counter()
+            try:
+                result = AVAILABLE_FUNCTIONS[function_name]["function"](**function_args)
+                entry = {"name": function_name, "result": result}
+            except Exception as e:
+                entry = {"name": function_name, "error": f"函数调用错误: {e}"}
+            entry["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            return entry
+        
+        # 线程数等于调用数：超时的调用仍占着线程，限制线程数会让排队的调用分不到时间
+        pool = ThreadPoolExecutor(max_workers=len(calls), thread_name_prefix="tool-call")
+        try:
+            futures = [(position, name, pool.submit(run, name, args)) for position, name, args in calls]
+            deadline = time.perf_counter() + TOOL_CALL_TIMEOUT
+            results = []
+            for position, function_name, future in futures:
+                try:
+                    results.append((position, future.result(timeout=max(deadline - time.perf_counter(), 0))))
+                except FuturesTimeoutError:
+                    print(f"Tool call {function_name} timed out after {TOOL_CALL_TIMEOUT}s")
+                    results.append((position, {
+                        "name": function_name,
+                        "error": f"函数调用超时（{TOOL_CALL_TIMEOUT}秒）",
+                        "elapsed_ms": round(TOOL_CALL_TIMEOUT * 1000, 1)
+                    }))
+            for position, function_name, future in futures:
+                if not future.done():
+                    future.cancel()
+            return results
+        finally:
+            # 超时的调用留在后台线程中结束，不阻塞本轮回复
+            pool.shutdown(wait=False)
+    
+    def _tool_definitions(self, use_functions: bool):
+        """AVAILABLE_FUNCTIONS 转换为接口的 tools 参数，不使用函数时返回 None"""
+        if not (use_functions and AVAILABLE_FUNCTIONS):
+            print("Debug: No functions available or function calling disabled")
+            return None
+        functions = []
+        for func_name, func_config in AVAILABLE_FUNCTIONS.items():
+            functions.append({
+                "type": "function",
+                "function": {
+                    "name": func_name,
+                    "description": func_config["description"],
+                    "parameters": func_config["parameters"]
+                }
+            })
+        print(f"Debug: Using {len(functions)} functions: {[f['function']['name'] for f in functions]}")
+        return functions
+    
+    def _run_tool_calls(self, tool_calls: list) -> list:
+        """
+        解析并执行模型返回的工具调用。
+        
+        Args:
+            tool_calls: [(函数名, 参数JSON字符串)] 列表
+        
+        Returns:
+            与 tool_calls 顺序一致的结果列表
+        """
+        # 先逐个解析参数，参数有误的调用直接记录错误
+        function_results = [None] * len(tool_calls)
+        pending = []
+        for position, (function_name, arguments_str) in enumerate(tool_calls):
+            try:
+                function_args = self._parse_tool_arguments(arguments_str)
+            except json.JSONDecodeError as e:
+                print(f"JSON decode error for function {function_name}: {e}")
+                print(f"Raw arguments: {arguments_str}")
+                print(f"Error position: line {e.lineno}, column {e.colno}")
+                function_results[position] = {
+                    "name": function_name,
+                    "error": f"参数解析错误: {e}"
+                }
+                continue
+            except Exception as e:
+                print(f"Unexpected error parsing function arguments: {e}")
+                function_results[position] = {
+                    "name": function_name,
+                    "error": f"参数解析错误: {e}"
+                }
+                continue
+            
+            if function_name in AVAILABLE_FUNCTIONS:
+                pending.append((position, function_name, function_args))
+            else:
+                function_results[position] = {
+                    "name": function_name,
+                    "error": f"未知函数: {function_name}"
+                }
+        
+        # 互不依赖的工具调用并发执行，结果按原始顺序返回
+        for position, result in self._execute_tool_calls(pending):
+            function_results[position] = result
+        return function_results
     
     def call_qwen_via_dashscope(self, messages: list, use_functions: bool = True) -> dict:
         """调用Qwen模型生成回答且带有额外 function calling"""
         if not API_KEY:
             raise ValueError("API_KEY_POINT 未在环境变量中设置")
         
-        client = OpenAI(api_key=API_KEY, base_url=DASHSCOPE_BASE_URL)
-        
-        # 过滤和转换消息角色，确保API兼容性
-        filtered_messages = []
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            # 将非标准角色映射为assistant
-            if role == "inquiry_assistant":
-                role = "assistant"
-            
-            # 只保留API支持的角色
-            if role in ["system", "assistant", "user", "tool", "function"]:
-                filtered_messages.append({"role": role, "content": content})
-        
         try:
             # 准备函数定义
-            functions = None
-            if use_functions and AVAILABLE_FUNCTIONS:
-                functions = []
-                for func_name, func_config in AVAILABLE_FUNCTIONS.items():
-                    functions.append({
-                        "type": "function",
-                        "function": {
-                            "name": func_name,
-                            "description": func_config["description"],
-                            "parameters": func_config["parameters"]
-                        }
-                    })
-                print(f"Debug: Using {len(functions)} functions: {[f['function']['name'] for f in functions]}")
-            else:
-                print("Debug: No functions available or function calling disabled")
+            functions = self._tool_definitions(use_functions)
             
-            # 调用API
+            # 调用API（共享连接池，角色过滤在 llm_client 中完成）
             if functions:
-                completion = client.chat.completions.create(
+                completion = chat_completion(
+                    messages,
+                    API_KEY,
                     model=QWEN_MODEL,
-                    messages=filtered_messages,
+                    caller="agent",
                     tools=functions,
                     tool_choice="auto"
                 )
             else:
-                completion = client.chat.completions.create(
-                    model=QWEN_MODEL,
-                    messages=filtered_messages
-                )
+                completion = chat_completion(messages, API_KEY, model=QWEN_MODEL, caller="agent")
             
             response_message = completion.choices[0].message
             
             # 处理函数调用
             if hasattr(response_message, 'tool_calls') and response_message.tool_calls:
-                tool_calls = response_message.tool_calls
-                function_results = []
-                
-                for tool_call in tool_calls:
-                    function_name = tool_call.function.name
-                    
-                    try:
-                        # 添加JSON解析的错误处理
-                        arguments_str = tool_call.function.arguments
-                        print(f"Debug: Parsing function arguments: {arguments_str}")
-                        
-                        # 尝试清理可能的格式问题
-                        arguments_str = arguments_str.strip()
-                        
-                        # 移除可能的markdown代码块标记
-                        if arguments_str.startswith('```json'):
-                            arguments_str = arguments_str.replace('```json', '').replace('```', '').strip()
-                        elif arguments_str.startswith('```'):
-                            arguments_str = arguments_str.replace('```', '').strip()
-                        
-                        # 查找第一个有效的JSON对象
-                        try:
-                            # 首先尝试直接解析
-                            function_args = json.loads(arguments_str)
-                        except json.JSONDecodeError:
-                            # 如果失败，尝试查找第一个完整的JSON对象
-                            decoder = json.JSONDecoder()
-                            try:
-                                function_args, idx = decoder.raw_decode(arguments_str)
-                                print(f"Debug: Found JSON object ending at position {idx}, total length: {len(arguments_str)}")
-                                if idx < len(arguments_str.strip()):
-                                    print(f"Debug: Extra data after JSON: '{arguments_str[idx:].strip()}'")
-                            except json.JSONDecodeError:
-                                # 最后的尝试：查找{}括起来的内容
-                                json_match = re.search(r'\{.*\}', arguments_str, re.DOTALL)
-                                if json_match:
-                                    json_part = json_match.group(0)
-                                    function_args = json.loads(json_part)
-                                    print(f"Debug: Extracted JSON from regex: {json_part}")
-                                else:
-                                    raise
-                        
-                    except json.JSONDecodeError as e:
-                        print(f"JSON decode error for function {function_name}: {e}")
-                        print(f"Raw arguments: {tool_call.function.arguments}")
-                        print(f"Error position: line {e.lineno}, column {e.colno}")
-                        function_results.append({
-                            "name": function_name,
-                            "error": f"参数解析错误: {e}"
-                        })
-                        continue
-                    except Exception as e:
-                        print(f"Unexpected error parsing function arguments: {e}")
-                        function_results.append({
-                            "name": function_name,
-                            "error": f"参数解析错误: {e}"
-                        })
-                        continue
-                    
-                    if function_name in AVAILABLE_FUNCTIONS:
-                        func = AVAILABLE_FUNCTIONS[function_name]["function"]
-                        try:
-                            result = func(**function_args)
-                            function_results.append({
-                                "name": function_name,
-                                "result": result
-                            })
-                        except Exception as e:
-                            function_results.append({
-                                "name": function_name,
-                                "error": f"函数调用错误: {e}"
-                            })
-                    else:
-                        function_results.append({
-                            "name": function_name,
-                            "error": f"未知函数: {function_name}"
-                        })
+                function_results = self._run_tool_calls(
+                    [(tool_call.function.name, tool_call.function.arguments) for tool_call in response_message.tool_calls]
+                )
                 
                 return {
                     "type": "function_call",
@@ -296,14 +464,7 @@ class QrentAgent:
     
     def generate_prompt(self, query: str, vector_context: str) -> str:
         """Generate prompt for AI model"""
-        # 检测用户查询语言并设置相应的提示词
-        def contains_chinese(text):
-            """检测文本是否包含中文字符"""
-            for char in text:
-                if '\u4e00' <= char <= '\u9fff':
-                    return True
-            return False
-        
+        # 检测用户查询语言，角色说明和回答要求在对应语言的系统提示中
         is_chinese = contains_chinese(query)
         
         # 格式化问卷数据和更新后的需求数据
@@ -337,8 +498,6 @@ class QrentAgent:
         if is_chinese:
             # 中文提示词
             prompt = f"""
-你是一名专业的租房中介助手，根据公司知识库信息为用户提供租房建议。请仔细阅读知识库内容、用户问卷信息、需求分析师的评估结果、对话历史和用户当前问题，然后提供专业的租房建议。
-
 # 知识库上下文
 
 {vector_context}
@@ -349,28 +508,13 @@ class QrentAgent:
 
 {inquiry_context}
 
-# 对话历史
-
-{self.history}
-
 # 用户当前问题
 
 {query}
-
-# 要求
-- 请用中文回答
-- 结合用户问卷信息和需求分析师的评估结果提供建议
-- 根据知识库信息提供具体的租房建议
-- 包含具体的地区、价格、房型等信息
-- 如果信息不足，请询问用户更多细节
-- 保持专业、友好的语调
-- 充分考虑用户的预算、房型偏好和特殊需求
 """
         else:
             # 英文提示词
             prompt = f"""
-You are a professional rental assistant. Based on the knowledge base information, provide rental suggestions for users.
-
 # Knowledge Base Context
 
 {vector_context}
@@ -381,75 +525,97 @@ You are a professional rental assistant. Based on the knowledge base information
 
 {inquiry_context}
 
-# Conversation History
-
-{self.history}
-
 # Current User Query
 
 {query}
-
-# Requirements
-- Please respond in user's language
-- Provide recommendations based on user questionnaire and requirement analyst assessment
-- Provide specific rental recommendations based on the knowledge base
-- Include specific areas, prices, property types, etc.
-- If information is insufficient, ask for more details from the user
-- Maintain a professional and friendly tone
-- Consider user's budget, room type preferences, and special requirements
 """
         
         return prompt
     
+    def _build_messages(self, query: str, chunks: list) -> list:
+        """
+        在 token 预算内构建首次调用的消息：系统提示（含早期对话摘要）、最近的对话历史（只出现一次，
+        超出预算时淘汰最早的轮次）和带检索上下文的用户提示（放不下的低分分块被丢弃）
+        """
+        system_content = AGENT_SYSTEM_PROMPTS["chinese" if contains_chinese(query) else "english"]
+
+        summary, recent_history = self.memory.context(self.history)
+        if summary:
+            system_content += f"\n\n## Summary of Earlier Conversation:\n{summary}"
+
+        messages, stats = build_messages(
+            system_content,
+            recent_history,
+            lambda context: self.generate_prompt(query, context),
+            chunks
+        )
+        self.last_prompt_stats = stats
+        print(
+            f"Prompt tokens: {stats['prompt_tokens']}/{stats['budget']} "
+            f"(history kept {stats['history_kept']}, evicted {stats['history_evicted']}; "
+            f"chunks kept {stats['chunks_kept']}, dropped {stats['chunks_dropped']})"
+        )
+        return messages
+    
+    def _summarize_function_results(self, function_results: list) -> str:
+        """把工具调用结果整理为文字摘要，作为第二次调用的上下文"""
+        function_summary = "基于数据库查询结果：\n\n"
+        for func_result in function_results:
+            if "error" in func_result:
+                function_summary += f"❌ {func_result['name']}: {func_result['error']}\n"
+            else:
+                result = func_result["result"]
+                if result.get("success"):
+                    function_summary += f"✅ {func_result['name']} 查询成功\n"
+                    if "analysis_results" in result:
+                        # 格式化区域分析结果，失败的区域只列出错误，不参与统计
+                        analysis_results = result["analysis_results"]
+                        succeeded = [area for area, analysis in analysis_results.items() if "error" not in analysis]
+                        for area in succeeded:
+                            function_summary += self._format_region_analysis(f"{area.upper()}区域", analysis_results[area])
+                        if len(succeeded) > 1 and result.get("overall"):
+                            function_summary += self._format_region_analysis("所有成功区域合计", result["overall"])
+                        failed = result.get("failed_regions", [area for area in analysis_results if area not in succeeded])
+                        for area in failed:
+                            error = analysis_results.get(area, {}).get("error", "查询失败")
+                            function_summary += f"\n⚠️ {area.upper()}区域查询失败: {error}\n"
+                    elif "properties" in result:
+                        # 格式化房源搜索结果  
+                        function_summary += f"找到 {result['count']} 套房源:\n"
+                        frame = PropertyFrame(result["properties"])
+                        if frame.prices().size:
+                            prices = frame.price_summary()
+                            function_summary += f"  租金 {prices['min_price']:.0f}-{prices['max_price']:.0f}AUD/周, 中位数 {prices['median_price']:.0f}AUD/周\n"
+                        for prop in result["properties"][:5]:  # 只显示前5个
+                            function_summary += f"  - {prop['addressLine1']} {prop['addressLine2']}, {prop['bedroomCount']}室{prop['bathroomCount']}卫, {prop['pricePerWeek']}AUD/周\n"
+                else:
+                    function_summary += f"❌ {func_result['name']}: {result.get('error', '查询失败')}\n"
+        return function_summary
+    
+    def _format_region_analysis(self, title: str, analysis: dict) -> str:
+        """格式化单个区域（或合计）的分析结果"""
+        text = f"\n📍 {title}:\n"
+        text += f"  总房源: {analysis.get('total_properties', 0)}套"
+        text += "（已达查询上限，实际房源更多）\n" if analysis.get("truncated") else "\n"
+        for room_type, stats in analysis.get("room_types", {}).items():
+            text += f"  {room_type}: {stats.get('count', 0)}套, 平均租金{stats.get('avg_price')}AUD/周\n"
+        return text
+    
+    def _followup_messages(self, messages: list, function_summary: str) -> list:
+        """工具调用之后生成最终回答的消息"""
+        return messages + [
+            {"role": "assistant", "content": function_summary},
+            {"role": "user", "content": "请根据上述数据库查询结果，为用户提供专业的租房建议和推荐。"}
+        ]
+    
     def process_query(self, query: str, top_k: int = 5, use_functions: bool = True) -> dict:
         """Process user query and return result"""
         try:
             # Vector retrieval
-            vector_context, ids = self.retrieve_vector_context(query, top_k)
-            
-            # Build message list
-            system_content = """You are a helpful rental assistant with access to real estate database functions.
-
-## Available Functions:
-1. **search_properties_from_questionnaire**: Use this when you have questionnaire data from the user. This function accepts the complete questionnaire data structure and automatically handles parameter conversion.
-
-2. **search_properties**: Use this for direct parameter searches when you don't have complete questionnaire data.
-
-3. **analyze_properties_by_region_from_questionnaire**: Use this for regional analysis when you have questionnaire data.
-
-4. **analyze_properties_by_region**: Use this for regional analysis with direct parameters.
-
-## Function Usage Guidelines:
-- **PRIORITIZE questionnaire-based functions** when questionnaire data or updated requirements are available
-- When calling questionnaire-based functions, pass the COMPLETE questionnaire data object, not individual parameters
-- The questionnaire data structure includes: budget_min, budget_max, room_type, commute_time, includes_bills, includes_furniture, total_budget, consider_sharing, move_in_date, lease_duration, accept_premium, accept_small_room
-- Use updated requirements from inquiry agent when available - they take priority over original questionnaire data
-- Always consider the user's language preference and context when making recommendations
-
-## Example Function Call:
-When you have questionnaire data, call:
-search_properties_from_questionnaire(questionnaire_data={...complete questionnaire object...})
-
-NOT:
-search_properties(min_price=660, max_price=860, ...)"""
-
-            messages = [
-                {"role": "system", "content": system_content}
-            ]
-            
-            # Add history (filter and convert roles for API compatibility)
-            for role, content in self.history:
-                # 将非标准角色映射为assistant
-                if role == "inquiry_assistant":
-                    role = "assistant"
-                
-                # 只保留API支持的角色
-                if role in ["system", "assistant", "user", "tool", "function"]:
-                    messages.append({"role": role, "content": content})
-            
-            # Generate prompt
-            prompt = self.generate_prompt(query, vector_context)
-            messages.append({"role": "user", "content": prompt})
+            chunks, ids = self.retrieve_vector_chunks(query, top_k)
+            messages = self._build_messages(query, chunks)
+            # 只返回放进提示词的分块，与模型实际看到的上下文一致
+            vector_context = CHUNK_SEPARATOR.join(self.last_prompt_stats["kept_chunks"])
             
             # Call AI model
             response = self.call_qwen_via_dashscope(messages, use_functions)
@@ -463,34 +629,10 @@ search_properties(min_price=660, max_price=860, ...)"""
                 function_results = response["function_results"]
                 
                 # 构建包含函数结果的新消息
-                function_summary = "基于数据库查询结果：\n\n"
-                for func_result in function_results:
-                    if "error" in func_result:
-                        function_summary += f"❌ {func_result['name']}: {func_result['error']}\n"
-                    else:
-                        result = func_result["result"]
-                        if result.get("success"):
-                            function_summary += f"✅ {func_result['name']} 查询成功\n"
-                            if "analysis_results" in result:
-                                # 格式化区域分析结果
-                                for area, analysis in result["analysis_results"].items():
-                                    function_summary += f"\n📍 {area.upper()}区域:\n"
-                                    function_summary += f"  总房源: {analysis['total_properties']}套\n"
-                                    for room_type, stats in analysis['room_types'].items():
-                                        function_summary += f"  {room_type}: {stats['count']}套, 平均租金{stats['avg_price']}AUD/周\n"
-                            elif "properties" in result:
-                                # 格式化房源搜索结果  
-                                function_summary += f"找到 {result['count']} 套房源:\n"
-                                for prop in result["properties"][:5]:  # 只显示前5个
-                                    function_summary += f"  - {prop['addressLine1']} {prop['addressLine2']}, {prop['bedroomCount']}室{prop['bathroomCount']}卫, {prop['pricePerWeek']}AUD/周\n"
-                        else:
-                            function_summary += f"❌ {func_result['name']}: {result.get('error', '查询失败')}\n"
+                function_summary = self._summarize_function_results(function_results)
                 
                 # 重新调用AI生成基于函数结果的回答
-                final_messages = messages + [
-                    {"role": "assistant", "content": function_summary},
-                    {"role": "user", "content": "请根据上述数据库查询结果，为用户提供专业的租房建议和推荐。"}
-                ]
+                final_messages = self._followup_messages(messages, function_summary)
                 
                 final_response = self.call_qwen_via_dashscope(final_messages, use_functions=False)
                 final_answer = final_response["content"]
@@ -502,13 +644,15 @@ search_properties(min_price=660, max_price=860, ...)"""
             # Update history
             self.history.append(("user", query))
             self.history.append(("assistant", final_answer))
+            self.memory.schedule_update(self.history)
             
             return {
                 "query": query,
                 "vector_context": vector_context,
                 "answer": final_answer,
                 "function_results": function_results,
-                "history": self.history
+                "history": self.history,
+                "prompt_tokens": self.last_prompt_stats["prompt_tokens"]
             }
             
         except Exception as e:
@@ -531,9 +675,108 @@ search_properties(min_price=660, max_price=860, ...)"""
                 "error": str(e)
             }
     
+    def _stream_qwen(self, messages: list, use_functions: bool = True):
+        """
+        流式调用Qwen：逐段产出 ("token", 文本片段)，
+        结束时产出 ("tool_calls", [(函数名, 参数JSON字符串)])，没有工具调用时为空列表
+        """
+        if not API_KEY:
+            raise ValueError("API_KEY_POINT 未在环境变量中设置")
+        
+        functions = self._tool_definitions(use_functions)
+        kwargs = {"tools": functions, "tool_choice": "auto"} if functions else {}
+        # 工具调用的名称和参数分散在多个 chunk 中，按 index 拼接
+        tool_calls = {}
+        for chunk in stream_chat_completion(messages, API_KEY, model=QWEN_MODEL, caller="agent", **kwargs):
+            if not chunk.choices:
+                # 最后一个 chunk 只带 usage
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                yield "token", delta.content
+            for call in delta.tool_calls or []:
+                entry = tool_calls.setdefault(call.index, {"name": "", "arguments": ""})
+                if call.function is None:
+                    continue
+                if call.function.name and not entry["name"]:
+                    entry["name"] = call.function.name
+                if call.function.arguments:
+                    entry["arguments"] += call.function.arguments
+        yield "tool_calls", [(entry["name"], entry["arguments"]) for _, entry in sorted(tool_calls.items())]
+    
+    def process_query_stream(self, query: str, top_k: int = 5, use_functions: bool = True):
+        """
+        process_query 的流式版本，逐步产出事件字典：
+        - {"type": "token", "content": 文本片段}：回答的增量
+        - {"type": "function_results", "function_results": [...]}：工具调用完成，
+          之后的 token 属于基于查询结果生成的最终回答（之前的片段不计入最终回答）
+        - {"type": "done", "result": {...}}：结束，result 与 process_query 的返回值相同
+        """
+        vector_context = ""
+        function_results = []
+        answer_parts = []
+        try:
+            # Vector retrieval
+            chunks, ids = self.retrieve_vector_chunks(query, top_k)
+            messages = self._build_messages(query, chunks)
+            # 只返回放进提示词的分块，与模型实际看到的上下文一致
+            vector_context = CHUNK_SEPARATOR.join(self.last_prompt_stats["kept_chunks"])
+            
+            tool_calls = []
+            for kind, value in self._stream_qwen(messages, use_functions):
+                if kind == "token":
+                    answer_parts.append(value)
+                    yield {"type": "token", "content": value}
+                else:
+                    tool_calls = value
+            
+            if tool_calls:
+                function_results = self._run_tool_calls(tool_calls)
+                yield {"type": "function_results", "function_results": function_results}
+                
+                # 基于函数结果流式生成最终回答
+                answer_parts = []
+                final_messages = self._followup_messages(messages, self._summarize_function_results(function_results))
+                for kind, value in self._stream_qwen(final_messages, use_functions=False):
+                    if kind == "token":
+                        answer_parts.append(value)
+                        yield {"type": "token", "content": value}
+            
+            final_answer = "".join(answer_parts)
+            self.history.append(("user", query))
+            self.history.append(("assistant", final_answer))
+            self.memory.schedule_update(self.history)
+            yield {"type": "done", "result": {
+                "query": query,
+                "vector_context": vector_context,
+                "answer": final_answer,
+                "function_results": function_results,
+                "history": self.history,
+                "prompt_tokens": self.last_prompt_stats["prompt_tokens"]
+            }}
+            
+        except Exception as e:
+            print(f"Error processing streaming query: {e}")
+            error_message = "抱歉，处理您的查询时遇到了问题。请尝试简化您的问题或稍后重试。"
+            self.history.append(("user", query))
+            self.history.append(("assistant", error_message))
+            yield {"type": "done", "result": {
+                "query": query,
+                "vector_context": vector_context,
+                "answer": error_message,
+                "function_results": function_results,
+                "history": self.history,
+                "error": str(e)
+            }}
+    
     def clear_history(self):
         """Clear conversation history"""
         self.history = []
+        self.memory.clear()
+    
+    def drop_last_turn(self):
+        """移除最后一轮对话（"重新生成"使用），返回该轮的用户问题；摘要只覆盖更早的轮次，不受影响"""
+        return drop_last_turn(self.history)
     
     def get_history(self):
         """Get conversation history"""
@@ -551,6 +794,11 @@ def get_agent():
     return agent
 
 
+def create_agent() -> QrentAgent:
+    """创建独立的QrentAgent实例（每个会话一个，模型和向量库在进程内共享）"""
+    return QrentAgent()
+
+
 if __name__ == "__main__":
     # 测试代码
     try:
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+索引构建阶段的批量嵌入
+按文本长度排序后分批以减少 padding，分词在单独的预取线程中提前进行，与模型推理重叠，
+并统计吞吐量 (chunks/sec)。
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from embedding_cache import CachedEmbeddings, cache_key
+
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+# 提前分词的批数（沿用原环境变量名）
+EMBED_TOKENIZER_WORKERS = int(os.getenv("EMBED_TOKENIZER_WORKERS", "2"))
+# 每隔多少批打印一次进度
+PROGRESS_EVERY = 10
+
+
+def _sentence_transformer(embeddings: Any):
+    """取出底层的 SentenceTransformer；不支持分词/前向分离时返回 None"""
+    client = getattr(embeddings, "client", None)
+    if client is not None and hasattr(client, "tokenize") and hasattr(client, "forward"):
+        return client
+    return None
+
+
+def _encode_overlapped(model, batches: List[List[str]], normalize: bool, prefetch: int, on_batch):
+    """
+    分词在单个预取线程中提前进行，主线程只做模型前向。
+    HF fast tokenizer 在调用时会修改截断/padding 状态，多线程共用同一个分词器会偶发
+    "Already borrowed"，因此所有分词都在同一个线程中串行执行，最多提前 prefetch 批。
+    """
+    import torch
+    from sentence_transformers.util import batch_to_device
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tokenize") as pool:
+        pending = deque()
+        next_batch = 0
+        # 保证推理时总有分词好的批次可用
+        while next_batch < len(batches) and len(pending) <= prefetch:
+            pending.append(pool.submit(model.tokenize, batches[next_batch]))
+            next_batch += 1
+
+        while pending:
+            features = pending.popleft().result()
+            if next_batch < len(batches):
+                pending.append(pool.submit(model.tokenize, batches[next_batch]))
+                next_batch += 1
+
+            features = batch_to_device(features, model.device)
+            with torch.inference_mode():
+                output = model.forward(features)["sentence_embedding"]
+                if normalize:
+                    output = torch.nn.functional.normalize(output, p=2, dim=1)
+            on_batch(output.float().cpu().numpy())
+
+
+def embed_texts_batched(
+    embeddings: Any,
+    texts: List[str],
+    batch_size: int = EMBED_BATCH_SIZE,
+    tokenizer_workers: int = EMBED_TOKENIZER_WORKERS
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    批量生成嵌入。
+
+    Args:
+        embeddings: langchain Embeddings；若为 CachedEmbeddings，会先查缓存并回写
+        texts: 待嵌入的文本
+        batch_size: 每批文本数
+        tokenizer_workers: 提前分词的批数（分词始终在单个线程中进行）
+
+    Returns:
+        (与 texts 顺序一致的 float32 矩阵, 统计信息)
+    """
+    start = time.perf_counter()
+    stats: Dict[str, Any] = {"chunks": len(texts), "cached": 0, "embedded": 0, "batches": 0}
+    results: List[Any] = [None] * len(texts)
+
+    cache = None
+    underlying = embeddings
+    if isinstance(embeddings, CachedEmbeddings):
+        cache = embeddings.cache
+        underlying = embeddings.underlying
+        keys = [cache_key(embeddings.model_id, text) for text in texts]
+        for i, vector in enumerate(cache.get_many(keys)):
+            if vector is not None:
+                results[i] = vector
+        stats["cached"] = sum(vector is not None for vector in results)
+
+    # 按长度降序排序，同一批内长度接近，padding 更少
+    missing = sorted((i for i, vector in enumerate(results) if vector is None), key=lambda i: len(texts[i]), reverse=True)
+    order = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    batches = [[texts[i] for i in batch] for batch in order]
+
+    def on_batch(vectors):
+        batch = order[stats["batches"]]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for i, vector in zip(batch, vectors):
+            results[i] = vector
+        if cache is not None:
+            cache.put_many([keys[i] for i in batch], vectors)
+        stats["batches"] += 1
+        stats["embedded"] += len(batch)
+        if stats["batches"] % PROGRESS_EVERY == 0 or stats["batches"] == len(order):
+            elapsed = time.perf_counter() - start
+            print(f"Embedded {stats['embedded']}/{len(missing)} chunks ({stats['embedded'] / max(elapsed, 1e-9):.1f} chunks/sec)")
+
+    model = _sentence_transformer(underlying)
+    if model is not None and batches:
+        normalize = bool(getattr(underlying, "encode_kwargs", {}).get("normalize_embeddings", False))
+        _encode_overlapped(model, batches, normalize, tokenizer_workers, on_batch)
+    else:
+        for batch in batches:
+            on_batch(underlying.embed_documents(batch))
+
+    if cache is not None:
+        cache.flush()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["chunks_per_sec"] = stats["embedded"] / stats["seconds"] if stats["embedded"] else 0.0
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), stats
+    return np.vstack(results).astype(np.float32), stats
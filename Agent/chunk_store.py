@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+内存映射的分块存储，替代 FAISS 的 pickle docstore (index.pkl)
+索引目录下的文件：
+- chunks.json          版本和分块数
+- chunks.text.bin      所有分块正文按 UTF-8 依次拼接
+- chunks.meta.bin      每个分块的 metadata JSON 依次拼接
+- chunks.offsets.npy   int64 (n+1, 2)，第 i 个分块的正文/metadata 在 blob 中的起止位置
+- chunks.ids.npy       按 FAISS 位置排列的分块ID (S64)
+- chunks.sorted_ids.npy / chunks.id_order.npy  排序后的ID及其位置，用于二分查找
+
+所有文件都以 mmap 方式打开，只有命中 top-k 的分块才会被读取和解码，
+加载时间和常驻内存与语料规模无关，也不再需要 allow_dangerous_deserialization。
+
+转换旧索引：python chunk_store.py --index-dir ../database/faiss_index
+"""
+
+import os
+import sys
+import json
+import mmap
+import pickle
+import argparse
+from collections.abc import Mapping
+from typing import Iterator, List, Optional, Union
+
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+CHUNK_STORE_VERSION = 1
+HEADER_FILENAME = "chunks.json"
+TEXT_FILENAME = "chunks.text.bin"
+META_FILENAME = "chunks.meta.bin"
+OFFSETS_FILENAME = "chunks.offsets.npy"
+IDS_FILENAME = "chunks.ids.npy"
+SORTED_IDS_FILENAME = "chunks.sorted_ids.npy"
+ID_ORDER_FILENAME = "chunks.id_order.npy"
+INDEX_FILENAME = "index.faiss"
+LEGACY_DOCSTORE_FILENAME = "index.pkl"
+# 分块ID的最大字节数（sha256 十六进制为 64）
+ID_WIDTH = 64
+
+
+def has_chunk_store(index_dir: str) -> bool:
+    """索引目录中是否存在分块存储"""
+    return os.path.isfile(os.path.join(index_dir, HEADER_FILENAME))
+
+
+def _open_blob(path: str):
+    """以只读 mmap 打开 blob，空文件无法 mmap，直接返回空 bytes"""
+    if os.path.getsize(path) == 0:
+        return b""
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LazyIdMapping(Mapping):
+    """FAISS 位置 -> 分块ID，按需从 mmap 的ID数组中读取，代替 index_to_docstore_id 字典"""
+
+    def __init__(self, ids: np.ndarray):
+        self._ids = ids
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < len(self._ids):
+            raise KeyError(position)
+        return self._ids[position].decode("ascii")
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self._ids)))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class MmapDocstore(Docstore):
+    """只读的 mmap docstore，按ID二分查找位置后解码对应分块"""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, HEADER_FILENAME), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != CHUNK_STORE_VERSION:
+            raise ValueError(f"Unsupported chunk store version {header.get('version')} in {index_dir}")
+        self.count = header["count"]
+        self._text = _open_blob(os.path.join(index_dir, TEXT_FILENAME))
+        self._meta = _open_blob(os.path.join(index_dir, META_FILENAME))
+        self._offsets = np.load(os.path.join(index_dir, OFFSETS_FILENAME), mmap_mode="r")
+        self.ids = np.load(os.path.join(index_dir, IDS_FILENAME), mmap_mode="r")
+        self._sorted_ids = np.load(os.path.join(index_dir, SORTED_IDS_FILENAME), mmap_mode="r")
+        self._id_order = np.load(os.path.join(index_dir, ID_ORDER_FILENAME), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def position_of(self, chunk_id: str) -> Optional[int]:
+        """返回分块ID对应的 FAISS 位置，不存在时返回 None"""
+        key = chunk_id.encode("ascii", errors="replace")
+        i = int(np.searchsorted(self._sorted_ids, key))
+        if i < self.count and self._sorted_ids[i] == key:
+            return int(self._id_order[i])
+        return None
+
+    def get(self, position: int) -> Document:
+        """按 FAISS 位置读取分块"""
+        (text_start, meta_start), (text_end, meta_end) = self._offsets[position], self._offsets[position + 1]
+        return Document(
+            page_content=self._text[text_start:text_end].decode("utf-8"),
+            metadata=json.loads(self._meta[meta_start:meta_end].decode("utf-8"))
+        )
+
+    def search(self, search: str) -> Union[str, Document]:
+        position = self.position_of(search)
+        if position is None:
+            return f"ID {search} not found."
+        return self.get(position)
+
+    def delete(self, ids: List) -> None:
+        """只读存储：增量构建用 load_vector_store(..., mutable=True) 得到可修改的 InMemoryDocstore"""
+        raise ValueError(
+            "MmapDocstore is read-only; load the index with load_vector_store(..., mutable=True) "
+            "or rebuild it with rag.py"
+        )
+
+
+def write_chunk_store(index_dir: str, documents: List[Document], ids: List[str]) -> None:
+    """
+    按 FAISS 位置顺序写入分块存储。每个文件先写临时文件再原子替换，
+    chunks.json 最后写入。
+    """
+    if len(documents) != len(ids):
+        raise ValueError("documents and ids must have the same length")
+    os.makedirs(index_dir, exist_ok=True)
+
+    def target(name: str) -> str:
+        return os.path.join(index_dir, name)
+
+    offsets = np.zeros((len(documents) + 1, 2), dtype=np.int64)
+    with open(target(TEXT_FILENAME) + ".tmp", "wb") as text_file, open(target(META_FILENAME) + ".tmp", "wb") as meta_file:
+        for i, doc in enumerate(documents):
+            text = doc.page_content.encode("utf-8")
+            meta = json.dumps(doc.metadata, ensure_ascii=False, default=str).encode("utf-8")
+            text_file.write(text)
+            meta_file.write(meta)
+            offsets[i + 1] = (offsets[i, 0] + len(text), offsets[i, 1] + len(meta))
+
+    if any(len(cid) > ID_WIDTH for cid in ids):
+        raise ValueError(f"Chunk ids longer than {ID_WIDTH} bytes are not supported")
+    id_array = np.array([cid.encode("ascii") for cid in ids], dtype=f"S{ID_WIDTH}")
+    id_order = np.argsort(id_array, kind="stable").astype(np.int64)
+    arrays = {
+        OFFSETS_FILENAME: offsets,
+        IDS_FILENAME: id_array,
+        SORTED_IDS_FILENAME: id_array[id_order],
+        ID_ORDER_FILENAME: id_order
+    }
+    for name, array in arrays.items():
+        # np.save 会给文件名补 .npy，这里传入文件对象避免改名
+        with open(target(name) + ".tmp", "wb") as f:
+            np.save(f, array)
+
+    for name in [TEXT_FILENAME, META_FILENAME, *arrays]:
+        os.replace(target(name) + ".tmp", target(name))
+    tmp_header = target(HEADER_FILENAME) + ".tmp"
+    with open(tmp_header, "w", encoding="utf-8") as f:
+        json.dump({"version": CHUNK_STORE_VERSION, "count": len(documents)}, f)
+    os.replace(tmp_header, target(HEADER_FILENAME))
+
+
+def read_index(path: str, mmap_codes: bool = True):
+    """读取 FAISS 索引；只读加载时尽量 mmap 向量数据，当前 faiss 不支持时退回普通读取"""
+    flags = 0
+    if mmap_codes:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+    try:
+        return faiss.read_index(path, flags)
+    except RuntimeError:
+        return faiss.read_index(path)
+
+
+def save_vector_store(vector_store, index_dir: str) -> None:
+    """保存 FAISS 索引和分块存储，并删除旧的 index.pkl"""
+    os.makedirs(index_dir, exist_ok=True)
+    positions = range(vector_store.index.ntotal)
+    ids = [vector_store.index_to_docstore_id[i] for i in positions]
+    documents = [vector_store.docstore.search(cid) for cid in ids]
+
+    tmp_index = os.path.join(index_dir, INDEX_FILENAME + ".tmp")
+    faiss.write_index(vector_store.index, tmp_index)
+    write_chunk_store(index_dir, documents, ids)
+    os.replace(tmp_index, os.path.join(index_dir, INDEX_FILENAME))
+
+    legacy = os.path.join(index_dir, LEGACY_DOCSTORE_FILENAME)
+    if os.path.exists(legacy):
+        os.remove(legacy)
+
+
+def load_vector_store(index_dir: str, embeddings, mutable: bool = False):
+    """
+    加载向量库。
+
+    Args:
+        index_dir: 索引目录
+        embeddings: 查询时使用的 Embeddings
+        mutable: 为 True 时把分块读入 InMemoryDocstore，供增量构建修改；
+                 否则使用只读的 MmapDocstore
+
+    没有分块存储的旧索引退回到 pickle 格式加载。
+    """
+    from langchain_community.vectorstores import FAISS
+
+    if not has_chunk_store(index_dir):
+        print(f"No chunk store in {index_dir}, loading legacy pickle docstore")
+        return FAISS.load_local(
+            folder_path=index_dir,
+            embeddings=embeddings,
+            allow_dangerous_deserialization=True
+        )
+
+    index = read_index(os.path.join(index_dir, INDEX_FILENAME), mmap_codes=not mutable)
+    docstore = MmapDocstore(index_dir)
+    if docstore.count != index.ntotal:
+        raise ValueError(f"Chunk store has {docstore.count} chunks but the index has {index.ntotal} vectors")
+    index_to_docstore_id = LazyIdMapping(docstore.ids)
+    if mutable:
+        ids = [index_to_docstore_id[i] for i in range(docstore.count)]
+        index_to_docstore_id = dict(enumerate(ids))
+        docstore = InMemoryDocstore({cid: docstore.get(i) for i, cid in enumerate(ids)})
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id
+    )
+
+
+def convert_legacy(index_dir: str) -> int:
+    """把 index.pkl 转换为分块存储，返回分块数"""
+    with open(os.path.join(index_dir, LEGACY_DOCSTORE_FILENAME), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    ids = [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))]
+    documents: List[Document] = [docstore.search(cid) for cid in ids]
+    write_chunk_store(index_dir, documents, ids)
+    os.remove(os.path.join(index_dir, LEGACY_DOCSTORE_FILENAME))
+    return len(ids)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Convert a pickled FAISS docstore (index.pkl) to the mmap chunk store")
+    parser.add_argument("--index-dir", default="../database/faiss_index")
+    args = parser.parse_args()
+
+    if has_chunk_store(args.index_dir):
+        print(f"{args.index_dir} already uses the chunk store")
+        return 0
+    if not os.path.isfile(os.path.join(args.index_dir, LEGACY_DOCSTORE_FILENAME)):
+        print(f"No {LEGACY_DOCSTORE_FILENAME} found in {args.index_dir}")
+        return 1
+    count = convert_legacy(args.index_dir)
+    print(f"Converted {count} chunks in {args.index_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
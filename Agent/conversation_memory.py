@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+长对话的滚动摘要记忆
+最近 keep_turns 轮对话原文保留，更早的轮次增量地并入一份摘要（已有摘要 + 新滑出窗口的轮次 -> 新摘要）。
+摘要在每次回复完成后由后台线程生成，不占用回复的关键路径；摘要保存在 agent 实例上，随 streamlit 会话缓存。
+提示词只包含 摘要 + 最近几轮原文，长度不随对话轮数增长。
+
+历史列表仍由各 agent 持有（界面展示完整历史），记忆只记录其中已摘要的前缀长度；
+历史被清空或截断（例如"重新生成"移除最后一轮）时，记忆会自动发现并丢弃失效的摘要。
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from llm_client import chat
+
+CONVERSATION_KEEP_TURNS = int(os.getenv("CONVERSATION_KEEP_TURNS", "3"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "500"))
+# 并入摘要时每条消息最多保留的字符数（助手的长回答只需要要点）
+SUMMARY_MESSAGE_CHARS = 1500
+
+SUMMARY_SYSTEM_PROMPT = """你负责压缩一段租房咨询对话的早期内容。
+把【已有摘要】和【新的对话】合并成一份新的摘要：
+- 保留用户的需求和约束：预算、房型、目标学校、区域、通勤时间、入住时间、租期等，以最新的说法为准
+- 保留已经推荐、比较或排除的房源和区域及原因，以及尚未解决的问题
+- 省略寒暄和重复内容，不要编造对话中没有的信息
+- 使用对话所用的语言，分条列出，不超过 300 字"""
+
+ROLE_LABELS = {"user": "用户", "assistant": "助手", "inquiry_assistant": "需求分析师", "report_assistant": "报告助手"}
+
+# 所有会话共用的摘要线程
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="memory-summary")
+
+
+def drop_last_turn(history: List[Tuple[str, str]]) -> Optional[str]:
+    """移除历史中最后一轮对话（最后一条用户消息及其后的回复），返回该用户消息；没有用户消息时返回 None"""
+    for i in range(len(history) - 1, -1, -1):
+        if history[i][0] == "user":
+            query = history[i][1]
+            del history[i:]
+            return query
+    return None
+
+
+class ConversationMemory:
+    """
+    一个会话的滚动摘要。
+
+    Args:
+        api_key: DashScope 密钥
+        keep_turns: 原文保留的最近轮数
+        caller: llm_client 的统计分组名
+    """
+
+    def __init__(self, api_key: str, keep_turns: int = CONVERSATION_KEEP_TURNS, caller: str = "memory"):
+        self.api_key = api_key
+        self.keep_turns = keep_turns
+        self.caller = caller
+        self.summary = ""
+        # 历史中已并入摘要的消息数
+        self.summarized_count = 0
+        # 已摘要部分的最后一条消息，用于发现历史被清空或截断
+        self._boundary: Optional[Tuple[str, str]] = None
+        self._pending: Optional[Future] = None
+        self._lock = threading.Lock()
+
+    def _check(self, history: Sequence[Tuple[str, str]]) -> None:
+        """历史与已摘要的前缀不一致时丢弃摘要（调用方持有锁）"""
+        if self.summarized_count and (
+            self.summarized_count > len(history) or tuple(history[self.summarized_count - 1]) != self._boundary
+        ):
+            print("Conversation history changed, dropping stale summary")
+            self.summary = ""
+            self.summarized_count = 0
+            self._boundary = None
+
+    def context(self, history: Sequence[Tuple[str, str]]) -> Tuple[str, List[Tuple[str, str]]]:
+        """
+        提示词使用的记忆。
+
+        Returns:
+            (早期对话摘要, 尚未并入摘要的最近历史)
+        """
+        with self._lock:
+            self._check(history)
+            return self.summary, list(history[self.summarized_count:])
+
+    def schedule_update(self, history: Sequence[Tuple[str, str]]) -> Optional[Future]:
+        """
+        回复完成后调用：未摘要的历史超过 keep_turns 轮时，在后台把较早的轮次并入摘要。
+        已有摘要任务在运行时不重复提交，下一次回复后会继续追上。
+
+        Returns:
+            提交的后台任务，不需要更新时返回 None
+        """
+        snapshot = [tuple(message) for message in history]
+        with self._lock:
+            self._check(snapshot)
+            if self._pending is not None and not self._pending.done():
+                return None
+            end = self._fold_end(snapshot)
+            if end <= self.summarized_count:
+                return None
+            self._pending = _executor.submit(self._fold, snapshot, self.summarized_count, end, self.summary)
+            return self._pending
+
+    def _fold_end(self, history: Sequence[Tuple[str, str]]) -> int:
+        """并入摘要的截止位置：保留最近 keep_turns 轮，且截止位置落在某一轮的开头（用户消息）"""
+        end = len(history) - 2 * self.keep_turns
+        while 0 < end < len(history) and history[end][0] != "user":
+            end -= 1
+        return max(end, 0)
+
+    def _fold(self, history: List[Tuple[str, str]], start: int, end: int, summary: str) -> None:
+        """后台线程：生成新摘要，期间历史未被清空或截断时才替换"""
+        lines = []
+        for role, content in history[start:end]:
+            text = content if len(content) <= SUMMARY_MESSAGE_CHARS else content[:SUMMARY_MESSAGE_CHARS] + "..."
+            lines.append(f"{ROLE_LABELS.get(role, role)}：{text}")
+        messages = [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"【已有摘要】\n{summary or '无'}\n\n【新的对话】\n" + "\n\n".join(lines)}
+        ]
+        try:
+            new_summary = chat(
+                messages,
+                self.api_key,
+                caller=self.caller,
+                temperature=0.2,
+                max_tokens=SUMMARY_MAX_TOKENS
+            ).strip()
+        except Exception as e:
+            # 摘要失败时保持原状，最近历史仍由 prompt_builder 的预算兜底
+            print(f"Error summarizing conversation: {e}")
+            return
+        with self._lock:
+            if self.summarized_count != start or self.summary != summary:
+                # 期间摘要已被丢弃或更新
+                return
+            self.summary = new_summary
+            self.summarized_count = end
+            self._boundary = history[end - 1]
+        print(f"Conversation summary updated ({self.caller}): {end} messages folded, {len(new_summary)} chars")
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """等待正在运行的摘要任务完成（命令行和测试脚本使用）"""
+        pending = self._pending
+        if pending is not None:
+            pending.result(timeout)
+
+    def clear(self) -> None:
+        """清空摘要（历史被重置时调用）"""
+        with self._lock:
+            self.summary = ""
+            self.summarized_count = 0
+            self._boundary = None
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入模型推理后端
+- torch: 原始全精度 PyTorch 模型（默认）
+- int8:  对 Linear 层做 PyTorch 动态 int8 量化，仅支持 CPU
+- onnx:  sentence-transformers 的 ONNX Runtime 后端（首次加载时导出计算图）
+通过环境变量 EMBEDDING_BACKEND 选择。
+
+一致性检查：python embedding_backends.py --backend int8，或在 CI / 测试中调用 run_parity_check()，
+用知识库文档分块对比各后端与 torch 嵌入的余弦相似度。
+onnx 后端需要 sentence-transformers>=3.2 和 optimum[onnxruntime]（pip install -r requirements-onnx.txt）。
+"""
+
+import os
+import sys
+import argparse
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+BACKENDS = ("torch", "int8", "onnx")
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents")
+# 量化后端与 torch 嵌入的最低余弦相似度
+PARITY_THRESHOLD = 0.98
+# 以每个分块为查询，量化后端的 top-k 近邻与 torch 结果的平均重合比例下限
+PARITY_TOP_K = 5
+TOP_K_AGREEMENT_THRESHOLD = 0.9
+
+
+def backend_model_id(model_id: str, backend: str = EMBEDDING_BACKEND) -> str:
+    """缓存和 manifest 使用的模型ID，不同后端的向量互不混用"""
+    return model_id if backend == "torch" else f"{model_id}#{backend}"
+
+
+def create_embeddings(model_path: str, backend: str = EMBEDDING_BACKEND, device: str = "cpu"):
+    """
+    按后端创建 HuggingFaceEmbeddings。
+
+    Args:
+        model_path: 本地模型目录或 HuggingFace 模型ID
+        backend: torch / int8 / onnx
+        device: 推理设备
+    """
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == "onnx":
+        # sentence-transformers>=3.2 支持 backend="onnx"，需要安装 optimum[onnxruntime]
+        try:
+            import optimum.onnxruntime  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "The onnx embedding backend requires optimum[onnxruntime]: pip install -r requirements-onnx.txt"
+            ) from e
+        return HuggingFaceEmbeddings(
+            model_name=model_path,
+            model_kwargs={"device": device, "backend": "onnx"}
+        )
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=model_path,
+        model_kwargs={"device": device}
+    )
+    if backend == "int8":
+        if device != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        import torch
+
+        transformer = embeddings.client[0]
+        transformer.auto_model = torch.ao.quantization.quantize_dynamic(
+            transformer.auto_model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return embeddings
+
+
+def _corpus_texts(limit: Optional[int] = None) -> List[str]:
+    """读取 documents 目录下随仓库发布的知识库，按构建时的参数分块"""
+    from ingest import iter_source_files, load_files_parallel
+
+    chunks_by_file, _ = load_files_parallel(iter_source_files([DOCUMENTS_DIR]), chunk_size=1000, chunk_overlap=200)
+    texts = [chunk.page_content for chunks in chunks_by_file.values() for chunk in chunks]
+    return texts[:limit] if limit else texts
+
+
+def check_parity(
+    model_path: str,
+    backend: str,
+    texts: Optional[List[str]] = None,
+    threshold: float = PARITY_THRESHOLD,
+    device: str = "cpu",
+    top_k: int = PARITY_TOP_K,
+    top_k_threshold: float = TOP_K_AGREEMENT_THRESHOLD
+) -> Dict[str, Any]:
+    """
+    对比指定后端与 torch 后端的嵌入：逐个分块的余弦相似度，
+    以及以每个分块为查询时两者 top-k 近邻（不含自身）的平均重合比例。
+
+    Returns:
+        包含 min/mean 余弦相似度、top-k 重合比例、样本数和是否通过的字典
+    """
+    if texts is None:
+        texts = _corpus_texts()
+    reference = np.asarray(create_embeddings(model_path, "torch", device).embed_documents(texts), dtype=np.float32)
+    candidate = np.asarray(create_embeddings(model_path, backend, device).embed_documents(texts), dtype=np.float32)
+
+    reference /= np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate /= np.linalg.norm(candidate, axis=1, keepdims=True)
+    cosine = np.sum(reference * candidate, axis=1)
+
+    k = min(top_k, len(texts) - 1)
+    agreement = 1.0
+    if k > 0:
+        def neighbours(vectors: np.ndarray) -> np.ndarray:
+            scores = vectors @ vectors.T
+            np.fill_diagonal(scores, -np.inf)
+            return np.argsort(-scores, axis=1)[:, :k]
+
+        agreement = float(np.mean([
+            len(set(expected) & set(actual)) / k
+            for expected, actual in zip(neighbours(reference), neighbours(candidate))
+        ]))
+    return {
+        "backend": backend,
+        "samples": len(texts),
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "threshold": threshold,
+        "top_k": k,
+        "top_k_agreement": agreement,
+        "top_k_threshold": top_k_threshold,
+        "passed": bool(cosine.min() >= threshold and agreement >= top_k_threshold)
+    }
+
+
+def run_parity_check(
+    backend: str = "int8",
+    threshold: float = PARITY_THRESHOLD,
+    limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    用配置的嵌入模型 (EMBEDDING_REPO / EMBEDDING_DEVICE) 和知识库分块检查后端一致性，供 CI 或测试调用。
+
+    Args:
+        backend: 待检查的后端 int8 / onnx
+        threshold: 最低余弦相似度
+        limit: 最多使用多少个分块
+
+    Returns:
+        check_parity 的结果字典，passed 表示所有分块的余弦相似度都不低于 threshold，
+        且 top-k 近邻重合比例不低于 TOP_K_AGREEMENT_THRESHOLD
+    """
+    from huggingface_hub import snapshot_download
+    from resources import EMBEDDING_REPO, EMBEDDING_DEVICE
+
+    model_path = snapshot_download(repo_id=EMBEDDING_REPO)
+    return check_parity(model_path, backend, _corpus_texts(limit), threshold, EMBEDDING_DEVICE)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check embedding backend parity against torch")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="int8")
+    parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD)
+    parser.add_argument("--limit", type=int, default=None, help="最多使用多少个分块")
+    args = parser.parse_args()
+
+    result = run_parity_check(args.backend, args.threshold, args.limit)
+    print(
+        f"{result['backend']}: {result['samples']} chunks, "
+        f"min cosine {result['min_cosine']:.4f}, mean cosine {result['mean_cosine']:.4f}, "
+        f"top-{result['top_k']} agreement {result['top_k_agreement']:.3f} "
+        f"({'PASS' if result['passed'] else 'FAIL'}, threshold {result['threshold']})"
+    )
+    return 0 if result["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
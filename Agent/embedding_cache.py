@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入向量磁盘缓存
+以 (模型ID, 规范化文本) 为键，向量存放在内存映射的 float32 文件中，按 LRU 淘汰。
+索引构建 (rag.py) 和查询 (QrentAgent) 共用同一份缓存，多个进程之间通过文件锁协调写入。
+"""
+
+import os
+import json
+import atexit
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "embedding_cache")
+)
+DEFAULT_CAPACITY = int(os.getenv("EMBEDDING_CACHE_SIZE", "50000"))
+
+VECTORS_FILENAME = "vectors.f32"
+INDEX_FILENAME = "index.json"
+LOG_FILENAME = "index.log"
+LOCK_FILENAME = "cache.lock"
+# 索引日志累积多少条记录后压缩进 index.json
+COMPACT_EVERY = int(os.getenv("EMBEDDING_CACHE_COMPACT_EVERY", "4096"))
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：NFKC、去首尾空白、合并连续空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model_id: str, text: str) -> str:
+    """生成缓存键"""
+    return hashlib.sha256(f"{model_id}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class _FileLock:
+    """跨进程文件锁：fcntl.flock 区分共享/独占；Windows 上用 msvcrt，读写都是独占锁"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    @contextmanager
+    def hold(self, exclusive: bool):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a+b")
+        fd = self._file.fileno()
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                self._file.seek(0)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingCache:
+    """
+    基于内存映射文件的 LRU 嵌入缓存，可由多个进程（rag.py 构建索引、streamlit 中的 agent）同时读写。
+
+    vectors.f32 为 (capacity, dim) 的 float32 矩阵。行号分配记录在两个文件中：
+    - index.json：快照，按 LRU 顺序（最旧在前）记录 键 -> 行号，以及空闲行号列表
+    - index.log：快照之后的追加日志，每行一条 ["put", 键, 行号] 或 ["touch", 键]
+    写入只追加几行日志，累积 COMPACT_EVERY 条或 flush() 时才压缩为新快照；
+    其他进程只回放新增的日志行，快照被替换时才重新解析整个 index.json。
+
+    读取持有共享文件锁、写入持有独占文件锁 (cache.lock)，加锁后先同步磁盘上的索引再分配行号，
+    其他进程不会拿到已被重新分配的行。已有缓存的容量以文件为准（EMBEDDING_CACHE_SIZE 只在新建时生效），
+    已存在的向量文件不会被截断。本进程读取造成的 LRU 顺序变化随下一次写入或 flush() 记入日志。
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, capacity: int = DEFAULT_CAPACITY):
+        self.cache_dir = cache_dir
+        self.capacity = capacity
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        # 行号 -> 键
+        self._owners: Dict[int, str] = {}
+        self._free_slots: List[int] = []
+        self._vectors: Optional[np.memmap] = None
+        self._vectors_inode: Optional[int] = None
+        # 已加载的 index.json 版本 (inode, mtime, size) 和已回放到的日志位置
+        self._index_stamp: Optional[Tuple[int, int, int]] = None
+        self._log_offset = 0
+        self._log_records = 0
+        # 尚未记入日志的本进程读取
+        self._touched: "OrderedDict[str, None]" = OrderedDict()
+        self._index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self._log_path = os.path.join(cache_dir, LOG_FILENAME)
+        self._vectors_path = os.path.join(cache_dir, VECTORS_FILENAME)
+        self._lock = threading.RLock()
+        self._file_lock = _FileLock(os.path.join(cache_dir, LOCK_FILENAME))
+        if os.path.isfile(self._index_path):
+            with self._lock, self._file_lock.hold(exclusive=False):
+                self._sync()
+
+    def _stat_index(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self._index_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _reset(self) -> None:
+        self.dim = None
+        self._vectors = None
+        self._slots = OrderedDict()
+        self._owners = {}
+        self._free_slots = []
+        self._index_stamp = None
+        self._log_offset = 0
+        self._log_records = 0
+
+    def _sync(self) -> None:
+        """同步磁盘上的索引：快照被替换时重新加载，然后回放新增的日志（调用方持有文件锁）"""
+        stamp = self._stat_index()
+        if stamp != self._index_stamp:
+            if stamp is None:
+                # 缓存目录被删除：回到空缓存
+                self._reset()
+                return
+            if not self._load_snapshot(stamp):
+                return
+        self._replay_log()
+
+    def _load_snapshot(self, stamp: Tuple[int, int, int]) -> bool:
+        """加载 index.json 快照，失败时回到空缓存"""
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            capacity, dim = index["capacity"], index["dim"]
+            if capacity != self.capacity and self._index_stamp is None:
+                print(f"Embedding cache at {self.cache_dir} has capacity {capacity}, using it instead of {self.capacity}")
+            inode = os.stat(self._vectors_path).st_ino
+            if self._vectors is None or self._vectors.shape != (capacity, dim) or inode != self._vectors_inode:
+                self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+                self._vectors_inode = inode
+            self.capacity, self.dim = capacity, dim
+            self._slots = OrderedDict((key, slot) for key, slot in index["entries"])
+            self._owners = {slot: key for key, slot in self._slots.items()}
+            if "free" in index:
+                self._free_slots = list(index["free"])
+            else:
+                # 旧格式快照没有空闲列表
+                self._free_slots = [slot for slot in range(capacity - 1, -1, -1) if slot not in self._owners]
+        except Exception as e:
+            print(f"Warning: Unable to load embedding cache: {e}")
+            self._reset()
+            self._index_stamp = stamp
+            return False
+        for key in self._touched:
+            if key in self._slots:
+                self._slots.move_to_end(key)
+        self._index_stamp = stamp
+        self._log_offset = 0
+        self._log_records = 0
+        return True
+
+    def _replay_log(self) -> None:
+        """回放上次同步之后追加的日志行，忽略末尾未写完的行"""
+        try:
+            with open(self._log_path, "rb") as f:
+                f.seek(self._log_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            if record[0] == "put":
+                self._assign(record[1], record[2])
+            elif record[1] in self._slots:
+                self._slots.move_to_end(record[1])
+            self._log_records += 1
+        self._log_offset += end
+
+    def _assign(self, key: str, slot: int) -> None:
+        """把行号分配给键：淘汰该行原来的键，或从空闲列表中取出该行"""
+        owner = self._owners.get(slot)
+        if owner is not None and owner != key:
+            del self._slots[owner]
+        elif owner is None:
+            if self._free_slots and self._free_slots[-1] == slot:
+                self._free_slots.pop()
+            else:
+                self._free_slots.remove(slot)
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+        self._owners[slot] = key
+
+    def _allocate(self, dim: int):
+        """首次写入且磁盘上没有索引时创建内存映射文件和空快照（调用方持有独占文件锁）"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        size = self.capacity * dim * np.dtype(np.float32).itemsize
+        if os.path.isfile(self._vectors_path) and os.path.getsize(self._vectors_path) != size:
+            # 没有索引引用的残留文件：删除后新建，不截断可能仍被映射的旧文件
+            os.remove(self._vectors_path)
+        mode = "r+" if os.path.isfile(self._vectors_path) else "w+"
+        self.dim = dim
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode=mode, shape=(self.capacity, dim))
+        self._vectors_inode = os.stat(self._vectors_path).st_ino
+        self._slots = OrderedDict()
+        self._owners = {}
+        self._free_slots = list(range(self.capacity - 1, -1, -1))
+        self._write_snapshot()
+
+    def _write_snapshot(self) -> None:
+        """原子替换 index.json 并清空日志（调用方持有独占文件锁）"""
+        tmp_path = f"{self._index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": self.dim,
+                "capacity": self.capacity,
+                "entries": list(self._slots.items()),
+                "free": self._free_slots
+            }, f)
+        os.replace(tmp_path, self._index_path)
+        open(self._log_path, "wb").close()
+        self._index_stamp = self._stat_index()
+        self._log_offset = 0
+        self._log_records = 0
+        self._touched.clear()
+
+    def _append_log(self, records: List[list]) -> None:
+        """追加日志记录，累积过多时压缩为快照（调用方持有独占文件锁且已同步）"""
+        if not records:
+            return
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        with open(self._log_path, "ab") as f:
+            f.write(data)
+        self._log_offset += len(data)
+        self._log_records += len(records)
+        if self._log_records >= COMPACT_EVERY:
+            self._write_snapshot()
+
+    def _touch_records(self) -> List[list]:
+        """把本进程的读取转成 touch 日志记录"""
+        records = [["touch", key] for key in self._touched if key in self._slots]
+        self._touched.clear()
+        return records
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """批量读取，未命中的位置返回 None"""
+        with self._lock:
+            if self._index_stamp is None and not os.path.isfile(self._index_path):
+                self.misses += len(keys)
+                return [None] * len(keys)
+            results: List[Optional[np.ndarray]] = []
+            with self._file_lock.hold(exclusive=False):
+                self._sync()
+                for key in keys:
+                    slot = self._slots.get(key)
+                    if slot is None:
+                        self.misses += 1
+                        results.append(None)
+                    else:
+                        self._slots.move_to_end(key)
+                        self._touched[key] = None
+                        self._touched.move_to_end(key)
+                        self.hits += 1
+                        results.append(np.array(self._vectors[slot]))
+        return results
+
+    def put_many(self, keys: List[str], vectors) -> None:
+        """批量写入，容量不足时淘汰最久未使用的条目；只追加日志，其他进程随后可见"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(keys) != len(vectors):
+            raise ValueError("keys and vectors must have the same length")
+        if not keys:
+            return
+        with self._lock, self._file_lock.hold(exclusive=True):
+            self._sync()
+            if self._vectors is None:
+                self._allocate(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                print(f"Warning: Embedding dim {vectors.shape[1]} does not match cache dim {self.dim}, skipping cache write")
+                return
+            records = self._touch_records()
+            for key, vector in zip(keys, vectors):
+                slot = self._slots.get(key)
+                if slot is None:
+                    # 优先使用空闲行，否则淘汰最久未使用的条目
+                    slot = self._free_slots[-1] if self._free_slots else next(iter(self._slots.values()))
+                self._assign(key, slot)
+                self._vectors[slot] = vector
+                records.append(["put", key, slot])
+            self._append_log(records)
+
+    def flush(self) -> None:
+        """把向量落盘，记录本进程的读取，并把日志压缩为快照"""
+        with self._lock:
+            if self._vectors is None:
+                return
+            with self._file_lock.hold(exclusive=True):
+                self._sync()
+                if self._vectors is None:
+                    return
+                self._vectors.flush()
+                self._append_log(self._touch_records())
+                if self._log_records:
+                    self._write_snapshot()
+
+    def stats(self) -> dict:
+        """缓存命中统计"""
+        with self._lock:
+            return {"size": len(self._slots), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
+
+class CachedEmbeddings(Embeddings):
+    """给任意 langchain Embeddings 加上磁盘缓存，只对未命中的文本调用底层模型"""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_id: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_id = model_id
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model_id, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.underlying.embed_documents([texts[i] for i in missing])
+            self.cache.put_many([keys[i] for i in missing], computed)
+            for i, vector in zip(missing, computed):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model_id, text)
+        vector = self.cache.get_many([key])[0]
+        if vector is None:
+            computed = self.underlying.embed_query(text)
+            self.cache.put_many([key], [computed])
+            return list(computed)
+        return vector.tolist()
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取进程内共享的嵌入缓存实例"""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = EmbeddingCache()
+                atexit.register(_shared_cache.flush)
+    return _shared_cache
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+FAISS 索引类型选择
+支持 flat（精确检索）、hnsw、ivf-flat、ivf-pq，或直接传入 faiss.index_factory 字符串。
+增量构建始终在 flat 索引上进行，保存前再转换为目标类型（HNSW 不支持删除，
+IVF 删除后编号不连续，都不适合 langchain 的 delete）。
+
+召回率基准：python faiss_index.py --index-dir ../database/faiss_index --spec hnsw --k 10
+"""
+
+import os
+import sys
+import math
+import time
+import argparse
+from typing import Any, Dict, Optional
+
+import faiss
+import numpy as np
+
+FAISS_INDEX_SPEC = os.getenv("FAISS_INDEX_SPEC", "flat")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+# 训练 IVF/PQ 时最多使用的样本数
+TRAIN_SAMPLE_SIZE = 50000
+# k-means 每个聚类中心需要的最少训练样本数（低于此数 faiss 会告警）
+MIN_TRAIN_PER_CENTROID = 39
+# PQ 码本的最小位数，更少的中心召回率太低，不如直接用 Flat
+MIN_PQ_NBITS = 4
+
+
+def resolve_spec(spec: str, n_vectors: int, dim: int) -> str:
+    """
+    把简写的索引类型转换为 faiss.index_factory 字符串，按数据量选择 nlist 和 PQ 参数。
+    数据量不足以训练 IVF/PQ 时退化为 Flat（小语料上精确检索本来就足够快）。
+    """
+    spec = spec.strip()
+    name = spec.lower()
+    # IVF 每个聚类至少需要约 39 个训练样本，否则 faiss 会告警且聚类质量差
+    nlist = min(int(4 * math.sqrt(max(n_vectors, 1))), n_vectors // MIN_TRAIN_PER_CENTROID)
+    if name == "flat":
+        return "Flat"
+    if name == "hnsw":
+        return "HNSW32"
+    if name == "ivf-flat":
+        return f"IVF{nlist},Flat" if nlist >= 2 else "Flat"
+    if name == "ivf-pq":
+        m = next(m for m in (64, 32, 16, 8, 4, 2, 1) if dim % m == 0 and m <= max(dim // 8, 1))
+        # 每个子量化器同样要训练 2^nbits 个聚类中心
+        nbits = min(8, int(math.log2(max(n_vectors // MIN_TRAIN_PER_CENTROID, 1))))
+        if nlist < 2 or nbits < MIN_PQ_NBITS:
+            return "Flat"
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    return spec
+
+
+def describe_index(index) -> str:
+    """识别已加载索引的类型"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf-pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf-flat"
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    return type(index).__name__
+
+
+def configure_search(index, nprobe: int = FAISS_NPROBE, ef_search: int = FAISS_EF_SEARCH) -> Dict[str, Any]:
+    """按索引类型设置查询参数，返回实际生效的参数"""
+    params: Dict[str, Any] = {"type": describe_index(index)}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+        params["nprobe"] = ivf.nprobe
+    downcast = faiss.downcast_index(index)
+    if isinstance(downcast, faiss.IndexHNSW):
+        downcast.hnsw.efSearch = ef_search
+        params["efSearch"] = ef_search
+    return params
+
+
+def build_index(vectors: np.ndarray, spec: str = FAISS_INDEX_SPEC, seed: int = 0):
+    """按指定类型构建索引，需要训练的类型用随机抽样训练"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n_vectors, dim = vectors.shape
+    factory = resolve_spec(spec, n_vectors, dim)
+    if factory == "Flat" and spec.strip().lower() != "flat":
+        print(f"Only {n_vectors} vectors, too few to train {spec}; using Flat")
+    index = faiss.index_factory(dim, factory, faiss.METRIC_L2)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample_size = min(n_vectors, TRAIN_SAMPLE_SIZE)
+        sample = vectors[rng.choice(n_vectors, sample_size, replace=False)]
+        start = time.perf_counter()
+        index.train(sample)
+        print(f"Trained {factory} on {sample_size} vectors in {time.perf_counter() - start:.2f}s")
+    index.add(vectors)
+    return index
+
+
+def to_flat(index) -> Optional[faiss.IndexFlatL2]:
+    """
+    把索引还原为 flat 索引以便增量修改。
+    PQ 等有损索引无法还原原始向量，返回 None。
+    """
+    kind = describe_index(index)
+    if kind == "flat":
+        return index
+    if kind not in ("hnsw", "ivf-flat"):
+        return None
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    flat = faiss.IndexFlatL2(index.d)
+    if index.ntotal:
+        flat.add(index.reconstruct_n(0, index.ntotal))
+    return flat
+
+
+def recall_at_k(
+    vectors: np.ndarray,
+    spec: str,
+    k: int = 10,
+    n_queries: int = 200,
+    seed: int = 0,
+    nprobe: int = FAISS_NPROBE,
+    ef_search: int = FAISS_EF_SEARCH
+) -> Dict[str, Any]:
+    """
+    以 flat 精确检索为基准，计算指定索引类型的 recall@k 和平均查询耗时。
+    查询向量从库内向量中随机抽样。
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    k = min(k, len(vectors))
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    start = time.perf_counter()
+    _, truth = exact.search(queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    index = build_index(vectors, spec, seed)
+    params = configure_search(index, nprobe, ef_search)
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    ann_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return {
+        "spec": spec,
+        "factory": resolve_spec(spec, len(vectors), vectors.shape[1]),
+        "search_params": params,
+        "k": k,
+        "queries": len(queries),
+        "recall": hits / (k * len(queries)),
+        "flat_ms_per_query": exact_ms,
+        "ann_ms_per_query": ann_ms
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark recall@k of ANN index specs against the flat index")
+    parser.add_argument("--index-dir", default="../database/faiss_index")
+    parser.add_argument("--spec", action="append", help="可重复指定，默认 hnsw/ivf-flat/ivf-pq")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    index = faiss.read_index(os.path.join(args.index_dir, "index.faiss"))
+    flat = to_flat(index)
+    if flat is None:
+        print(f"Cannot recover exact vectors from a {describe_index(index)} index; rebuild with --index-spec flat first")
+        return 1
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    print(f"Loaded {len(vectors)} vectors (dim {vectors.shape[1]}) from {args.index_dir}")
+
+    for spec in args.spec or ["hnsw", "ivf-flat", "ivf-pq"]:
+        result = recall_at_k(vectors, spec, args.k, args.queries)
+        print(
+            f"{result['spec']:>9} ({result['factory']}): recall@{result['k']} {result['recall']:.3f}, "
+            f"{result['ann_ms_per_query']:.3f} ms/query vs flat {result['flat_ms_per_query']:.3f} ms/query"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
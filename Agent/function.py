@@ -1,7 +1,67 @@
 # -*- coding: utf-8 -*-
-import requests
+import os
 import json
-from typing import Dict, Any, Optional
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Iterator, Optional
+
+from property_api import NETWORK_ERRORS, async_post_search, post_search
+from property_frame import PropertyFrame
+from property_store import get_property_store
+from search_cache import get_search_cache
+from stats import PriceStats
+
+# 区域分析的并发线程数；实际同时发出的请求数还受 PROPERTY_API_MAX_CONCURRENCY 限制
+REGION_FANOUT_WORKERS = int(os.getenv("REGION_FANOUT_WORKERS", "8"))
+# 区域分析时每个区域最多统计的房源数，超过时结果带 truncated 标记
+REGION_MAX_ITEMS = int(os.getenv("REGION_MAX_ITEMS", "5000"))
+# 默认搜索后端：remote 请求搜索 API，local 查询本地房源快照（见 property_store.py）
+PROPERTY_SEARCH_BACKEND = os.getenv("PROPERTY_SEARCH_BACKEND", "remote")
+
+
+def _questionnaire_search_kwargs(questionnaire_data: Dict[str, Any]) -> Dict[str, Any]:
+    """把问卷数据转换为 search_properties 的参数"""
+    # 提取并转换问卷数据
+    min_price = questionnaire_data.get('budget_min')
+    max_price = questionnaire_data.get('budget_max')
+    room_type = questionnaire_data.get('room_type')
+    commute_time = questionnaire_data.get('commute_time')
+    target_school = questionnaire_data.get('target_school', 'University of New South Wales')
+    
+    # 转换通勤时间文本为数值
+    max_commute_time = None
+    if commute_time:
+        commute_mapping = {
+            # Chinese versions
+            '15分钟以内': 15,
+            '30分钟以内': 30,
+            '45分钟以内': 45,
+            '1小时以内': 60,
+            '1小时以上': 120,
+            '没有要求': None,
+            # English versions
+            '15 minutes': 15,
+            'Within 15 minutes': 15,
+            '30 minutes': 30,
+            'Within 30 minutes': 30,
+            '45 minutes': 45,
+            'Within 45 minutes': 45,
+            '1 hour': 60,
+            'Within 1 hour': 60,
+            'Over 1 hour': 120,
+            'No requirement': None,
+            'No requirements': None
+        }
+        max_commute_time = commute_mapping.get(commute_time)
+    
+    return {
+        "min_price": min_price,
+        "max_price": max_price,
+        "target_school": target_school,
+        "max_commute_time": max_commute_time,
+        "room_type": room_type,
+        "page_size": 10
+    }
 
 
 def search_properties_from_questionnaire(questionnaire_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -15,48 +75,8 @@ def search_properties_from_questionnaire(questionnaire_data: Dict[str, Any]) ->
         包含房源搜索结果的字典
     """
     try:
-        # 提取并转换问卷数据
-        min_price = questionnaire_data.get('budget_min')
-        max_price = questionnaire_data.get('budget_max')
-        room_type = questionnaire_data.get('room_type')
-        commute_time = questionnaire_data.get('commute_time')
-        target_school = questionnaire_data.get('target_school', 'University of New South Wales')
-        
-        # 转换通勤时间文本为数值
-        max_commute_time = None
-        if commute_time:
-            commute_mapping = {
-                # Chinese versions
-                '15分钟以内': 15,
-                '30分钟以内': 30,
-                '45分钟以内': 45,
-                '1小时以内': 60,
-                '1小时以上': 120,
-                '没有要求': None,
-                # English versions
-                '15 minutes': 15,
-                'Within 15 minutes': 15,
-                '30 minutes': 30,
-                'Within 30 minutes': 30,
-                '45 minutes': 45,
-                'Within 45 minutes': 45,
-                '1 hour': 60,
-                'Within 1 hour': 60,
-                'Over 1 hour': 120,
-                'No requirement': None,
-                'No requirements': None
-            }
-            max_commute_time = commute_mapping.get(commute_time)
-        
         # 调用底层搜索函数
-        return search_properties(
-            min_price=min_price,
-            max_price=max_price,
-            target_school=target_school,
-            max_commute_time=max_commute_time,
-            room_type=room_type,
-            page_size=10
-        )
+        return search_properties(**_questionnaire_search_kwargs(questionnaire_data))
         
     except Exception as e:
         return {
@@ -65,7 +85,7 @@ def search_properties_from_questionnaire(questionnaire_data: Dict[str, Any]) ->
         }
 
 
-def search_properties(
+def build_search_payload(
     min_price: Optional[int] = None,
     max_price: Optional[int] = None,
     target_school: Optional[str] = None,
@@ -77,6 +97,131 @@ def search_properties(
     bathrooms: Optional[int] = None,
     page: int = 1,
     page_size: int = 10
+) -> Dict[str, Any]:
+    """把搜索参数转换为后端 /properties/search 的请求体，参数含义同 search_properties"""
+    # 构建请求数据
+    payload: Dict[str, Any] = {
+        "page": page,
+        "pageSize": page_size
+    }
+    
+    # 只添加非空参数
+    if min_price is not None:
+        payload["minPrice"] = int(min_price)
+    if max_price is not None:
+        payload["maxPrice"] = int(max_price)
+    # targetSchool 是必需参数，如果没有提供则使用默认值
+    if target_school is not None:
+        payload["targetSchool"] = str(target_school)
+    else:
+        payload["targetSchool"] = "University of New South Wales"  # 默认学校
+    if min_commute_time is not None:
+        payload["minCommuteTime"] = int(min_commute_time)
+    if max_commute_time is not None:
+        payload["maxCommuteTime"] = int(max_commute_time)
+    if regions is not None:
+        payload["regions"] = str(regions)
+        
+    # 处理房型：使用bedroom数量而不是roomType
+    if room_type is not None:
+        room_type_lower = str(room_type).lower()
+        if "studio" in room_type_lower:
+            payload["minBedrooms"] = 0
+            payload["maxBedrooms"] = 0
+        elif "1bedroom" in room_type_lower or "1bed" in room_type_lower:
+            payload["minBedrooms"] = 1
+            payload["maxBedrooms"] = 1
+        elif "2bedroom" in room_type_lower or "2bed" in room_type_lower:
+            payload["minBedrooms"] = 2
+            payload["maxBedrooms"] = 2
+        elif "3bedroom" in room_type_lower or "3bed" in room_type_lower:
+            payload["minBedrooms"] = 3
+            payload["maxBedrooms"] = 3
+    
+    # 直接指定卧室和卫生间数量（优先级高于room_type）
+    if bedrooms is not None:
+        payload["minBedrooms"] = int(bedrooms)
+        payload["maxBedrooms"] = int(bedrooms)
+    if bathrooms is not None:
+        payload["minBathrooms"] = int(bathrooms)
+        payload["maxBathrooms"] = int(bathrooms)
+    return payload
+
+
+def _format_search_result(result: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """把后端（或本地快照）的搜索结果转换为工具返回的字典"""
+    # 格式化返回结果
+    return {
+        "success": True,
+        "count": len(result.get("properties", [])),
+        "properties": result.get("properties", []),
+        "total": result.get("totalCount", 0),
+        "filtered_count": result.get("filteredCount", 0),
+        "average_price": result.get("averagePrice", 0),
+        "average_commute_time": result.get("averageCommuteTime", 0),
+        "top_regions": result.get("topRegions", []),
+        "page": payload["page"],
+        "page_size": payload["pageSize"],
+        "search_params": payload
+    }
+
+
+def _format_search_response(response, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """把后端响应转换为工具返回的字典（requests 和 httpx 的响应都适用）"""
+    # 检查响应状态
+    if response.status_code == 200:
+        return _format_search_result(response.json(), payload)
+    else:
+        return {
+            "success": False,
+            "error": f"API请求失败，状态码: {response.status_code}",
+            "message": response.text
+        }
+
+
+def _search_local(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """在本地房源快照中搜索，不访问网络"""
+    try:
+        return _format_search_result(get_property_store().search(payload), payload)
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"本地房源库查询错误: {str(e)}"
+        }
+
+
+def _search_error(e: Exception) -> Dict[str, Any]:
+    """把搜索过程中的异常转换为错误字典"""
+    if isinstance(e, NETWORK_ERRORS):
+        return {
+            "success": False,
+            "error": f"网络请求错误: {str(e)}"
+        }
+    if isinstance(e, json.JSONDecodeError):
+        return {
+            "success": False,
+            "error": f"JSON解析错误: {str(e)}"
+        }
+    return {
+        "success": False,
+        "error": f"未知错误: {str(e)}"
+    }
+
+
+def search_properties(
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    target_school: Optional[str] = None,
+    min_commute_time: Optional[int] = None,
+    max_commute_time: Optional[int] = None,
+    regions: Optional[str] = None,
+    room_type: Optional[str] = None,
+    bedrooms: Optional[int] = None,
+    bathrooms: Optional[int] = None,
+    page: int = 1,
+    page_size: int = 10,
+    use_cache: bool = True,
+    backend: str = PROPERTY_SEARCH_BACKEND
 ) -> Dict[str, Any]:
     """
     搜索房源信息
@@ -93,114 +238,60 @@ def search_properties(
         bathrooms: 卫生间数量
         page: 页码
         page_size: 每页数量
+        use_cache: 是否使用搜索结果缓存（相同请求在 TTL 内直接返回，并发的相同请求合并）
+        backend: "remote" 请求搜索 API；"local" 查询本地房源快照（毫秒级，可离线使用，不经过缓存）
     
     Returns:
         包含房源搜索结果的字典
     """
     try:
-        # API端点
-        url = "http://139.180.164.78:3201/properties/search"
-        
-        # 构建请求数据
-        payload: Dict[str, Any] = {
-            "page": page,
-            "pageSize": page_size
-        }
-        
-        # 只添加非空参数
-        if min_price is not None:
-            payload["minPrice"] = int(min_price)
-        if max_price is not None:
-            payload["maxPrice"] = int(max_price)
-        # targetSchool 是必需参数，如果没有提供则使用默认值
-        if target_school is not None:
-            payload["targetSchool"] = str(target_school)
-        else:
-            payload["targetSchool"] = "University of New South Wales"  # 默认学校
-        if min_commute_time is not None:
-            payload["minCommuteTime"] = int(min_commute_time)
-        if max_commute_time is not None:
-            payload["maxCommuteTime"] = int(max_commute_time)
-        if regions is not None:
-            payload["regions"] = str(regions)
-            
-        # 处理房型：使用bedroom数量而不是roomType
-        if room_type is not None:
-            room_type_lower = str(room_type).lower()
-            if "studio" in room_type_lower:
-                payload["minBedrooms"] = 0
-                payload["maxBedrooms"] = 0
-            elif "1bedroom" in room_type_lower or "1bed" in room_type_lower:
-                payload["minBedrooms"] = 1
-                payload["maxBedrooms"] = 1
-            elif "2bedroom" in room_type_lower or "2bed" in room_type_lower:
-                payload["minBedrooms"] = 2
-                payload["maxBedrooms"] = 2
-            elif "3bedroom" in room_type_lower or "3bed" in room_type_lower:
-                payload["minBedrooms"] = 3
-                payload["maxBedrooms"] = 3
-        
-        # 直接指定卧室和卫生间数量（优先级高于room_type）
-        if bedrooms is not None:
-            payload["minBedrooms"] = int(bedrooms)
-            payload["maxBedrooms"] = int(bedrooms)
-        if bathrooms is not None:
-            payload["minBathrooms"] = int(bathrooms)
-            payload["maxBathrooms"] = int(bathrooms)
-        
-        # 设置请求头
-        headers = {
-            "Content-Type": "application/json"
-        }
-        
-        # 发送POST请求
-        response = requests.post(
-            url,
-            headers=headers,
-            data=json.dumps(payload),
-            timeout=30
+        payload = build_search_payload(
+            min_price=min_price,
+            max_price=max_price,
+            target_school=target_school,
+            min_commute_time=min_commute_time,
+            max_commute_time=max_commute_time,
+            regions=regions,
+            room_type=room_type,
+            bedrooms=bedrooms,
+            bathrooms=bathrooms,
+            page=page,
+            page_size=page_size
         )
         
-        # 检查响应状态
-        if response.status_code == 200:
-            result = response.json()
-            
-            # 格式化返回结果
-            return {
-                "success": True,
-                "count": len(result.get("properties", [])),
-                "properties": result.get("properties", []),
-                "total": result.get("totalCount", 0),
-                "filtered_count": result.get("filteredCount", 0),
-                "average_price": result.get("averagePrice", 0),
-                "average_commute_time": result.get("averageCommuteTime", 0),
-                "top_regions": result.get("topRegions", []),
-                "page": page,
-                "page_size": page_size,
-                "search_params": payload
-            }
-        else:
-            return {
-                "success": False,
-                "error": f"API请求失败，状态码: {response.status_code}",
-                "message": response.text
-            }
-            
-    except requests.RequestException as e:
-        return {
-            "success": False,
-            "error": f"网络请求错误: {str(e)}"
-        }
-    except json.JSONDecodeError as e:
-        return {
-            "success": False,
-            "error": f"JSON解析错误: {str(e)}"
-        }
     except Exception as e:
-        return {
-            "success": False,
-            "error": f"未知错误: {str(e)}"
-        }
+        return _search_error(e)
+    
+    if backend == "local":
+        return _search_local(payload)
+    
+    def fetch() -> Dict[str, Any]:
+        try:
+            # 通过共享连接池发送POST请求（连接/读取超时分开，失败时退避重试）
+            response = post_search(payload)
+            return _format_search_response(response, payload)
+        except Exception as e:
+            return _search_error(e)
+    
+    if not use_cache:
+        return fetch()
+    return get_search_cache().get_or_fetch(payload, fetch)
+
+
+def _questionnaire_region_kwargs(questionnaire_data: Dict[str, Any]) -> Dict[str, Any]:
+    """把问卷数据转换为 analyze_properties_by_region 的过滤参数"""
+    # 提取并转换问卷数据
+    min_price = questionnaire_data.get('budget_min')
+    max_price = questionnaire_data.get('budget_max')
+    room_type = questionnaire_data.get('room_type')
+    target_school = questionnaire_data.get('target_school', 'University of New South Wales')
+    
+    return {
+        "min_price": min_price,
+        "max_price": max_price,
+        "target_school": target_school,
+        "room_type": room_type
+    }
 
 
 def analyze_properties_by_region_from_questionnaire(
@@ -218,20 +309,8 @@ def analyze_properties_by_region_from_questionnaire(
         包含区域分析结果的字典
     """
     try:
-        # 提取并转换问卷数据
-        min_price = questionnaire_data.get('budget_min')
-        max_price = questionnaire_data.get('budget_max')
-        room_type = questionnaire_data.get('room_type')
-        target_school = questionnaire_data.get('target_school', 'University of New South Wales')
-        
         # 调用底层分析函数
-        return analyze_properties_by_region(
-            regions=regions,
-            min_price=min_price,
-            max_price=max_price,
-            target_school=target_school,
-            room_type=room_type
-        )
+        return analyze_properties_by_region(regions=regions, **_questionnaire_region_kwargs(questionnaire_data))
         
     except Exception as e:
         return {
@@ -240,6 +319,192 @@ def analyze_properties_by_region_from_questionnaire(
         }
 
 
+class PropertySearchError(Exception):
+    """分页遍历过程中某一页查询失败"""
+
+
+def iter_properties(
+    page_size: int = 100,
+    max_items: Optional[int] = None,
+    prefetch: bool = True,
+    **search_kwargs
+) -> Iterator[Dict[str, Any]]:
+    """
+    逐条产出符合条件的房源，自动翻页直到 totalCount 或最后一页。
+    
+    Args:
+        page_size: 每页数量
+        max_items: 最多产出多少条，None 表示不限制
+        prefetch: 是否在消费当前页时提前请求下一页
+        **search_kwargs: 传给 search_properties 的过滤参数（不含 page/page_size）
+    
+    Raises:
+        PropertySearchError: 某一页查询失败
+    """
+    def fetch(page: int) -> Dict[str, Any]:
+        return search_properties(page=page, page_size=page_size, **search_kwargs)
+    
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="property-prefetch") if prefetch else None
+    try:
+        page = 1
+        yielded = 0
+        result = fetch(page)
+        while True:
+            if not result["success"]:
+                raise PropertySearchError(result.get("error", "查询失败"))
+            properties = result["properties"]
+            total = result.get("total") or 0
+            # 后端没有返回 totalCount 时以不满一页作为结束
+            has_more = bool(properties) and len(properties) >= page_size and (not total or page * page_size < total)
+            if max_items is not None and yielded + len(properties) >= max_items:
+                has_more = False
+            
+            next_page = pool.submit(fetch, page + 1) if pool is not None and has_more else None
+            for prop in properties:
+                if max_items is not None and yielded >= max_items:
+                    break
+                yield prop
+                yielded += 1
+            
+            if not has_more:
+                return
+            page += 1
+            result = next_page.result() if next_page is not None else fetch(page)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def aiter_properties(
+    page_size: int = 100,
+    max_items: Optional[int] = None,
+    prefetch: bool = True,
+    **search_kwargs
+) -> AsyncIterator[Dict[str, Any]]:
+    """iter_properties 的异步版本"""
+    async def fetch(page: int) -> Dict[str, Any]:
+        return await async_search_properties(page=page, page_size=page_size, **search_kwargs)
+    
+    next_page = None
+    try:
+        page = 1
+        yielded = 0
+        result = await fetch(page)
+        while True:
+            if not result["success"]:
+                raise PropertySearchError(result.get("error", "查询失败"))
+            properties = result["properties"]
+            total = result.get("total") or 0
+            has_more = bool(properties) and len(properties) >= page_size and (not total or page * page_size < total)
+            if max_items is not None and yielded + len(properties) >= max_items:
+                has_more = False
+            
+            next_page = asyncio.ensure_future(fetch(page + 1)) if prefetch and has_more else None
+            for prop in properties:
+                if max_items is not None and yielded >= max_items:
+                    break
+                yield prop
+                yielded += 1
+            
+            if not has_more:
+                return
+            page += 1
+            result = await next_page if next_page is not None else await fetch(page)
+            next_page = None
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+class RegionSummary:
+    """
+    流式汇总房源的房型分布和价格统计（均值、中位数、p90、极值、标准差），不保留房源列表。
+    房源先缓存成批，每批转换为 PropertyFrame 后按房型向量化写入统计；多个区域或多页的汇总可以 merge。
+    """
+    
+    BATCH_SIZE = 100
+    
+    def __init__(self, max_items: Optional[int] = None):
+        self.max_items = max_items
+        self.total_properties = 0
+        # 超过 max_items 的房源不计入统计，只标记结果被截断
+        self.truncated = False
+        self.room_types: Dict[str, Dict[str, Any]] = {}
+        self._pending: list = []
+    
+    def _room(self, room_key: str) -> Dict[str, Any]:
+        return self.room_types.setdefault(room_key, {"count": 0, "prices": PriceStats()})
+    
+    def add(self, prop: Dict[str, Any]) -> None:
+        if self.max_items is not None and self.total_properties + len(self._pending) >= self.max_items:
+            self.truncated = True
+            return
+        self._pending.append(prop)
+        if len(self._pending) >= self.BATCH_SIZE:
+            self._flush()
+    
+    def add_frame(self, frame: PropertyFrame) -> None:
+        """一次写入一整批房源"""
+        valid = frame.price_mask
+        for room_key, rows in frame.groups("room_type"):
+            room_data = self._room(room_key)
+            room_data["count"] += int(rows.size)
+            room_data["prices"].add_many(frame.price[rows[valid[rows]]])
+        self.total_properties += len(frame)
+    
+    def _flush(self) -> None:
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self.add_frame(PropertyFrame(pending))
+    
+    def merge(self, other: "RegionSummary") -> "RegionSummary":
+        """合并另一个汇总，返回 self"""
+        self._flush()
+        other._flush()
+        for room_key, other_data in other.room_types.items():
+            room_data = self._room(room_key)
+            room_data["count"] += other_data["count"]
+            room_data["prices"].merge(other_data["prices"])
+        self.total_properties += other.total_properties
+        self.truncated = self.truncated or other.truncated
+        return self
+    
+    def result(self) -> Dict[str, Any]:
+        self._flush()
+        room_types = {
+            room_key: {"count": room_data["count"], **room_data["prices"].summary()}
+            for room_key, room_data in self.room_types.items()
+        }
+        summary = {
+            "total_properties": self.total_properties,
+            "room_types": room_types
+        }
+        if self.truncated:
+            summary["truncated"] = True
+        return summary
+
+
+def _collect_region_results(region_list: list, outcomes: list) -> Dict[str, Any]:
+    """把各区域的汇总（或异常）整理为返回结果，并合并出所有成功区域的整体统计"""
+    analysis_results = {}
+    overall = RegionSummary()
+    for region, outcome in zip(region_list, outcomes):
+        if isinstance(outcome, PropertySearchError):
+            analysis_results[region] = {"error": str(outcome)}
+        elif isinstance(outcome, BaseException):
+            analysis_results[region] = {"error": f"区域查询错误: {str(outcome)}"}
+        else:
+            analysis_results[region] = outcome.result()
+            overall.merge(outcome)
+    
+    return {
+        "success": True,
+        "analysis_results": analysis_results,
+        "overall": overall.result(),
+        "failed_regions": [region for region, data in analysis_results.items() if "error" in data]
+    }
+
+
 def analyze_properties_by_region(
     regions: str,
     min_price: Optional[int] = None,
@@ -247,7 +512,8 @@ def analyze_properties_by_region(
     target_school: Optional[str] = None,
     room_type: Optional[str] = None,
     bedrooms: Optional[int] = None,
-    bathrooms: Optional[int] = None
+    bathrooms: Optional[int] = None,
+    concurrent: bool = True
 ) -> Dict[str, Any]:
     """
     按区域分析房源分布情况
@@ -257,17 +523,19 @@ def analyze_properties_by_region(
         min_price: 最低价格
         max_price: 最高价格
         target_school: 目标学校
+        concurrent: 为 True 时各区域并发查询（受全局并发上限约束），否则逐个查询
     
     Returns:
-        包含区域分析结果的字典
+        包含区域分析结果的字典；个别区域失败时保留其他区域的结果，
+        overall 为所有成功区域合并后的统计
     """
     try:
         region_list = [r.strip() for r in regions.split(',')]
-        analysis_results = {}
         
-        for region in region_list:
-            # 搜索该区域的房源
-            result = search_properties(
+        def analyze_region(region: str) -> RegionSummary:
+            # 翻页遍历该区域的全部房源，边读边汇总；多取一条用于判断是否还有未统计的房源
+            summary = RegionSummary(REGION_MAX_ITEMS)
+            for prop in iter_properties(
                 regions=region,
                 min_price=min_price,
                 max_price=max_price,
@@ -275,53 +543,104 @@ def analyze_properties_by_region(
                 room_type=room_type,
                 bedrooms=bedrooms,
                 bathrooms=bathrooms,
-                page_size=100  # 获取更多数据用于分析
-            )
-            
-            if result["success"]:
-                properties = result["properties"]
-                
-                # 分析房型分布
-                room_types = {}
-                total_properties = len(properties)
-                
-                for prop in properties:
-                    bedroom_count = prop.get("bedroomCount", 0)
-                    bathroom_count = prop.get("bathroomCount", 0)
-                    room_key = f"{bedroom_count}室{bathroom_count}卫"
-                    
-                    if room_key not in room_types:
-                        room_types[room_key] = {
-                            "count": 0,
-                            "prices": []
-                        }
-                    
-                    room_types[room_key]["count"] += 1
-                    price = prop.get("pricePerWeek")
-                    if price:
-                        room_types[room_key]["prices"].append(price)
-                
-                # 计算平均价格
-                for room_data in room_types.values():
-                    if room_data["prices"]:
-                        room_data["avg_price"] = round(sum(room_data["prices"]) / len(room_data["prices"]), 2)
-                    else:
-                        room_data["avg_price"] = 0
-                    del room_data["prices"]  # 移除原始价格数据
-                
-                analysis_results[region] = {
-                    "total_properties": total_properties,
-                    "room_types": room_types
-                }
-            else:
-                analysis_results[region] = {
-                    "error": result.get("error", "查询失败")
-                }
+                page_size=100,
+                max_items=REGION_MAX_ITEMS + 1
+            ):
+                summary.add(prop)
+            return summary
+        
+        def run(region: str):
+            try:
+                return analyze_region(region)
+            except Exception as e:
+                return e
+        
+        workers = min(REGION_FANOUT_WORKERS, len(region_list))
+        if concurrent and workers > 1:
+            # 单个区域异常不影响其他区域，结果按传入顺序排列
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="region-search") as pool:
+                outcomes = list(pool.map(run, region_list))
+        else:
+            outcomes = [run(region) for region in region_list]
         
+        return _collect_region_results(region_list, outcomes)
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"区域分析错误: {str(e)}"
+        }
+
+
+async def async_search_properties(
+    use_cache: bool = True,
+    backend: str = PROPERTY_SEARCH_BACKEND,
+    **kwargs
+) -> Dict[str, Any]:
+    """search_properties 的异步版本，参数和返回值相同"""
+    try:
+        payload = build_search_payload(**kwargs)
+    except Exception as e:
+        return _search_error(e)
+    
+    if backend == "local":
+        # SQLite 查询只需几毫秒，直接在事件循环中执行
+        return _search_local(payload)
+    
+    async def fetch() -> Dict[str, Any]:
+        try:
+            response = await async_post_search(payload)
+            return _format_search_response(response, payload)
+        except Exception as e:
+            return _search_error(e)
+    
+    if not use_cache:
+        return await fetch()
+    return await get_search_cache().aget_or_fetch(payload, fetch)
+
+
+async def async_search_properties_from_questionnaire(questionnaire_data: Dict[str, Any]) -> Dict[str, Any]:
+    """search_properties_from_questionnaire 的异步版本"""
+    try:
+        return await async_search_properties(**_questionnaire_search_kwargs(questionnaire_data))
+    except Exception as e:
         return {
-            "success": True,
-            "analysis_results": analysis_results
+            "success": False,
+            "error": f"问卷数据处理错误: {str(e)}"
         }
+
+
+async def async_analyze_properties_by_region(
+    regions: str,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    target_school: Optional[str] = None,
+    room_type: Optional[str] = None,
+    bedrooms: Optional[int] = None,
+    bathrooms: Optional[int] = None
+) -> Dict[str, Any]:
+    """analyze_properties_by_region 的异步版本，各区域用 asyncio.gather 并发查询"""
+    try:
+        region_list = [r.strip() for r in regions.split(',')]
+        
+        async def analyze_region(region: str) -> RegionSummary:
+            summary = RegionSummary(REGION_MAX_ITEMS)
+            async for prop in aiter_properties(
+                regions=region,
+                min_price=min_price,
+                max_price=max_price,
+                target_school=target_school,
+                room_type=room_type,
+                bedrooms=bedrooms,
+                bathrooms=bathrooms,
+                page_size=100,
+                max_items=REGION_MAX_ITEMS + 1
+            ):
+                summary.add(prop)
+            return summary
+        
+        outcomes = await asyncio.gather(*(analyze_region(region) for region in region_list), return_exceptions=True)
+        return _collect_region_results(region_list, outcomes)
         
     except Exception as e:
         return {
@@ -330,10 +649,26 @@ def analyze_properties_by_region(
         }
 
 
+async def async_analyze_properties_by_region_from_questionnaire(
+    regions: str,
+    questionnaire_data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """analyze_properties_by_region_from_questionnaire 的异步版本"""
+    try:
+        return await async_analyze_properties_by_region(regions=regions, **_questionnaire_region_kwargs(questionnaire_data))
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"问卷数据处理错误: {str(e)}"
+        }
+
+
 # 定义可用函数列表
+# "function" 为同步实现，"async_function" 为供异步 agent 循环 await 的协程版本
 AVAILABLE_FUNCTIONS = {
     "search_properties_from_questionnaire": {
         "function": search_properties_from_questionnaire,
+        "async_function": async_search_properties_from_questionnaire,
         "description": "基于问卷数据搜索房源信息，自动处理问卷参数转换",
         "parameters": {
             "type": "object",
@@ -363,6 +698,7 @@ AVAILABLE_FUNCTIONS = {
     },
     "search_properties": {
         "function": search_properties,
+        "async_function": async_search_properties,
         "description": "搜索符合条件的房源信息（低级API，直接使用搜索参数）",
         "parameters": {
             "type": "object",
@@ -416,6 +752,7 @@ AVAILABLE_FUNCTIONS = {
     },
     "analyze_properties_by_region_from_questionnaire": {
         "function": analyze_properties_by_region_from_questionnaire,
+        "async_function": async_analyze_properties_by_region_from_questionnaire,
         "description": "基于问卷数据按区域分析房源分布情况，包括房型统计和价格分析",
         "parameters": {
             "type": "object",
@@ -440,6 +777,7 @@ AVAILABLE_FUNCTIONS = {
     },
     "analyze_properties_by_region": {
         "function": analyze_properties_by_region,
+        "async_function": async_analyze_properties_by_region,
         "description": "按区域分析房源分布情况，包括房型统计和价格分析（低级API）",
         "parameters": {
             "type": "object",
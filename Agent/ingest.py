@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+文档并行加载与分块
+按文件分发到进程池，PDF 逐页流式分块，CSV/Excel 用 pandas 向量化地把行转换为文档。
+独立成模块，避免子进程导入 rag.py 时触发嵌入模型下载。
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+from langchain_community.document_loaders import TextLoader, PyPDFLoader
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+SUPPORTED_EXTENSIONS = {'.txt', '.md', '.pdf', '.csv', '.xlsx', '.xls'}
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or None
+
+
+def iter_source_files(sources: List[str]) -> List[str]:
+    """展开数据源列表中的目录，返回所有受支持的文件路径"""
+    files = []
+    for src in sources:
+        if os.path.isdir(src):
+            for root, _, names in os.walk(src):
+                for fn in sorted(names):
+                    if os.path.splitext(fn)[1].lower() in SUPPORTED_EXTENSIONS:
+                        files.append(os.path.join(root, fn))
+        elif os.path.isfile(src):
+            files.append(src)
+        else:
+            print(f"Warning: File/directory not found: {src}")
+    return files
+
+
+def rows_to_documents(df: pd.DataFrame, source: str) -> List[Document]:
+    """
+    把表格的每一行转换为一个 Document，内容格式与 CSVLoader 一致（每列一行 "列名: 值"）。
+    按列做字符串拼接，避免 df.iterrows() 逐行构造 Series。
+    """
+    if df.empty:
+        return []
+    content = None
+    for column in df.columns:
+        part = f"{column}: " + df[column].fillna("").astype(str)
+        content = part if content is None else content + "\n" + part
+    return [
+        Document(page_content=text, metadata={"source": source, "row": row})
+        for row, text in enumerate(content.tolist())
+    ]
+
+
+def iter_file_documents(path: str):
+    """按文件类型逐个产出 Document，PDF 按页流式读取"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ['.txt', '.md']:
+        yield from TextLoader(path).lazy_load()
+    elif ext == '.pdf':
+        yield from PyPDFLoader(path).lazy_load()
+    elif ext == '.csv':
+        yield from rows_to_documents(pd.read_csv(path, dtype=str, keep_default_na=False), path)
+    elif ext in ['.xlsx', '.xls']:
+        yield from rows_to_documents(pd.read_excel(path, dtype=str), path)
+
+
+def load_file(path: str, chunk_size: Optional[int] = None, chunk_overlap: int = 200) -> Tuple[str, List[Document], Dict[str, float]]:
+    """
+    加载单个文件并过滤空文档；给出 chunk_size 时边读边分块。
+    在子进程中执行，返回 (路径, 文档或分块列表, 各阶段耗时)。
+    """
+    timings = {"load": 0.0, "split": 0.0}
+    splitter = None
+    if chunk_size:
+        splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    results: List[Document] = []
+    skipped = 0
+    try:
+        documents = iter_file_documents(path)
+        while True:
+            start = time.perf_counter()
+            doc = next(documents, None)
+            timings["load"] += time.perf_counter() - start
+            if doc is None:
+                break
+            if not (doc.page_content and doc.page_content.strip()):
+                skipped += 1
+                continue
+            if splitter is None:
+                results.append(doc)
+                continue
+            start = time.perf_counter()
+            for chunk in splitter.split_documents([doc]):
+                if chunk.page_content and chunk.page_content.strip():
+                    results.append(chunk)
+            timings["split"] += time.perf_counter() - start
+    except Exception as e:
+        print(f"Error loading {path}: {e}")
+        return path, [], timings
+
+    if skipped:
+        print(f"Skipping {skipped} empty documents from {path}")
+    return path, results, timings
+
+
+def load_files_parallel(
+    paths: List[str],
+    chunk_size: Optional[int] = None,
+    chunk_overlap: int = 200,
+    max_workers: Optional[int] = INGEST_WORKERS
+) -> Tuple[Dict[str, List[Document]], Dict[str, float]]:
+    """
+    用进程池并行加载（并可选分块）多个文件。
+
+    Returns:
+        (按文件路径分组的文档/分块, 各阶段耗时)。load/split 为所有文件累计的 CPU 时间，
+        wall 为整体耗时。
+    """
+    start = time.perf_counter()
+    by_file: Dict[str, List[Document]] = {}
+    timings = {"load": 0.0, "split": 0.0}
+
+    workers = min(max_workers or os.cpu_count() or 1, len(paths))
+    if workers <= 1:
+        outputs = (load_file(path, chunk_size, chunk_overlap) for path in paths)
+        for path, docs, file_timings in outputs:
+            by_file[path] = docs
+            for stage, seconds in file_timings.items():
+                timings[stage] += seconds
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outputs = pool.map(
+                load_file, paths, [chunk_size] * len(paths), [chunk_overlap] * len(paths)
+            )
+            for path, docs, file_timings in outputs:
+                by_file[path] = docs
+                for stage, seconds in file_timings.items():
+                    timings[stage] += seconds
+
+    for path, docs in by_file.items():
+        print(f"Loaded {len(docs)} {'chunks' if chunk_size else 'documents'} from {path}")
+    timings["wall"] = time.perf_counter() - start
+    return by_file, timings
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    """把阶段耗时格式化为一行日志"""
+    return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
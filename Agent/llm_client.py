@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+共享的 LLM 调用层 (DashScope OpenAI 兼容接口)
+三个 agent 共用同一个长期存活的 OpenAI 客户端（底层 httpx 连接池，keep-alive 复用 TLS 连接），
+超时和重试次数可配置，每次调用统计耗时和 token 用量；stream_chat_completion 逐 chunk 产出回复。
+接口在 usage.prompt_tokens_details.cached_tokens 中报告命中前缀缓存的 token 数时，一并统计缓存命中率。
+消息角色统一在这里过滤：inquiry_assistant / report_assistant 映射为 assistant，只保留接口支持的角色。
+"""
+
+import os
+import time
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+from openai import OpenAI
+
+DASHSCOPE_BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+QWEN_MODEL = "qwen-vl-max-latest"
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+# 由 openai 客户端对连接错误、429 和 5xx 做指数退避重试
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+
+ASSISTANT_ROLE_ALIASES = {"inquiry_assistant", "report_assistant"}
+ALLOWED_ROLES = {"system", "assistant", "user", "tool", "function"}
+
+# api_key -> OpenAI 客户端；agent 和 streamlit secrets 可能使用不同的密钥
+_clients: Dict[str, OpenAI] = {}
+_clients_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def filter_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """过滤和转换消息角色，确保API兼容性（只保留 role 和 content）"""
+    filtered_messages = []
+    for msg in messages:
+        role = msg["role"]
+        # 将非标准角色映射为assistant
+        if role in ASSISTANT_ROLE_ALIASES:
+            role = "assistant"
+        # 只保留API支持的角色
+        if role in ALLOWED_ROLES:
+            filtered_messages.append({"role": role, "content": msg["content"]})
+    return filtered_messages
+
+
+def get_client(api_key: str) -> OpenAI:
+    """获取共享的 OpenAI 客户端，同一个密钥只创建一次"""
+    client = _clients.get(api_key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(api_key)
+            if client is None:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=LLM_POOL_SIZE,
+                        max_keepalive_connections=LLM_POOL_SIZE
+                    ),
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+                )
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=DASHSCOPE_BASE_URL,
+                    max_retries=LLM_MAX_RETRIES,
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                    http_client=http_client
+                )
+                _clients[api_key] = client
+    return client
+
+
+def _cached_tokens(usage: Any) -> int:
+    """命中服务端前缀缓存的 prompt token 数，接口未报告时为 0"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", 0) or 0
+
+
+def _record(caller: str, elapsed_ms: float, usage: Any, error: Optional[str], first_chunk_ms: Optional[float] = None) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(caller, {
+            "calls": 0,
+            "errors": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cached_tokens": 0,
+            "streams": 0,
+            "total_first_chunk_ms": 0.0
+        })
+        stats["calls"] += 1
+        if first_chunk_ms is not None:
+            stats["streams"] += 1
+            stats["total_first_chunk_ms"] += first_chunk_ms
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        if error:
+            stats["errors"] += 1
+        if usage is not None:
+            stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            stats["cached_tokens"] += _cached_tokens(usage)
+
+
+def chat_completion(
+    messages: List[Dict[str, Any]],
+    api_key: str,
+    model: str = QWEN_MODEL,
+    caller: str = "default",
+    **kwargs
+):
+    """
+    调用 chat.completions.create，消息先经过角色过滤。
+
+    Args:
+        messages: 对话消息
+        api_key: DashScope 密钥
+        model: 模型名称
+        caller: 统计分组名，例如 "agent" / "inquiry" / "report"
+        **kwargs: 透传给接口的参数（tools、temperature、max_tokens 等）
+
+    Returns:
+        接口返回的 completion 对象
+    """
+    start = time.perf_counter()
+    try:
+        completion = get_client(api_key).chat.completions.create(
+            model=model,
+            messages=filter_messages(messages),
+            **kwargs
+        )
+    except Exception as e:
+        _record(caller, (time.perf_counter() - start) * 1000, None, str(e))
+        raise
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    usage = getattr(completion, "usage", None)
+    _record(caller, elapsed_ms, usage, None)
+    print(
+        f"LLM call ({caller}): {elapsed_ms:.0f}ms, "
+        f"prompt_tokens={getattr(usage, 'prompt_tokens', None)}, cached_tokens={_cached_tokens(usage)}, "
+        f"completion_tokens={getattr(usage, 'completion_tokens', None)}"
+    )
+    return completion
+
+
+def stream_chat_completion(
+    messages: List[Dict[str, Any]],
+    api_key: str,
+    model: str = QWEN_MODEL,
+    caller: str = "default",
+    **kwargs
+) -> Iterator[Any]:
+    """
+    chat_completion 的流式版本，逐个产出接口返回的 chunk。
+    统计中额外记录首个 chunk 的延迟 (first_chunk_ms)，token 用量取自最后一个带 usage 的 chunk。
+    """
+    start = time.perf_counter()
+    first_chunk_ms = None
+    usage = None
+    try:
+        stream = get_client(api_key).chat.completions.create(
+            model=model,
+            messages=filter_messages(messages),
+            stream=True,
+            stream_options={"include_usage": True},
+            **kwargs
+        )
+        for chunk in stream:
+            if first_chunk_ms is None:
+                first_chunk_ms = (time.perf_counter() - start) * 1000
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            yield chunk
+    except Exception as e:
+        _record(caller, (time.perf_counter() - start) * 1000, usage, str(e), first_chunk_ms)
+        raise
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    _record(caller, elapsed_ms, usage, None, first_chunk_ms)
+    print(
+        f"LLM stream ({caller}): first chunk {first_chunk_ms or 0:.0f}ms, total {elapsed_ms:.0f}ms, "
+        f"prompt_tokens={getattr(usage, 'prompt_tokens', None)}, cached_tokens={_cached_tokens(usage)}, "
+        f"completion_tokens={getattr(usage, 'completion_tokens', None)}"
+    )
+
+
+def chat(messages: List[Dict[str, Any]], api_key: str, **kwargs) -> str:
+    """chat_completion 的简化版本，只返回回复文本"""
+    completion = chat_completion(messages, api_key, **kwargs)
+    return completion.choices[0].message.content or ""
+
+
+def get_llm_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    按调用方汇总的调用次数、失败数、平均/最大耗时、流式调用的平均首 chunk 延迟、token 用量
+    和前缀缓存命中率 (cached_tokens / prompt_tokens)
+    """
+    with _stats_lock:
+        return {
+            caller: {
+                **stats,
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else 0.0,
+                "avg_first_chunk_ms": round(stats["total_first_chunk_ms"] / stats["streams"], 1) if stats["streams"] else 0.0,
+                "cache_hit_rate": round(stats["cached_tokens"] / stats["prompt_tokens"], 3) if stats["prompt_tokens"] else 0.0
+            }
+            for caller, stats in _stats.items()
+        }
+
+
+def reset_llm_stats() -> None:
+    """清空统计"""
+    with _stats_lock:
+        _stats.clear()
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+房源工具层压测
+用 N 个并发会话（线程）反复调用 agent 的工具函数：单页搜索、翻页遍历、多区域分析，
+统计吞吐量和每种操作的 p50/p95/p99 延迟、失败数，以及实际发往后端的请求数和重试次数。
+默认在进程内启动 mock_property_api 作为后端，也可以用 --url 指向已有服务。
+
+示例：python load_test.py --sessions 16 --requests 20 --latency-ms 80 --error-rate 0.02
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+# 每个会话按权重随机选择操作
+OPERATION_WEIGHTS = {"search": 0.6, "paginate": 0.25, "analyze": 0.15}
+ROOM_TYPES = [None, "studio", "1bedroom", "2bedroom", "3bedroom"]
+
+
+def build_operations(function) -> Dict[str, Callable[[random.Random], Dict[str, Any]]]:
+    """每种操作：接收会话的随机数生成器，调用对应工具并返回结果字典"""
+    regions = list("abcdefgh")
+
+    def search(rng: random.Random) -> Dict[str, Any]:
+        min_price = rng.choice([None, 300, 400, 500])
+        return function.search_properties(
+            min_price=min_price,
+            max_price=rng.choice([None, 700, 900, 1200]),
+            max_commute_time=rng.choice([None, 20, 30, 45, 60]),
+            regions=rng.choice([None] + regions),
+            room_type=rng.choice(ROOM_TYPES),
+            page=rng.randint(1, 3)
+        )
+
+    def paginate(rng: random.Random) -> Dict[str, Any]:
+        try:
+            count = sum(1 for _ in function.iter_properties(
+                regions=rng.choice(regions),
+                max_price=rng.choice([None, 900, 1200]),
+                page_size=50,
+                max_items=300
+            ))
+        except function.PropertySearchError as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "count": count}
+
+    def analyze(rng: random.Random) -> Dict[str, Any]:
+        result = function.analyze_properties_by_region(
+            regions=",".join(rng.sample(regions, 3)),
+            room_type=rng.choice(ROOM_TYPES)
+        )
+        if result.get("success") and result.get("failed_regions"):
+            return {"success": False, "error": f"failed regions: {result['failed_regions']}"}
+        return result
+
+    return {"search": search, "paginate": paginate, "analyze": analyze}
+
+
+def run_session(session_id: int, requests: int, seed: int, operations) -> List[Tuple[str, float, bool]]:
+    """单个会话顺序执行 requests 次操作，返回 (操作名, 耗时毫秒, 是否成功) 列表"""
+    rng = random.Random(seed * 100003 + session_id)
+    names = list(OPERATION_WEIGHTS)
+    weights = [OPERATION_WEIGHTS[name] for name in names]
+    samples = []
+    for _ in range(requests):
+        name = rng.choices(names, weights=weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = bool(operations[name](rng).get("success"))
+        except Exception as e:
+            print(f"Session {session_id} {name} raised: {e}")
+            ok = False
+        samples.append((name, (time.perf_counter() - start) * 1000, ok))
+    return samples
+
+
+def summarize(samples: List[Tuple[str, float, bool]], elapsed: float) -> Dict[str, Any]:
+    """按操作汇总延迟分位数和失败数"""
+    report: Dict[str, Any] = {
+        "requests": len(samples),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0,
+        "operations": {}
+    }
+    for name in ["all"] + list(OPERATION_WEIGHTS):
+        latencies = np.array([ms for op, ms, _ in samples if name == "all" or op == name])
+        if latencies.size == 0:
+            continue
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        report["operations"][name] = {
+            "count": int(latencies.size),
+            "errors": sum(1 for op, _, ok in samples if (name == "all" or op == name) and not ok),
+            "mean_ms": round(float(latencies.mean()), 1),
+            "p50_ms": round(float(p50), 1),
+            "p95_ms": round(float(p95), 1),
+            "p99_ms": round(float(p99), 1)
+        }
+    return report
+
+
+def print_report(report: Dict[str, Any], backend: Dict[str, Any]) -> None:
+    print(f"\n{report['requests']} operations in {report['seconds']}s, throughput {report['throughput_rps']} ops/s")
+    print(f"{'operation':<10}{'count':>7}{'errors':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, stats in report["operations"].items():
+        print(
+            f"{name:<10}{stats['count']:>7}{stats['errors']:>8}{stats['mean_ms']:>10}"
+            f"{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}"
+        )
+    print(f"backend calls: {backend['calls']}, retries: {backend['retries']}, failed calls: {backend['failed']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Load test the property tool layer")
+    parser.add_argument("--sessions", type=int, default=8, help="并发会话数")
+    parser.add_argument("--requests", type=int, default=20, help="每个会话的操作数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", default=None, help="已有的搜索接口 URL；不指定时在进程内启动模拟服务")
+    parser.add_argument("--latency-ms", type=float, default=50, help="模拟服务的平均延迟")
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="启用搜索结果缓存（默认关闭，测量后端路径）")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        from mock_property_api import start_mock_server
+        server, url = start_mock_server(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            error_rate=args.error_rate,
+            seed=args.seed
+        )
+        print(f"Started mock property API at {url}")
+    # property_api / search_cache 在导入时读取配置，必须先设置环境变量
+    os.environ["PROPERTY_API_URL"] = url
+    if not args.cache:
+        os.environ["SEARCH_CACHE_SIZE"] = "0"
+
+    import function
+    import property_api
+
+    backend = {"calls": 0, "retries": 0, "failed": 0}
+    backend_lock = threading.Lock()
+
+    def record(metrics: Dict[str, Any]) -> None:
+        with backend_lock:
+            backend["calls"] += 1
+            backend["retries"] += metrics["attempts"] - 1
+            if metrics["error"] or metrics["status"] != 200:
+                backend["failed"] += 1
+
+    property_api.add_metrics_hook(record)
+    operations = build_operations(function)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="load-session") as pool:
+        futures = [
+            pool.submit(run_session, session_id, args.requests, args.seed, operations)
+            for session_id in range(args.sessions)
+        ]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - start
+    property_api.remove_metrics_hook(record)
+
+    print_report(summarize(samples, elapsed), backend)
+    if server is not None:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+房源搜索后端 /properties/search 的本地模拟服务
+按 (随机种子, 目标学校, 区域) 确定性地生成合成房源：租金按房型对数正态分布，通勤时间按区域远近伽马分布，
+同样的请求每次返回同样的结果。可以配置响应延迟和错误注入（503 / 500），
+用于在没有线上后端的情况下运行 search_properties、区域分析和 load_test.py。
+
+启动：python mock_property_api.py --port 3201 --latency-ms 80 --error-rate 0.02
+然后设置 PROPERTY_API_URL=http://127.0.0.1:3201/properties/search
+"""
+
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_SCHOOL = "University of New South Wales"
+# 区域代码 -> (suburb 列表, 到学校的平均通勤分钟数)
+REGIONS: Dict[str, Tuple[List[str], float]] = {
+    "a": (["kensington", "kingsford", "randwick"], 15),
+    "b": (["zetland", "waterloo", "redfern"], 25),
+    "c": (["maroubra", "coogee", "clovelly"], 25),
+    "d": (["mascot", "rosebery", "eastlakes"], 30),
+    "e": (["sydney", "ultimo", "haymarket"], 35),
+    "f": (["bondi", "bondi junction", "paddington"], 35),
+    "g": (["hurstville", "rockdale", "kogarah"], 50),
+    "h": (["burwood", "strathfield", "ashfield"], 60)
+}
+# 卧室数 -> (周租金中位数, 对数标准差)
+PRICE_MODEL = {0: (480, 0.18), 1: (620, 0.2), 2: (850, 0.22), 3: (1150, 0.25)}
+BEDROOM_WEIGHTS = [0.2, 0.35, 0.3, 0.15]
+
+
+@lru_cache(maxsize=256)
+def generate_listings(region: str, school: str, count: int, seed: int) -> Tuple[Dict[str, Any], ...]:
+    """确定性地生成某区域的合成房源（按学校区分通勤时间）"""
+    rng = random.Random(zlib.crc32(f"{seed}|{school}|{region}".encode("utf-8")))
+    suburbs, commute_mean = REGIONS.get(region, ([region], 45))
+    listings = []
+    for i in range(count):
+        bedrooms = rng.choices(range(4), weights=BEDROOM_WEIGHTS)[0]
+        median, sigma = PRICE_MODEL[bedrooms]
+        suburb = rng.choice(suburbs)
+        # 伽马分布：均值为 commute_mean，右侧长尾
+        commute = max(5, round(rng.gammavariate(4, commute_mean / 4)))
+        listings.append({
+            "id": f"{region}-{i}",
+            "addressLine1": f"{rng.randint(1, 300)} {rng.choice(['High', 'Anzac', 'King', 'Botany', 'Elizabeth'])} Street",
+            "addressLine2": suburb.title(),
+            "suburb": suburb,
+            "region": region,
+            "pricePerWeek": int(round(median * rng.lognormvariate(0, sigma), -1)),
+            "bedroomCount": bedrooms,
+            "bathroomCount": 1 if bedrooms < 2 else rng.choice([1, 2]),
+            "commuteTime": commute
+        })
+    return tuple(listings)
+
+
+def search_listings(payload: Dict[str, Any], listings_per_region: int = 400, seed: int = 0) -> Dict[str, Any]:
+    """按请求体过滤、排序、分页，返回与线上后端相同结构的结果"""
+    school = payload.get("targetSchool", DEFAULT_SCHOOL)
+    regions = [r.strip().lower() for r in str(payload.get("regions") or ",".join(REGIONS)).split(",") if r.strip()]
+    bounds = [
+        ("pricePerWeek", "minPrice", "maxPrice"),
+        ("bedroomCount", "minBedrooms", "maxBedrooms"),
+        ("bathroomCount", "minBathrooms", "maxBathrooms"),
+        ("commuteTime", "minCommuteTime", "maxCommuteTime")
+    ]
+    matched = []
+    for region in regions:
+        for prop in generate_listings(region, school, listings_per_region, seed):
+            if all(
+                (payload.get(low) is None or prop[field] >= payload[low])
+                and (payload.get(high) is None or prop[field] <= payload[high])
+                for field, low, high in bounds
+            ):
+                matched.append(prop)
+    matched.sort(key=lambda prop: (prop["pricePerWeek"], prop["id"]))
+
+    page = int(payload.get("page", 1))
+    page_size = int(payload.get("pageSize", 10))
+    suburb_counts: Dict[str, int] = {}
+    for prop in matched:
+        suburb_counts[prop["suburb"]] = suburb_counts.get(prop["suburb"], 0) + 1
+    top_regions = sorted(suburb_counts.items(), key=lambda item: -item[1])[:5]
+    return {
+        "properties": matched[(page - 1) * page_size:page * page_size],
+        "totalCount": len(matched),
+        "filteredCount": len(matched),
+        "averagePrice": round(sum(p["pricePerWeek"] for p in matched) / len(matched), 2) if matched else 0,
+        "averageCommuteTime": round(sum(p["commuteTime"] for p in matched) / len(matched), 2) if matched else 0,
+        "topRegions": [{"region": name, "count": count} for name, count in top_regions]
+    }
+
+
+class MockPropertyAPIServer(ThreadingHTTPServer):
+    """
+    模拟服务，配置保存在 server 上供请求处理器读取。
+
+    Args:
+        latency_ms: 每个请求的平均附加延迟
+        jitter_ms: 延迟的随机浮动范围 (±)
+        error_rate: 返回错误的概率，其中一半为 503（客户端会重试），一半为 500
+        listings_per_region: 每个区域生成的房源数
+        seed: 数据和错误注入的随机种子
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 listings_per_region: int = 400, seed: int = 0):
+        super().__init__(address, MockPropertyAPIHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.listings_per_region = listings_per_region
+        self.seed = seed
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_fault(self) -> Tuple[float, Optional[int]]:
+        """本次请求的延迟（秒）和注入的错误状态码（None 表示正常）"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            status = None
+            if self._rng.random() < self.error_rate:
+                status = self._rng.choice([503, 500])
+                self.errors += 1
+        return delay, status
+
+
+class MockPropertyAPIHandler(BaseHTTPRequestHandler):
+    server: MockPropertyAPIServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok", "requests": self.server.requests, "errors": self.server.errors})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/properties/search":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": "invalid json"})
+            return
+        delay, status = self.server.next_fault()
+        time.sleep(delay)
+        if status is not None:
+            self._send_json(status, {"error": "injected failure"})
+            return
+        self._send_json(200, search_listings(payload, self.server.listings_per_region, self.server.seed))
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **options) -> Tuple[MockPropertyAPIServer, str]:
+    """在后台线程启动模拟服务，port 为 0 时自动分配，返回 (server, 搜索接口 URL)"""
+    server = MockPropertyAPIServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="mock-property-api", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/properties/search"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Local stand-in for the property search API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3201)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--listings-per-region", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockPropertyAPIServer(
+        (args.host, args.port),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        listings_per_region=args.listings_per_region,
+        seed=args.seed
+    )
+    print(f"Mock property API listening on http://{args.host}:{server.server_address[1]}/properties/search")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
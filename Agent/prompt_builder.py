@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+按 token 预算组装 agent 的提示词
+- token 数用嵌入模型 (Qwen3-Embedding) 的分词器计算，与 Qwen 对话模型同一词表；分词器不可用时按字符估算
+- 对话历史只以消息形式出现一次，超出预算时从最早的轮次开始淘汰
+- 检索上下文按检索排名（得分从高到低）依次放入，放不下的低分分块被丢弃
+每次组装返回估算的 prompt token 数和淘汰情况，供日志和界面展示。
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "3000"))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2500"))
+# 每条消息的角色标记等固定开销
+MESSAGE_OVERHEAD_TOKENS = 4
+CHUNK_SEPARATOR = "\n---\n"
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """嵌入模型的分词器（随共享嵌入模型加载），不可用时返回 None"""
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        with _tokenizer_lock:
+            if not _tokenizer_loaded:
+                try:
+                    import resources
+
+                    _tokenizer = resources.get_embed_model().underlying.client.tokenizer
+                except Exception as e:
+                    print(f"Tokenizer unavailable, estimating prompt tokens by characters: {e}")
+                    _tokenizer = None
+                _tokenizer_loaded = True
+    return _tokenizer
+
+
+def _estimate_tokens(text: str) -> int:
+    """没有分词器时的估算：中日韩字符约 1 token/字，其他约 4 字符/token"""
+    cjk = sum(1 for char in text if '\u3040' <= char <= '\u9fff' or '\uac00' <= char <= '\ud7af')
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """文本的 token 数"""
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return _estimate_tokens(text)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def message_tokens(messages: Sequence[Dict[str, Any]]) -> int:
+    """消息列表的 token 数（含每条消息的固定开销）"""
+    return sum(count_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断文本使其不超过 max_tokens"""
+    if max_tokens <= 0:
+        return ""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        # 二分查找不超过预算的最长前缀
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if _estimate_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+    ids = tokenizer.encode(text, add_special_tokens=False)
+    if len(ids) <= max_tokens:
+        return text
+    return tokenizer.decode(ids[:max_tokens])
+
+
+def fit_chunks(chunks: Sequence[str], budget: int) -> Tuple[List[str], int]:
+    """
+    按排名依次放入检索分块，直到超出预算。
+    第一个分块单独就超出预算时截断后保留，保证至少有一段上下文。
+
+    Returns:
+        (保留的分块, 使用的 token 数)
+    """
+    kept: List[str] = []
+    used = 0
+    separator_tokens = count_tokens(CHUNK_SEPARATOR)
+    for chunk in chunks:
+        tokens = count_tokens(chunk) + (separator_tokens if kept else 0)
+        if used + tokens > budget:
+            if not kept and budget > 0:
+                chunk = truncate_to_tokens(chunk, budget)
+                kept.append(chunk)
+                used = count_tokens(chunk)
+            break
+        kept.append(chunk)
+        used += tokens
+    return kept, used
+
+
+def fit_history(history: Sequence[Tuple[str, str]], budget: int) -> Tuple[List[Tuple[str, str]], int]:
+    """
+    从最新的消息往前保留对话历史，直到超出预算；保留部分不以助手消息开头。
+
+    Returns:
+        (保留的历史, 使用的 token 数)
+    """
+    kept: List[Tuple[str, str]] = []
+    used = 0
+    for role, content in reversed(history):
+        tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        if used + tokens > budget:
+            break
+        kept.append((role, content))
+        used += tokens
+    kept.reverse()
+    while kept and kept[0][0] != "user":
+        used -= count_tokens(kept[0][1]) + MESSAGE_OVERHEAD_TOKENS
+        kept.pop(0)
+    return kept, used
+
+
+def build_messages(
+    system_content: str,
+    history: Sequence[Tuple[str, str]],
+    render_prompt: Callable[[str], str],
+    chunks: Sequence[str],
+    budget: int = PROMPT_TOKEN_BUDGET,
+    rag_budget: int = RAG_TOKEN_BUDGET,
+    history_budget: int = HISTORY_TOKEN_BUDGET
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    在总预算内组装消息：系统提示 + 历史消息 + 用户提示（render_prompt(检索上下文)）。
+    检索上下文优先于较早的对话历史。
+
+    Returns:
+        (messages, 统计字典：prompt_tokens、保留/淘汰的历史消息数和检索分块数，
+         以及实际放入提示词的分块 kept_chunks)
+    """
+    fixed = message_tokens([
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": render_prompt("")}
+    ])
+    available = max(budget - fixed, 0)
+    context_chunks, rag_used = fit_chunks(chunks, min(rag_budget, available))
+    kept_history, _ = fit_history(history, min(history_budget, available - rag_used))
+
+    messages = [{"role": "system", "content": system_content}]
+    messages.extend({"role": role, "content": content} for role, content in kept_history)
+    messages.append({"role": "user", "content": render_prompt(CHUNK_SEPARATOR.join(context_chunks))})
+    stats = {
+        "prompt_tokens": message_tokens(messages),
+        "budget": budget,
+        "history_kept": len(kept_history),
+        "history_evicted": len(history) - len(kept_history),
+        "chunks_kept": len(context_chunks),
+        "chunks_dropped": len(chunks) - len(context_chunks),
+        "kept_chunks": context_chunks
+    }
+    return messages, stats
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+房源搜索后端 (:3201) 的 HTTP 客户端
+进程内共用一个带连接池的 requests.Session（keep-alive），连接/读取超时分开配置，
+对连接错误、超时和 429/502/503/504 做带随机抖动的指数退避重试（搜索是只读请求，可安全重试）。
+全局信号量限制同时在途的请求数，每次调用的耗时通过 metrics hook 上报。
+async_post_search 为 asyncio 版本：每个事件循环共用一个 httpx.AsyncClient，
+未安装 httpx 时退回到在线程中调用 post_search。
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import weakref
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+PROPERTY_API_URL = os.getenv("PROPERTY_API_URL", "http://139.180.164.78:3201/properties/search")
+PROPERTY_API_POOL_SIZE = int(os.getenv("PROPERTY_API_POOL_SIZE", "10"))
+PROPERTY_API_CONNECT_TIMEOUT = float(os.getenv("PROPERTY_API_CONNECT_TIMEOUT", "5"))
+PROPERTY_API_READ_TIMEOUT = float(os.getenv("PROPERTY_API_READ_TIMEOUT", "30"))
+PROPERTY_API_RETRIES = int(os.getenv("PROPERTY_API_RETRIES", "2"))
+PROPERTY_API_BACKOFF = float(os.getenv("PROPERTY_API_BACKOFF", "0.5"))
+# 整个进程同时发往后端的最大请求数，所有线程共享
+PROPERTY_API_MAX_CONCURRENCY = int(os.getenv("PROPERTY_API_MAX_CONCURRENCY", "8"))
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_concurrency = threading.BoundedSemaphore(PROPERTY_API_MAX_CONCURRENCY)
+_metrics_hooks: List[Callable[[Dict[str, Any]], None]] = []
+# 事件循环 -> (httpx.AsyncClient, asyncio.Semaphore)；AsyncClient 不能跨事件循环使用
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+# 同步和异步请求可能抛出的网络异常
+NETWORK_ERRORS = (requests.RequestException,) + ((httpx.HTTPError,) if httpx is not None else ())
+
+
+def get_session() -> requests.Session:
+    """获取共享的连接池 Session，首次调用时创建"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                # 重试由 post_search 自己处理，这里不让 urllib3 再重试
+                adapter = HTTPAdapter(
+                    pool_connections=PROPERTY_API_POOL_SIZE,
+                    pool_maxsize=PROPERTY_API_POOL_SIZE,
+                    max_retries=0
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+                _session = session
+    return _session
+
+
+def add_metrics_hook(hook: Callable[[Dict[str, Any]], None]) -> None:
+    """
+    注册指标回调，每次调用结束（含重试）后以字典调用：
+    url, status（失败时为 None）, elapsed_ms, attempts, error
+    """
+    _metrics_hooks.append(hook)
+
+
+def remove_metrics_hook(hook: Callable[[Dict[str, Any]], None]) -> None:
+    """移除指标回调"""
+    if hook in _metrics_hooks:
+        _metrics_hooks.remove(hook)
+
+
+def emit_metrics(metrics: Dict[str, Any]) -> None:
+    """把一次调用的指标交给所有回调，回调出错不影响请求"""
+    for hook in list(_metrics_hooks):
+        try:
+            hook(metrics)
+        except Exception as e:
+            print(f"Property API metrics hook failed: {e}")
+
+
+def backoff_delay(attempt: int, base: float = PROPERTY_API_BACKOFF) -> float:
+    """第 attempt 次重试前的等待时间：指数退避乘以 0.5~1.5 的随机抖动"""
+    return base * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def post_search(
+    payload: Dict[str, Any],
+    url: str = PROPERTY_API_URL,
+    retries: int = PROPERTY_API_RETRIES,
+    timeout: Optional[tuple] = None
+) -> requests.Response:
+    """
+    发送搜索请求，遇到可重试的错误时退避重试。
+
+    Returns:
+        最后一次请求的响应（可能是非 200 状态）
+
+    Raises:
+        requests.RequestException: 重试用尽后仍然网络错误
+    """
+    timeout = timeout or (PROPERTY_API_CONNECT_TIMEOUT, PROPERTY_API_READ_TIMEOUT)
+    data = json.dumps(payload)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            # 退避等待期间不占用并发名额
+            with _concurrency:
+                response = get_session().post(url, data=data, timeout=timeout)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                emit_metrics({
+                    "url": url,
+                    "status": response.status_code,
+                    "elapsed_ms": (time.perf_counter() - start) * 1000,
+                    "attempts": attempt + 1,
+                    "error": None
+                })
+                return response
+        except requests.RequestException as e:
+            retryable = isinstance(e, (requests.ConnectionError, requests.Timeout))
+            if not retryable or attempt >= retries:
+                emit_metrics({
+                    "url": url,
+                    "status": None,
+                    "elapsed_ms": (time.perf_counter() - start) * 1000,
+                    "attempts": attempt + 1,
+                    "error": str(e)
+                })
+                raise
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+def _get_async_client():
+    """获取当前事件循环共用的 AsyncClient 和并发信号量"""
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=PROPERTY_API_POOL_SIZE,
+                max_keepalive_connections=PROPERTY_API_POOL_SIZE
+            ),
+            timeout=httpx.Timeout(PROPERTY_API_READ_TIMEOUT, connect=PROPERTY_API_CONNECT_TIMEOUT),
+            headers={"Content-Type": "application/json"}
+        )
+        entry = (client, asyncio.Semaphore(PROPERTY_API_MAX_CONCURRENCY))
+        _async_clients[loop] = entry
+    return entry
+
+
+async def async_post_search(
+    payload: Dict[str, Any],
+    url: str = PROPERTY_API_URL,
+    retries: int = PROPERTY_API_RETRIES
+):
+    """
+    post_search 的异步版本，重试和指标上报规则相同。
+    返回的响应同样提供 status_code / json() / text。
+    """
+    if httpx is None:
+        return await asyncio.to_thread(post_search, payload, url, retries)
+
+    client, semaphore = _get_async_client()
+    data = json.dumps(payload)
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        try:
+            async with semaphore:
+                response = await client.post(url, content=data)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                emit_metrics({
+                    "url": url,
+                    "status": response.status_code,
+                    "elapsed_ms": (time.perf_counter() - start) * 1000,
+                    "attempts": attempt + 1,
+                    "error": None
+                })
+                return response
+        except httpx.HTTPError as e:
+            if not isinstance(e, httpx.TransportError) or attempt >= retries:
+                emit_metrics({
+                    "url": url,
+                    "status": None,
+                    "elapsed_ms": (time.perf_counter() - start) * 1000,
+                    "attempts": attempt + 1,
+                    "error": str(e)
+                })
+                raise
+        await asyncio.sleep(backoff_delay(attempt))
+        attempt += 1
+
+
+async def aclose_async_client() -> None:
+    """关闭当前事件循环的 AsyncClient（服务退出时调用）"""
+    entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[0].aclose()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+房源结果集的列式表示
+把 search_properties 返回的 properties 列表一次性转换为 numpy 数组（价格、卧室、卫生间、通勤时间、区域编码），
+之后的分组统计、分位数、每卧室价格、价格直方图都在数组上向量化计算，
+报告摘要、agent 的查询结果摘要和区域分析都基于它，结果集达到上千套房源时也不需要逐条遍历字典。
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 分组时使用的列
+GROUP_COLUMNS = ("room_type", "suburb")
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value) if value is not None and value != "" else np.nan
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def room_type_label(bedrooms: int, bathrooms: int) -> str:
+    """房型标签，与区域分析中的格式一致，例如 2室1卫"""
+    return f"{bedrooms}室{bathrooms}卫"
+
+
+class PropertyFrame:
+    """
+    房源列式结果集。
+
+    Attributes:
+        price: 周租金，缺失为 NaN
+        bedrooms / bathrooms: 卧室/卫生间数，缺失为 0
+        has_rooms: 是否同时给出了卧室和卫生间数
+        commute_time: 通勤时间（分钟），缺失为 NaN
+        suburb_codes: suburb 在 suburb_names 中的下标，缺失为 -1
+    """
+
+    def __init__(self, properties: Iterable[Dict[str, Any]]):
+        self.properties: List[Dict[str, Any]] = list(properties)
+        props = self.properties
+        self.price = np.array([_number(p.get("pricePerWeek")) for p in props], dtype=float)
+        self.bedrooms = np.array([p.get("bedroomCount") or 0 for p in props], dtype=np.int64)
+        self.bathrooms = np.array([p.get("bathroomCount") or 0 for p in props], dtype=np.int64)
+        self.has_rooms = np.array(
+            [p.get("bedroomCount") is not None and p.get("bathroomCount") is not None for p in props], dtype=bool
+        )
+        self.commute_time = np.array([_number(p.get("commuteTime")) for p in props], dtype=float)
+        suburbs = np.array([str(p.get("suburb") or "").lower() for p in props], dtype=object)
+        if len(props):
+            names, codes = np.unique(suburbs, return_inverse=True)
+        else:
+            names, codes = np.array([], dtype=object), np.array([], dtype=np.int64)
+        # 空字符串排在最前面，整体减一后缺失的 suburb 编码为 -1
+        if len(names) and names[0] == "":
+            names, codes = names[1:], codes - 1
+        self.suburb_names: List[str] = [str(name) for name in names]
+        self.suburb_codes = codes.astype(np.int64)
+
+    @classmethod
+    def from_results(cls, results: Iterable[Dict[str, Any]]) -> "PropertyFrame":
+        """合并多个 search_properties 结果（只取成功结果中的 properties）"""
+        properties: List[Dict[str, Any]] = []
+        for result in results:
+            if isinstance(result, dict) and result.get("success", True):
+                properties.extend(result.get("properties", []))
+        return cls(properties)
+
+    def __len__(self) -> int:
+        return len(self.properties)
+
+    @property
+    def price_mask(self) -> np.ndarray:
+        """有有效价格（大于 0）的行"""
+        with np.errstate(invalid="ignore"):
+            return self.price > 0
+
+    def prices(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """有效价格，可以再用 mask 过滤行"""
+        valid = self.price_mask if mask is None else self.price_mask & mask
+        return self.price[valid]
+
+    def quantiles(self, qs: Sequence[float], mask: Optional[np.ndarray] = None) -> List[Optional[float]]:
+        """价格分位数 (0 <= q <= 1)，没有价格时返回 None"""
+        prices = self.prices(mask)
+        if prices.size == 0:
+            return [None] * len(qs)
+        return [float(v) for v in np.quantile(prices, qs)]
+
+    def price_summary(self, mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """价格汇总，键与 stats.PriceStats.summary 相同（这里的中位数和 p90 是精确值）"""
+        return self._summarize(self.prices(mask))
+
+    @staticmethod
+    def _summarize(prices: np.ndarray) -> Dict[str, float]:
+        if prices.size == 0:
+            return {"avg_price": 0, "median_price": 0, "p90_price": 0, "min_price": 0, "max_price": 0, "std_price": 0}
+        median, p90 = np.quantile(prices, [0.5, 0.9])
+        return {
+            "avg_price": round(float(prices.mean()), 2),
+            "median_price": round(float(median), 2),
+            "p90_price": round(float(p90), 2),
+            "min_price": round(float(prices.min()), 2),
+            "max_price": round(float(prices.max()), 2),
+            "std_price": round(float(prices.std(ddof=1)), 2) if prices.size > 1 else 0.0
+        }
+
+    def price_per_bedroom(self) -> np.ndarray:
+        """每间卧室的周租金（Studio 按 1 间计），只包含有效价格的行"""
+        valid = self.price_mask
+        return self.price[valid] / np.maximum(self.bedrooms[valid], 1)
+
+    def histogram(self, bins: int = 10, price_range: Optional[Tuple[float, float]] = None) -> Dict[str, list]:
+        """价格直方图，返回各区间的边界和房源数"""
+        counts, edges = np.histogram(self.prices(), bins=bins, range=price_range)
+        return {"edges": edges.round(2).tolist(), "counts": counts.tolist()}
+
+    def _group_codes(self, column: str) -> Tuple[np.ndarray, List[str]]:
+        if column == "room_type":
+            codes = self.bedrooms * 1000 + self.bathrooms
+            unique, inverse = np.unique(codes, return_inverse=True)
+            labels = [room_type_label(int(code) // 1000, int(code) % 1000) for code in unique]
+            return inverse.astype(np.int64), labels
+        if column == "suburb":
+            return self.suburb_codes, self.suburb_names
+        raise ValueError(f"Unknown group column: {column}, expected one of {GROUP_COLUMNS}")
+
+    def groups(self, column: str) -> Iterator[Tuple[str, np.ndarray]]:
+        """按列分组，逐组产出 (标签, 行下标数组)；suburb 缺失的行不参与分组"""
+        if len(self) == 0:
+            return
+        codes, labels = self._group_codes(column)
+        order = np.argsort(codes, kind="stable")
+        sorted_codes = codes[order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        for rows in np.split(order, bounds):
+            code = int(codes[rows[0]])
+            if code >= 0:
+                yield labels[code], rows
+
+    def group_by(self, column: str) -> Dict[str, Dict[str, Any]]:
+        """分组统计：每组的房源数和价格汇总"""
+        valid = self.price_mask
+        return {
+            label: {"count": int(rows.size), **self._summarize(self.price[rows[valid[rows]]])}
+            for label, rows in self.groups(column)
+        }
+
+    def suburbs(self) -> List[str]:
+        """出现过的 suburb（小写，已排序）"""
+        return list(self.suburb_names)
+
+    def room_types(self) -> List[str]:
+        """出现过的房型（只统计卧室和卫生间数都给出的房源，已排序）"""
+        codes = np.unique(self.bedrooms[self.has_rooms] * 1000 + self.bathrooms[self.has_rooms])
+        return sorted(room_type_label(int(code) // 1000, int(code) % 1000) for code in codes)
+
+    def to_dataframe(self):
+        """转换为 pandas DataFrame，便于在 notebook 中做进一步分析"""
+        import pandas as pd
+
+        return pd.DataFrame({
+            "price": self.price,
+            "bedrooms": self.bedrooms,
+            "bathrooms": self.bathrooms,
+            "commute_time": self.commute_time,
+            "suburb": pd.Categorical.from_codes(self.suburb_codes, self.suburb_names)
+        })
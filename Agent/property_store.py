@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+本地房源快照 (SQLite)
+定期从搜索 API 同步房源到本地，search_properties(backend="local") 直接查询本地库，
+毫秒级返回，也可以在没有网络的测试和演示环境中使用。
+通勤时间与目标学校相关，因此每条记录以 (房源ID, 目标学校) 为主键。
+
+同步：python property_store.py sync --regions a,b,c --schools "University of New South Wales" [--interval 3600]
+导入：python property_store.py import properties.json --school "University of New South Wales"
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+PROPERTY_STORE_PATH = os.getenv(
+    "PROPERTY_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "property_store.sqlite")
+)
+DEFAULT_SCHOOL = "University of New South Wales"
+# 同步时每批写入的记录数
+SYNC_BATCH_SIZE = 500
+# topRegions 返回的区域数
+TOP_REGIONS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS properties (
+    property_id TEXT NOT NULL,
+    target_school TEXT NOT NULL,
+    price REAL,
+    bedrooms INTEGER,
+    bathrooms INTEGER,
+    region TEXT,
+    suburb TEXT,
+    commute_time REAL,
+    data TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (property_id, target_school)
+);
+CREATE INDEX IF NOT EXISTS idx_properties_price ON properties (target_school, price);
+CREATE INDEX IF NOT EXISTS idx_properties_rooms ON properties (target_school, bedrooms, bathrooms);
+CREATE INDEX IF NOT EXISTS idx_properties_region ON properties (target_school, region);
+CREATE INDEX IF NOT EXISTS idx_properties_suburb ON properties (target_school, suburb);
+CREATE INDEX IF NOT EXISTS idx_properties_commute ON properties (target_school, commute_time);
+"""
+
+
+def property_id(prop: Dict[str, Any]) -> str:
+    """房源ID：优先使用后端字段，没有时用地址生成稳定ID"""
+    for field in ("id", "houseId", "propertyId"):
+        if prop.get(field) is not None:
+            return str(prop[field])
+    address = f"{prop.get('addressLine1', '')}|{prop.get('addressLine2', '')}".lower()
+    return hashlib.sha1(address.encode("utf-8")).hexdigest()
+
+
+def _to_number(value: Any) -> Optional[float]:
+    try:
+        return float(value) if value is not None and value != "" else None
+    except (TypeError, ValueError):
+        return None
+
+
+class PropertyStore:
+    """SQLite 房源快照，每个线程使用独立连接"""
+
+    def __init__(self, path: str = PROPERTY_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, properties: Iterable[Dict[str, Any]], target_school: str = DEFAULT_SCHOOL, region: Optional[str] = None) -> int:
+        """写入或更新房源，返回写入条数"""
+        now = time.time()
+        rows = [
+            (
+                property_id(prop),
+                target_school,
+                _to_number(prop.get("pricePerWeek")),
+                prop.get("bedroomCount"),
+                prop.get("bathroomCount"),
+                (region or prop.get("region") or "").lower() or None,
+                (prop.get("suburb") or prop.get("addressLine2") or "").lower() or None,
+                _to_number(prop.get("commuteTime")),
+                json.dumps(prop, ensure_ascii=False),
+                now
+            )
+            for prop in properties
+        ]
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO properties "
+                "(property_id, target_school, price, bedrooms, bathrooms, region, suburb, commute_time, data, synced_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+
+    def delete_stale(self, target_school: str, region: str, before: float) -> int:
+        """删除某学校/区域在本次同步中没有再出现的房源"""
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM properties WHERE target_school = ? AND region = ? AND synced_at < ?",
+                (target_school, region.lower(), before)
+            )
+        return cursor.rowcount
+
+    def search(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按 search_properties 构建的请求体查询，返回与后端 /properties/search 相同结构的结果。
+        regions 可以是逗号分隔的区域代码或 suburb 名称。
+        """
+        clauses = ["target_school = ?"]
+        params: List[Any] = [payload.get("targetSchool", DEFAULT_SCHOOL)]
+        ranges = [
+            ("price", "minPrice", "maxPrice"),
+            ("bedrooms", "minBedrooms", "maxBedrooms"),
+            ("bathrooms", "minBathrooms", "maxBathrooms"),
+            ("commute_time", "minCommuteTime", "maxCommuteTime")
+        ]
+        for column, low, high in ranges:
+            if payload.get(low) is not None:
+                clauses.append(f"{column} >= ?")
+                params.append(payload[low])
+            if payload.get(high) is not None:
+                clauses.append(f"{column} <= ?")
+                params.append(payload[high])
+        if payload.get("regions"):
+            regions = [r.strip().lower() for r in str(payload["regions"]).split(",") if r.strip()]
+            marks = ", ".join("?" * len(regions))
+            clauses.append(f"(region IN ({marks}) OR suburb IN ({marks}))")
+            params.extend(regions + regions)
+        where = " AND ".join(clauses)
+
+        page = int(payload.get("page", 1))
+        page_size = int(payload.get("pageSize", 10))
+        conn = self._conn()
+        total, avg_price, avg_commute = conn.execute(
+            f"SELECT COUNT(*), AVG(price), AVG(commute_time) FROM properties WHERE {where}", params
+        ).fetchone()
+        rows = conn.execute(
+            f"SELECT data FROM properties WHERE {where} ORDER BY price, property_id LIMIT ? OFFSET ?",
+            params + [page_size, (page - 1) * page_size]
+        ).fetchall()
+        top_regions = conn.execute(
+            f"SELECT COALESCE(suburb, region) AS name, COUNT(*) AS count FROM properties WHERE {where} "
+            f"GROUP BY name ORDER BY count DESC LIMIT {TOP_REGIONS}",
+            params
+        ).fetchall()
+        return {
+            "properties": [json.loads(row["data"]) for row in rows],
+            "totalCount": total,
+            "filteredCount": total,
+            "averagePrice": round(avg_price, 2) if avg_price is not None else 0,
+            "averageCommuteTime": round(avg_commute, 2) if avg_commute is not None else 0,
+            "topRegions": [{"region": row["name"], "count": row["count"]} for row in top_regions]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """快照概况：总数、每个学校的房源数和最近同步时间"""
+        rows = self._conn().execute(
+            "SELECT target_school, COUNT(*), MAX(synced_at) FROM properties GROUP BY target_school"
+        ).fetchall()
+        return {
+            "path": self.path,
+            "total": sum(row[1] for row in rows),
+            "schools": {row[0]: {"count": row[1], "synced_at": row[2]} for row in rows}
+        }
+
+
+_store: Optional[PropertyStore] = None
+_store_lock = threading.Lock()
+
+
+def get_property_store() -> PropertyStore:
+    """获取进程内共享的本地房源库"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PropertyStore()
+    return _store
+
+
+def sync_snapshot(regions: List[str], schools: List[str], store: Optional[PropertyStore] = None) -> Dict[str, Any]:
+    """
+    从搜索 API 全量同步指定区域和学校的房源，并删除已下架的房源。
+    单个区域失败时保留该区域原有数据。
+    """
+    from function import PropertySearchError, iter_properties
+
+    store = store or get_property_store()
+    stats: Dict[str, Any] = {"synced": 0, "removed": 0, "failed": []}
+    start = time.perf_counter()
+    for school in schools:
+        for region in regions:
+            sync_start = time.time()
+            batch: List[Dict[str, Any]] = []
+            try:
+                for prop in iter_properties(regions=region, target_school=school, page_size=100, backend="remote", use_cache=False):
+                    batch.append(prop)
+                    if len(batch) >= SYNC_BATCH_SIZE:
+                        stats["synced"] += store.upsert(batch, school, region)
+                        batch = []
+                stats["synced"] += store.upsert(batch, school, region)
+            except PropertySearchError as e:
+                print(f"Failed to sync region {region} for {school}: {e}")
+                stats["failed"].append({"school": school, "region": region, "error": str(e)})
+                continue
+            stats["removed"] += store.delete_stale(school, region, sync_start)
+    stats["seconds"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Maintain the local property snapshot")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync_parser = subparsers.add_parser("sync", help="从搜索 API 同步")
+    sync_parser.add_argument("--regions", required=True, help="逗号分隔的区域代码")
+    sync_parser.add_argument("--schools", default=DEFAULT_SCHOOL, help="逗号分隔的目标学校")
+    sync_parser.add_argument("--interval", type=float, default=0, help="大于 0 时每隔多少秒重复同步")
+    import_parser = subparsers.add_parser("import", help="从 JSON 文件导入房源列表（离线演示）")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--school", default=DEFAULT_SCHOOL)
+    import_parser.add_argument("--region", default=None)
+    subparsers.add_parser("stats", help="查看快照概况")
+    args = parser.parse_args()
+
+    store = get_property_store()
+    if args.command == "import":
+        with open(args.file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        properties = data.get("properties", []) if isinstance(data, dict) else data
+        print(f"Imported {store.upsert(properties, args.school, args.region)} properties into {store.path}")
+    elif args.command == "sync":
+        regions = [r.strip() for r in args.regions.split(",") if r.strip()]
+        schools = [s.strip() for s in args.schools.split(",") if s.strip()]
+        while True:
+            print(f"Sync finished: {sync_snapshot(regions, schools, store)}")
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
+    print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,163 +1,350 @@
 import os
-import pandas as pd
-from huggingface_hub import snapshot_download
-from langchain.document_loaders import TextLoader, PyPDFLoader, CSVLoader
+import json
+import time
+import hashlib
+import argparse
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import FAISS
 
-# 嵌入模型配置（示例使用 Qwen-Embedding）
-EMBEDDING_REPO = "qwen/Qwen3-Embedding-0.6B"
-EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+from resources import get_embed_model
+from ingest import INGEST_WORKERS, iter_source_files, load_files_parallel, format_timings
+from batch_embedder import EMBED_BATCH_SIZE, EMBED_TOKENIZER_WORKERS, embed_texts_batched
+from chunk_store import load_vector_store, save_vector_store
+from sparse_index import write_sparse_index
+from faiss_index import FAISS_INDEX_SPEC, build_index, configure_search, describe_index, resolve_spec, to_flat
 
-# 下载并初始化嵌入模型
-print(f"Downloading embedding model {EMBEDDING_REPO}...")
-model_path = snapshot_download(repo_id=EMBEDDING_REPO)
-print(f"Embedding model downloaded to: {model_path}")
-embed_model = HuggingFaceEmbeddings(
-    model_name=model_path,
-    model_kwargs={"device": EMBEDDING_DEVICE}
-)
 
-
-def load_documents(sources: list[str]) -> list[Document]:
+def load_documents(sources: list[str], max_workers: int | None = INGEST_WORKERS) -> list[Document]:
     """
     加载指定路径下的文档，支持目录 (.txt/.md/.pdf/.csv/.xlsx) 和单文件。
-    返回 Document 列表。
+    文件在进程池中并行加载，返回过滤掉空内容后的 Document 列表。
     """
-    docs: list[Document] = []
-    for src in sources:
-        print(f"Processing source: {src}")
-        
-        # 检查文件是否存在
-        if not os.path.exists(src):
-            print(f"Warning: File/directory not found: {src}")
-            continue
-            
-        if os.path.isdir(src):
-            for root, _, files in os.walk(src):
-                for fn in files:
-                    path = os.path.join(root, fn)
-                    ext = os.path.splitext(fn)[1].lower()
-                    try:
-                        if ext in ['.txt', '.md']:
-                            loaded_docs = TextLoader(path).load()
-                            docs.extend(loaded_docs)
-                            print(f"Loaded {len(loaded_docs)} documents from {path}")
-                        elif ext == '.pdf':
-                            loaded_docs = PyPDFLoader(path).load()
-                            docs.extend(loaded_docs)
-                            print(f"Loaded {len(loaded_docs)} documents from {path}")
-                        elif ext == '.csv':
-                            loaded_docs = CSVLoader(path).load()
-                            docs.extend(loaded_docs)
-                            print(f"Loaded {len(loaded_docs)} documents from {path}")
-                        elif ext in ['.xlsx', '.xls']:
-                            df = pd.read_excel(path)
-                            for _, row in df.iterrows():
-                                docs.append(Document(
-                                    page_content=str(row.to_dict()),
-                                    metadata={'source': path}
-                                ))
-                            print(f"Loaded {len(df)} documents from {path}")
-                    except Exception as e:
-                        print(f"Error loading {path}: {e}")
-                        continue
-        elif os.path.isfile(src):
-            ext = os.path.splitext(src)[1].lower()
-            try:
-                if ext in ['.txt', '.md']:
-                    loaded_docs = TextLoader(src).load()
-                    docs.extend(loaded_docs)
-                    print(f"Loaded {len(loaded_docs)} documents from {src}")
-                elif ext == '.pdf':
-                    loaded_docs = PyPDFLoader(src).load()
-                    docs.extend(loaded_docs)
-                    print(f"Loaded {len(loaded_docs)} documents from {src}")
-                elif ext == '.csv':
-                    loaded_docs = CSVLoader(src).load()
-                    docs.extend(loaded_docs)
-                    print(f"Loaded {len(loaded_docs)} documents from {src}")
-                elif ext in ['.xlsx', '.xls']:
-                    df = pd.read_excel(src)
-                    for _, row in df.iterrows():
-                        docs.append(Document(
-                            page_content=str(row.to_dict()),
-                            metadata={'source': src}
-                        ))
-                    print(f"Loaded {len(df)} documents from {src}")
-            except Exception as e:
-                print(f"Error loading {src}: {e}")
-                continue
-                
-    # 过滤掉空内容的文档
-    filtered_docs = []
-    for doc in docs:
-        if doc.page_content and doc.page_content.strip():
-            filtered_docs.append(doc)
-        else:
-            print(f"Skipping empty document from {doc.metadata.get('source', 'unknown')}")
+    start = time.perf_counter()
+    paths = iter_source_files(sources)
+    discover_seconds = time.perf_counter() - start
+    
+    by_file, timings = load_files_parallel(paths, max_workers=max_workers)
+    print(f"Ingestion timings: discover {discover_seconds:.2f}s, {format_timings(timings)}")
     
-    return filtered_docs
+    docs: list[Document] = []
+    for path in paths:
+        docs.extend(by_file.get(path, []))
+    return docs
 
 
-def build_vector_store(docs: list[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> FAISS:
+def split_documents(docs: list[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> list[Document]:
     """
-    将文档分块，生成嵌入并构建 FAISS 向量库存储。
+    将文档分块，并过滤掉没有内容的分块。
     """
-    if not docs:
-        raise ValueError("No documents provided. Cannot build vector store with empty document list.")
-    
-    print(f"Building vector store with {len(docs)} documents...")
-    
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap
     )
     chunks = splitter.split_documents(docs)
     
-    if not chunks:
-        raise ValueError("No chunks created from documents. Documents may be empty or too short.")
-    
-    print(f"Created {len(chunks)} chunks from documents")
-    
     # 验证chunks是否有内容
     valid_chunks = []
     for chunk in chunks:
         if chunk.page_content and chunk.page_content.strip():
             valid_chunks.append(chunk)
+    return valid_chunks
+
+
+def embed_chunks(
+    chunks: list[Document],
+    batch_size: int = EMBED_BATCH_SIZE,
+    tokenizer_workers: int = EMBED_TOKENIZER_WORKERS
+) -> tuple[list[tuple[str, list[float]]], dict]:
+    """批量生成分块嵌入，返回 ((文本, 向量) 列表, 吞吐统计)，前者可直接交给 FAISS.from_embeddings"""
+    texts = [chunk.page_content for chunk in chunks]
+    vectors, stats = embed_texts_batched(get_embed_model(), texts, batch_size, tokenizer_workers)
+    print(
+        f"Embedded {stats['embedded']} chunks in {stats['batches']} batches "
+        f"({stats['cached']} from cache), {stats['chunks_per_sec']:.1f} chunks/sec"
+    )
+    return list(zip(texts, vectors.tolist())), stats
+
+
+def build_vector_store(docs: list[Document], chunk_size: int = 1000, chunk_overlap: int = 200) -> FAISS:
+    """
+    将文档分块，生成嵌入并构建 FAISS 向量库存储。
+    """
+    if not docs:
+        raise ValueError("No documents provided. Cannot build vector store with empty document list.")
+    
+    print(f"Building vector store with {len(docs)} documents...")
+    
+    valid_chunks = split_documents(docs, chunk_size, chunk_overlap)
     
     if not valid_chunks:
         raise ValueError("No valid chunks with content found.")
     
     print(f"Using {len(valid_chunks)} valid chunks for vector store")
     
-    faiss_index = FAISS.from_documents(valid_chunks, embed_model)
+    text_embeddings, _ = embed_chunks(valid_chunks)
+    faiss_index = FAISS.from_embeddings(
+        text_embeddings,
+        get_embed_model(),
+        metadatas=[chunk.metadata for chunk in valid_chunks],
+        ids=assign_chunk_ids(valid_chunks)
+    )
     return faiss_index
 
 
+# ---------------------------------------------------------------------------
+# 增量构建：manifest 记录每个文件的内容哈希和每个分块的哈希，
+# 只对新增/变化的分块做嵌入，删除已不存在的分块向量
+# ---------------------------------------------------------------------------
+
+MANIFEST_FILENAME = "index_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容的 SHA-256 哈希"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def assign_chunk_ids(chunks: list[Document]) -> list[str]:
+    """
+    为分块生成稳定的ID：由来源文件、页码和分块文本决定。
+    同一页内重复的文本按出现顺序区分，保证ID唯一。
+    """
+    ids = []
+    seen: dict[str, int] = {}
+    for chunk in chunks:
+        key = json.dumps(
+            [chunk.metadata.get("source"), chunk.metadata.get("page"), chunk.page_content],
+            ensure_ascii=False
+        )
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ids.append(hashlib.sha256(f"{key}\0{occurrence}".encode("utf-8")).hexdigest())
+    return ids
+
+
+def load_manifest(index_path: str) -> dict | None:
+    """读取索引目录下的 manifest，不存在或格式不符时返回 None"""
+    manifest_path = os.path.join(index_path, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Unable to read manifest {manifest_path}: {e}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(index_path: str, manifest: dict) -> None:
+    """原子写入 manifest"""
+    manifest_path = os.path.join(index_path, MANIFEST_FILENAME)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def update_vector_store(
+    sources: list[str],
+    index_path: str,
+    chunk_size: int = 1000,
+    chunk_overlap: int = 200,
+    rebuild: bool = False,
+    batch_size: int = EMBED_BATCH_SIZE,
+    tokenizer_workers: int = EMBED_TOKENIZER_WORKERS,
+    index_spec: str = FAISS_INDEX_SPEC
+) -> dict:
+    """
+    增量构建向量库：内容未变化的文件直接跳过，变化文件中未改动的分块复用已有向量，
+    只对新增/变化的分块生成嵌入，并删除已移除分块的向量。
+
+    Args:
+        sources: 数据源路径列表（文件或目录）
+        index_path: FAISS 索引目录
+        chunk_size: 分块大小
+        chunk_overlap: 分块重叠
+        rebuild: 为 True 时忽略已有索引，全量重建
+        batch_size: 嵌入批大小
+        tokenizer_workers: 提前分词的批数
+        index_spec: 保存的索引类型：flat / hnsw / ivf-flat / ivf-pq 或 faiss.index_factory 字符串
+
+    Returns:
+        本次构建的统计信息
+    """
+    embed_model = get_embed_model()
+    build_params = {
+        "embedding_model": embed_model.model_id,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap
+    }
+    
+    manifest = None if rebuild else load_manifest(index_path)
+    vector_store = None
+    if manifest and all(manifest.get(k) == v for k, v in build_params.items()):
+        try:
+            vector_store = load_vector_store(index_path, embed_model, mutable=True)
+        except Exception as e:
+            print(f"Warning: Unable to load existing index, rebuilding: {e}")
+    elif manifest:
+        print("Build parameters changed, rebuilding the whole index")
+    
+    # 增量修改在 flat 索引上进行，近似索引先还原为 flat
+    if vector_store is not None and describe_index(vector_store.index) != "flat":
+        flat = to_flat(vector_store.index)
+        if flat is None:
+            print(f"Re-embedding stored chunks to recover exact vectors from the {describe_index(vector_store.index)} index")
+            stored = [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(vector_store.index.ntotal)]
+            vectors, _ = embed_texts_batched(embed_model, [doc.page_content for doc in stored], batch_size, tokenizer_workers)
+            flat = build_index(vectors, "flat")
+        vector_store.index = flat
+    
+    old_files = manifest["files"] if vector_store is not None else {}
+    old_ids = {cid for entry in old_files.values() for cid in entry["chunks"]}
+    
+    new_files: dict[str, dict] = {}
+    pending_chunks: list[Document] = []
+    pending_ids: list[str] = []
+    stats = {"files_unchanged": 0, "files_changed": 0, "chunks_added": 0, "chunks_removed": 0, "chunks_reused": 0}
+    
+    changed_paths = []
+    start = time.perf_counter()
+    for path in iter_source_files(sources):
+        digest = file_sha256(path)
+        old_entry = old_files.get(path)
+        if old_entry and old_entry["sha256"] == digest:
+            new_files[path] = old_entry
+            stats["files_unchanged"] += 1
+            stats["chunks_reused"] += len(old_entry["chunks"])
+        else:
+            print(f"Detected new or changed file: {path}")
+            new_files[path] = {"sha256": digest, "chunks": []}
+            changed_paths.append(path)
+    stats["files_changed"] = len(changed_paths)
+    timings = {"hash": time.perf_counter() - start}
+    
+    # 变化的文件在进程池中并行加载并逐页分块
+    if changed_paths:
+        chunks_by_file, load_timings = load_files_parallel(changed_paths, chunk_size, chunk_overlap)
+        timings.update(load_timings)
+        for path in changed_paths:
+            chunks = chunks_by_file.get(path, [])
+            ids = assign_chunk_ids(chunks)
+            new_files[path]["chunks"] = ids
+            for chunk, cid in zip(chunks, ids):
+                if cid in old_ids:
+                    stats["chunks_reused"] += 1
+                else:
+                    pending_chunks.append(chunk)
+                    pending_ids.append(cid)
+    
+    new_ids = {cid for entry in new_files.values() for cid in entry["chunks"]}
+    removed_ids = sorted(old_ids - new_ids)
+    
+    start = time.perf_counter()
+    pending_metadatas = [chunk.metadata for chunk in pending_chunks]
+    if vector_store is None:
+        if not pending_chunks:
+            raise ValueError("No valid chunks with content found.")
+        print(f"Embedding {len(pending_chunks)} chunks for a full build")
+        text_embeddings, stats["embedding"] = embed_chunks(pending_chunks, batch_size, tokenizer_workers)
+        vector_store = FAISS.from_embeddings(
+            text_embeddings,
+            embed_model,
+            metadatas=pending_metadatas,
+            ids=pending_ids
+        )
+    else:
+        if removed_ids:
+            print(f"Removing {len(removed_ids)} stale chunks")
+            vector_store.delete(removed_ids)
+        if pending_chunks:
+            print(f"Embedding {len(pending_chunks)} new or changed chunks")
+            text_embeddings, stats["embedding"] = embed_chunks(pending_chunks, batch_size, tokenizer_workers)
+            vector_store.add_embeddings(
+                text_embeddings,
+                metadatas=pending_metadatas,
+                ids=pending_ids
+            )
+    timings["embed"] = time.perf_counter() - start
+    
+    stats["chunks_added"] = len(pending_chunks)
+    stats["chunks_removed"] = len(removed_ids)
+    
+    # 按指定类型构建近似索引（在全部向量上重新训练）
+    start = time.perf_counter()
+    factory = resolve_spec(index_spec, vector_store.index.ntotal, vector_store.index.d)
+    if factory != "Flat":
+        print(f"Building {factory} index")
+        vectors = vector_store.index.reconstruct_n(0, vector_store.index.ntotal)
+        vector_store.index = build_index(vectors, index_spec)
+    search_params = configure_search(vector_store.index)
+    timings["index"] = time.perf_counter() - start
+    
+    os.makedirs(index_path, exist_ok=True)
+    save_vector_store(vector_store, index_path)
+    
+    # BM25 稀疏索引按 FAISS 位置顺序全量重建，比嵌入便宜得多
+    start = time.perf_counter()
+    texts = [
+        vector_store.docstore.search(vector_store.index_to_docstore_id[i]).page_content
+        for i in range(vector_store.index.ntotal)
+    ]
+    vocab_size = write_sparse_index(index_path, texts)
+    timings["sparse"] = time.perf_counter() - start
+    print(f"Sparse index built with {vocab_size} terms")
+    
+    save_manifest(index_path, {
+        "version": MANIFEST_VERSION,
+        **build_params,
+        "index_spec": index_spec,
+        "index_factory": factory,
+        "search_params": search_params,
+        "files": new_files
+    })
+    embed_model.cache.flush()
+    
+    stats["timings"] = timings
+    return stats
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Build the Qrent FAISS vector store")
+    parser.add_argument("--rebuild", action="store_true", help="忽略 manifest，全量重建索引")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="嵌入批大小")
+    parser.add_argument("--tokenizer-workers", type=int, default=EMBED_TOKENIZER_WORKERS, help="提前分词的批数")
+    parser.add_argument("--index-spec", default=FAISS_INDEX_SPEC, help="索引类型：flat / hnsw / ivf-flat / ivf-pq 或 faiss.index_factory 字符串")
+    args = parser.parse_args()
+    
     # 配置：数据源路径列表和索引存储目录
     data_sources = ['../documents/Qrent攻略.pdf', '../documents/Qrent澳洲租房最全全流程攻略.pdf','../documents/Qrent-rag_plus.pdf']  
     index_path = '../database/faiss_index'
 
-    print("Loading documents...")
+    print("Building vector store...")
     try:
-        docs = load_documents(data_sources)
-        print(f"Loaded {len(docs)} documents")
-        
-        if not docs:
-            print("Error: No documents were loaded. Please check file paths and file contents.")
-            return
-        
-        print("Building vector store...")
-        vector_store = build_vector_store(docs)
-
-        print(f"Saving vector store to '{index_path}'...")
-        os.makedirs(index_path, exist_ok=True)
-        vector_store.save_local(folder_path=index_path)
-        print("Vector store saved successfully.")
+        stats = update_vector_store(
+            data_sources,
+            index_path,
+            rebuild=args.rebuild,
+            batch_size=args.batch_size,
+            tokenizer_workers=args.tokenizer_workers,
+            index_spec=args.index_spec
+        )
+        print(
+            f"Files unchanged: {stats['files_unchanged']}, changed: {stats['files_changed']}; "
+            f"chunks added: {stats['chunks_added']}, removed: {stats['chunks_removed']}, "
+            f"reused: {stats['chunks_reused']}"
+        )
+        print(f"Stage timings: {format_timings(stats['timings'])}")
+        print(f"Vector store saved to '{index_path}'.")
         
     except Exception as e:
         print(f"Error in main process: {e}")
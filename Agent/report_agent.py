@@ -9,16 +9,18 @@ import json
 import re
 from datetime import datetime
 from typing import Dict, List, Optional, Any, Tuple
-from openai import OpenAI
 from dotenv import load_dotenv, find_dotenv
 
+from llm_client import chat_completion
+
+from property_frame import PropertyFrame
+
 # 加载环境变量
 dotenv_path = find_dotenv()
 if dotenv_path:
     load_dotenv(dotenv_path)
 
 API_KEY = os.getenv("API_KEY_POINT")
-DASHSCOPE_BASE_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1"
 QWEN_MODEL = "qwen-vl-max-latest"
 
 # 报告模板配置
@@ -37,6 +39,83 @@ REPORT_TEMPLATES = {
     }
 }
 
+
+def _create_static_system_prompt(language: str, report_type: str) -> str:
+    """系统提示词的静态部分：角色、报告结构和写作要求，只取决于语言和报告类型"""
+    template = REPORT_TEMPLATES[report_type]
+    sections = chr(10).join([f"{i+1}. {section}" for i, section in enumerate(template['sections'])])
+    
+    if language == "chinese":
+        return f"""
+你是一名专业的租房顾问，专门为用户生成全面的租房分析报告。
+
+## 报告类型: {template['title']}
+
+## 你的任务:
+基于下方提供的用户完整信息，生成一份专业、全面的租房报告，包含以下部分：
+
+{sections}
+
+## 报告要求:
+- 使用中文书写
+- 结构清晰，逻辑严谨
+- 提供具体数据和分析
+- 包含可操作的建议
+- 风格专业但易懂
+- 长度适中，内容充实
+- 包含风险提示和注意事项
+- 提供明确的行动步骤
+
+## 输出格式:
+请按照markdown格式输出，使用适当的标题层级、列表和表格来组织内容。
+
+## 注意事项:
+- 基于实际数据进行分析，不要编造信息
+- 突出用户最关心的问题
+- 提供多种选择方案
+- 考虑预算限制和实际可行性
+- 包含时间规划和优先级建议
+"""
+    else:
+        return f"""
+You are a professional rental consultant specializing in generating comprehensive rental analysis reports for users.
+
+## Report Type: {template['title']}
+
+## Your Task:
+Based on the complete user information provided below, generate a professional and comprehensive rental report including the following sections:
+
+{sections}
+
+## Report Requirements:
+- Write in user's language
+- Clear structure and rigorous logic
+- Provide specific data and analysis
+- Include actionable recommendations
+- Professional but understandable style
+- Appropriate length with substantial content
+- Include risk alerts and precautions
+- Provide clear action steps
+
+## Output Format:
+Please output in markdown format, using appropriate heading levels, lists, and tables to organize content.
+
+## Important Notes:
+- Base analysis on actual data, don't fabricate information
+- Highlight user's main concerns
+- Provide multiple options
+- Consider budget constraints and feasibility
+- Include time planning and priority recommendations
+"""
+
+
+# 静态前缀在导入时按 (语言, 报告类型) 生成一次；用户数据附加在其后，前缀保持不变，可以命中服务端的前缀缓存
+REPORT_SYSTEM_PROMPT_PREFIXES = {
+    (language, report_type): _create_static_system_prompt(language, report_type)
+    for language in ("chinese", "english")
+    for report_type in REPORT_TEMPLATES
+}
+
 class ReportAgent:
     """租房报告生成Agent"""
     
@@ -45,6 +124,9 @@ class ReportAgent:
         self.questionnaire_data = None
         self.main_agent_history = None
         self.inquiry_agent_history = None
+        # 对话助手 / 需求分析师的滚动摘要 (ConversationMemory.summary)，长度固定，直接放入提示词
+        self.main_agent_summary = None
+        self.inquiry_agent_summary = None
         self.property_search_results = []
         self.area_analysis_results = {}
         self.user_preferences = {}
@@ -54,7 +136,9 @@ class ReportAgent:
                         main_agent_history=None,
                         inquiry_agent_history=None,
                         property_search_results=None,
-                        area_analysis_results=None):
+                        area_analysis_results=None,
+                        main_agent_summary=None,
+                        inquiry_agent_summary=None):
         """更新用户数据和分析结果"""
         if questionnaire_data is not None:
             self.questionnaire_data = questionnaire_data
@@ -70,32 +154,24 @@ class ReportAgent:
             
         if area_analysis_results is not None:
             self.area_analysis_results = area_analysis_results
+            
+        if main_agent_summary is not None:
+            self.main_agent_summary = main_agent_summary
+            
+        if inquiry_agent_summary is not None:
+            self.inquiry_agent_summary = inquiry_agent_summary
     
     def _call_qwen_api(self, messages: list) -> str:
         """调用Qwen API"""
         if not API_KEY:
             raise ValueError("API_KEY_POINT not set in environment variables")
         
-        client = OpenAI(api_key=API_KEY, base_url=DASHSCOPE_BASE_URL)
-        
-        # 过滤和转换消息角色，确保API兼容性
-        filtered_messages = []
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            # 将非标准角色映射为assistant
-            if role in ["inquiry_assistant", "report_assistant"]:
-                role = "assistant"
-            
-            # 只保留API支持的角色
-            if role in ["system", "assistant", "user", "tool", "function"]:
-                filtered_messages.append({"role": role, "content": content})
-        
         try:
-            completion = client.chat.completions.create(
+            completion = chat_completion(
+                messages,
+                API_KEY,
                 model=QWEN_MODEL,
-                messages=filtered_messages,
+                caller="report",
                 temperature=0.3,  # 较低的温度以确保报告的一致性
                 max_tokens=4000
             )
@@ -229,46 +305,28 @@ class ReportAgent:
         
         summary = "## 房源搜索结果摘要\n\n"
         
-        total_properties = 0
-        price_ranges = []
-        areas_found = set()
-        room_types_found = set()
-        
-        for result in self.property_search_results:
-            if isinstance(result, dict) and "result" in result:
-                result_data = result["result"]
-                
-                if "properties" in result_data:
-                    properties = result_data["properties"]
-                    total_properties += len(properties)
-                    
-                    for prop in properties:
-                        # 收集价格信息
-                        if "pricePerWeek" in prop:
-                            price_ranges.append(prop["pricePerWeek"])
-                        
-                        # 收集区域信息
-                        if "suburb" in prop:
-                            areas_found.add(prop["suburb"].lower())
-                        
-                        # 收集房型信息
-                        if "bedroomCount" in prop and "bathroomCount" in prop:
-                            room_types_found.add(f"{prop['bedroomCount']}室{prop['bathroomCount']}卫")
+        # 所有搜索结果的房源合并为一个列式结果集，统计全部向量化计算
+        frame = PropertyFrame.from_results(
+            result["result"] for result in self.property_search_results
+            if isinstance(result, dict) and "result" in result
+        )
         
         summary += f"**搜索统计:**\n"
-        summary += f"- 总计找到房源: {total_properties}套\n"
+        summary += f"- 总计找到房源: {len(frame)}套\n"
         
-        if price_ranges:
-            min_price = min(price_ranges)
-            max_price = max(price_ranges)
-            avg_price = sum(price_ranges) / len(price_ranges)
-            summary += f"- 价格范围: ${min_price}-${max_price}/周 (平均: ${avg_price:.0f}/周)\n"
+        prices = frame.price_summary()
+        if frame.prices().size:
+            summary += f"- 价格范围: ${prices['min_price']:.0f}-${prices['max_price']:.0f}/周 (平均: ${prices['avg_price']:.0f}/周, 中位数: ${prices['median_price']:.0f}/周)\n"
+            summary += f"- 每卧室平均租金: ${frame.price_per_bedroom().mean():.0f}/周\n"
         
+        areas_found = frame.suburbs()
         if areas_found:
-            summary += f"- 涉及区域: {', '.join(sorted(areas_found))}\n"
+            summary += f"- 涉及区域: {', '.join(areas_found)}\n"
         
-        if room_types_found:
-            summary += f"- 房型分布: {', '.join(sorted(room_types_found))}\n"
+        if frame.has_rooms.any():
+            room_counts = frame.group_by("room_type")
+            room_types_found = [f"{room}({room_counts[room]['count']}套)" for room in frame.room_types()]
+            summary += f"- 房型分布: {', '.join(room_types_found)}\n"
         
         summary += "\n"
         
@@ -296,23 +354,34 @@ class ReportAgent:
         
         return summary
     
+    def _format_conversation_summary(self) -> str:
+        """格式化对话摘要（只使用摘要，完整历史仅用于偏好关键词提取）"""
+        if not self.main_agent_summary and not self.inquiry_agent_summary:
+            return ""
+        
+        summary = "## 对话摘要\n\n"
+        if self.inquiry_agent_summary:
+            summary += f"**需求评估对话:**\n{self.inquiry_agent_summary}\n\n"
+        if self.main_agent_summary:
+            summary += f"**房源咨询对话:**\n{self.main_agent_summary}\n\n"
+        
+        return summary
+    
     def _create_system_prompt(self, language: str, report_type: str = "detailed_analysis") -> str:
-        """创建系统提示词"""
+        """创建系统提示词：预先生成的静态前缀 + 用户数据（问卷、搜索结果、区域分析、对话摘要和偏好）"""
         
         # 获取用户偏好
         user_preferences = self._extract_user_preferences()
         questionnaire_summary = self._format_questionnaire_summary()
         search_summary = self._format_search_results_summary()
         area_summary = self._format_area_analysis_summary()
+        conversation_summary = self._format_conversation_summary()
         
-        template = REPORT_TEMPLATES.get(report_type, REPORT_TEMPLATES["detailed_analysis"])
+        if report_type not in REPORT_TEMPLATES:
+            report_type = "detailed_analysis"
         
         if language == "chinese":
-            return f"""
-你是一名专业的租房顾问，专门为用户生成全面的租房分析报告。
-
-## 报告类型: {template['title']}
-
+            return REPORT_SYSTEM_PROMPT_PREFIXES[("chinese", report_type)] + f"""
 ## 用户完整信息:
 
 {questionnaire_summary}
@@ -321,40 +390,12 @@ class ReportAgent:
 
 {area_summary}
 
+{conversation_summary}
 ## 用户偏好提取:
 {json.dumps(user_preferences, ensure_ascii=False, indent=2)}
-
-## 你的任务:
-基于以上所有信息，生成一份专业、全面的租房报告，包含以下部分：
-
-{chr(10).join([f"{i+1}. {section}" for i, section in enumerate(template['sections'])])}
-
-## 报告要求:
-- 使用中文书写
-- 结构清晰，逻辑严谨
-- 提供具体数据和分析
-- 包含可操作的建议
-- 风格专业但易懂
-- 长度适中，内容充实
-- 包含风险提示和注意事项
-- 提供明确的行动步骤
-
-## 输出格式:
-请按照markdown格式输出，使用适当的标题层级、列表和表格来组织内容。
-
-## 注意事项:
-- 基于实际数据进行分析，不要编造信息
-- 突出用户最关心的问题
-- 提供多种选择方案
-- 考虑预算限制和实际可行性
-- 包含时间规划和优先级建议
 """
         else:
-            return f"""
-You are a professional rental consultant specializing in generating comprehensive rental analysis reports for users.
-
-## Report Type: {template['title']}
-
+            return REPORT_SYSTEM_PROMPT_PREFIXES[("english", report_type)] + f"""
 ## Complete User Information:
 
 {questionnaire_summary}
@@ -363,33 +404,9 @@ You are a professional rental consultant specializing in generating comprehensiv
 
 {area_summary}
 
+{conversation_summary}
 ## Extracted User Preferences:
 {json.dumps(user_preferences, ensure_ascii=False, indent=2)}
-
-## Your Task:
-Based on all the above information, generate a professional and comprehensive rental report including the following sections:
-
-{chr(10).join([f"{i+1}. {section}" for i, section in enumerate(template['sections'])])}
-
-## Report Requirements:
-- Write in user's language
-- Clear structure and rigorous logic
-- Provide specific data and analysis
-- Include actionable recommendations
-- Professional but understandable style
-- Appropriate length with substantial content
-- Include risk alerts and precautions
-- Provide clear action steps
-
-## Output Format:
-Please output in markdown format, using appropriate heading levels, lists, and tables to organize content.
-
-## Important Notes:
-- Base analysis on actual data, don't fabricate information
-- Highlight user's main concerns
-- Provide multiple options
-- Consider budget constraints and feasibility
-- Include time planning and priority recommendations
 """
     
     def generate_executive_summary(self, language: str = None) -> str:
@@ -604,6 +621,8 @@ Please provide actionable specific recommendations.
         self.questionnaire_data = None
         self.main_agent_history = None
         self.inquiry_agent_history = None
+        self.main_agent_summary = None
+        self.inquiry_agent_summary = None
         self.property_search_results = []
         self.area_analysis_results = {}
         self.user_preferences = {}
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+进程级共享资源注册表
+嵌入模型和 FAISS 向量库在首次使用时加载，每个进程只加载一次，
+所有 QrentAgent 实例和 Streamlit 会话共用。提供预热和就绪状态查询。
+"""
+
+import os
+import threading
+from typing import Optional
+
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from embedding_backends import EMBEDDING_BACKEND, backend_model_id, create_embeddings
+from faiss_index import configure_search
+from chunk_store import load_vector_store
+from sparse_index import HEADER_FILENAME as SPARSE_HEADER_FILENAME, SparseIndex, load_sparse_index
+
+# 嵌入模型与索引配置
+EMBEDDING_REPO = "qwen/Qwen3-Embedding-0.6B"
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+INDEX_DIR = os.getenv(
+    "FAISS_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "faiss_index")
+)
+
+_lock = threading.RLock()
+_embed_model: Optional[CachedEmbeddings] = None
+_vector_store = None
+_retriever = None
+_sparse_index: Optional[SparseIndex] = None
+_sparse_loaded = False
+# 当前加载的索引版本（索引文件的修改时间和大小），用于发现索引重建并让检索缓存失效
+_index_version: Optional[str] = None
+_index_dir: Optional[str] = None
+_warmup_thread: Optional[threading.Thread] = None
+_ready = threading.Event()
+_last_error: Optional[str] = None
+
+
+def get_embed_model() -> CachedEmbeddings:
+    """获取共享的嵌入模型（带磁盘缓存），首次调用时下载并加载"""
+    global _embed_model
+    if _embed_model is None:
+        with _lock:
+            if _embed_model is None:
+                from huggingface_hub import snapshot_download
+
+                print(f"Downloading embedding model {EMBEDDING_REPO}...")
+                model_path = snapshot_download(repo_id=EMBEDDING_REPO)
+                print(f"Embedding model downloaded to: {model_path} (backend: {EMBEDDING_BACKEND})")
+                _embed_model = CachedEmbeddings(
+                    create_embeddings(model_path, EMBEDDING_BACKEND, EMBEDDING_DEVICE),
+                    get_embedding_cache(),
+                    model_id=backend_model_id(EMBEDDING_REPO, EMBEDDING_BACKEND)
+                )
+    return _embed_model
+
+
+def _disk_version(index_dir: str) -> Optional[str]:
+    """磁盘上索引的版本：index.faiss 和 BM25 索引头文件的修改时间与大小，索引不存在时为 None"""
+    parts = []
+    for name in ("index.faiss", SPARSE_HEADER_FILENAME):
+        try:
+            stat = os.stat(os.path.join(index_dir, name))
+        except FileNotFoundError:
+            parts.append("-")
+            continue
+        parts.append(f"{stat.st_mtime_ns}-{stat.st_size}")
+    return None if parts[0] == "-" else "/".join(parts)
+
+
+def get_vector_store(index_dir: str = INDEX_DIR):
+    """获取共享的 FAISS 向量库，首次调用时从磁盘加载"""
+    global _vector_store, _index_version, _index_dir
+    if _vector_store is None:
+        with _lock:
+            if _vector_store is None:
+                # 检查索引目录是否存在且非空
+                if not os.path.isdir(index_dir) or not os.listdir(index_dir):
+                    raise ValueError(f"Vector store not found at {index_dir}. Please build the vector store first.")
+
+                # 分块按需从 mmap 文件读取，旧索引退回 pickle 加载
+                _vector_store = load_vector_store(index_dir, get_embed_model())
+                # faiss.read_index 自动识别索引类型，这里按类型设置查询参数
+                search_params = configure_search(_vector_store.index)
+                print(f"Loaded {search_params['type']} index with {_vector_store.index.ntotal} vectors, search params: {search_params}")
+                _index_version = _disk_version(index_dir)
+                _index_dir = index_dir
+                _ready.set()
+    return _vector_store
+
+
+def get_retriever(index_dir: str = INDEX_DIR):
+    """获取共享的检索器，top_k 在调用 invoke(query, k=top_k) 时传入"""
+    global _retriever
+    if _retriever is None:
+        with _lock:
+            if _retriever is None:
+                _retriever = get_vector_store(index_dir).as_retriever(search_kwargs={"k": 5})
+    return _retriever
+
+
+def get_sparse_index(index_dir: str = INDEX_DIR) -> Optional[SparseIndex]:
+    """获取共享的 BM25 稀疏索引；索引目录中没有时返回 None"""
+    global _sparse_index, _sparse_loaded
+    if not _sparse_loaded:
+        with _lock:
+            if not _sparse_loaded:
+                _sparse_index = load_sparse_index(index_dir)
+                _sparse_loaded = True
+                if _sparse_index is None:
+                    print(f"No sparse index in {index_dir}, hybrid retrieval falls back to dense only")
+    return _sparse_index
+
+
+def index_version() -> Optional[str]:
+    """当前加载的索引版本，尚未加载时为 None"""
+    return _index_version
+
+
+def refresh_if_changed() -> bool:
+    """
+    磁盘上的索引被重建（rag.py 或其他进程）后丢弃已加载的向量库，下次访问时重新加载。
+    每次检索前调用，只做两次 stat。返回是否触发了重新加载。
+    """
+    if _vector_store is None or _index_dir is None:
+        return False
+    if _disk_version(_index_dir) == _index_version:
+        return False
+    with _lock:
+        if _vector_store is None or _disk_version(_index_dir) == _index_version:
+            return False
+        print(f"Index at {_index_dir} changed on disk, reloading vector store")
+        reload_vector_store()
+    return True
+
+
+def reload_vector_store() -> None:
+    """丢弃已加载的向量库，下次访问时重新从磁盘加载（索引重建后调用）"""
+    global _vector_store, _retriever, _index_version, _sparse_index, _sparse_loaded
+    with _lock:
+        _vector_store = None
+        _retriever = None
+        _sparse_index = None
+        _sparse_loaded = False
+        _index_version = None
+        _ready.clear()
+
+
+def _warm_up() -> None:
+    global _last_error
+    try:
+        get_embed_model()
+        get_vector_store()
+        _last_error = None
+        _ready.set()
+        print("Shared resources warmed up")
+    except Exception as e:
+        _last_error = str(e)
+        print(f"Error warming up shared resources: {e}")
+
+
+def warm_up(background: bool = True) -> None:
+    """
+    预加载嵌入模型和向量库。重复调用是安全的，只会加载一次。
+
+    Args:
+        background: 为 True 时在后台线程中加载并立即返回
+    """
+    global _warmup_thread
+    if _ready.is_set():
+        return
+    if not background:
+        _warm_up()
+        return
+    with _lock:
+        if _warmup_thread is None or not _warmup_thread.is_alive():
+            _warmup_thread = threading.Thread(target=_warm_up, name="qrent-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def is_ready() -> bool:
+    """模型和向量库是否都已加载"""
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    """阻塞直到资源加载完成；未预热时会在当前线程中加载。返回是否就绪"""
+    if _ready.is_set():
+        return True
+    thread = _warmup_thread
+    if thread is not None and thread.is_alive():
+        thread.join(timeout)
+    else:
+        _warm_up()
+    return _ready.is_set()
+
+
+def readiness() -> dict:
+    """返回就绪状态，供健康检查或 UI 展示"""
+    return {
+        "ready": _ready.is_set(),
+        "embedding_model_loaded": _embed_model is not None,
+        "vector_store_loaded": _vector_store is not None,
+        "index_version": _index_version,
+        "warming_up": _warmup_thread is not None and _warmup_thread.is_alive(),
+        "error": _last_error
+    }
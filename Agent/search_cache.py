@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+房源搜索结果缓存
+以规范化后的请求体 (search_properties 构建的 payload) 为键，内存 LRU + TTL，
+可选 SQLite 持久化（进程重启或多个 worker 之间共享）。
+相同请求并发到达时只向后端发出一次，其余调用等待同一个结果。
+房源每小时更新一次，默认 TTL 为 10 分钟。
+"""
+
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ttl_cache import TTLCache
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "600"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+# 为空时只用内存缓存，例如设为 database/search_cache.sqlite 开启持久化
+SEARCH_CACHE_DB = os.getenv("SEARCH_CACHE_DB", "")
+
+
+def payload_key(payload: Dict[str, Any]) -> str:
+    """请求体的规范化键：按键排序后序列化再取哈希"""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SearchCache:
+    """
+    搜索结果缓存，只缓存 success 为 True 的结果。
+
+    Args:
+        ttl: 有效期（秒）
+        maxsize: 内存中最多保存的结果数
+        db_path: SQLite 文件路径，为空时不持久化
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL, maxsize: int = SEARCH_CACHE_SIZE, db_path: str = SEARCH_CACHE_DB):
+        self.ttl = ttl
+        self.db_path = db_path
+        self.sqlite_hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self._memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._async_inflight: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._open_db()
+
+    def _open_db(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "key TEXT PRIMARY KEY, payload TEXT NOT NULL, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM search_cache WHERE expires_at < ?", (time.time(),))
+
+    def _lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._memory.get(key)
+        if value is not None or self._db is None:
+            return value
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, expires_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        value = json.loads(row[0])
+        self.sqlite_hits += 1
+        self._memory.set(key, value, ttl=row[1] - time.time())
+        return value
+
+    def _store(self, key: str, payload: Dict[str, Any], value: Dict[str, Any]) -> None:
+        if not value.get("success"):
+            return
+        self._memory.set(key, value)
+        if self._db is not None:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, payload, result, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(payload, ensure_ascii=False), json.dumps(value, ensure_ascii=False), time.time() + self.ttl)
+                )
+
+    def get_or_fetch(self, payload: Dict[str, Any], fetch: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        返回缓存结果，未命中时调用 fetch()。
+        其他线程正在请求同一个 payload 时等待它的结果，不重复请求后端。
+        """
+        key = payload_key(payload)
+        value = self._lookup(key)
+        if value is not None:
+            return copy.deepcopy(value)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            self.fetches += 1
+            value = fetch()
+            self._store(key, payload, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return copy.deepcopy(value)
+
+    async def aget_or_fetch(
+        self,
+        payload: Dict[str, Any],
+        fetch: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Dict[str, Any]:
+        """get_or_fetch 的异步版本，同一事件循环内的相同请求共享一个任务"""
+        key = payload_key(payload)
+        value = self._lookup(key)
+        if value is not None:
+            return copy.deepcopy(value)
+
+        loop = asyncio.get_running_loop()
+        inflight = self._async_inflight.setdefault(loop, {})
+        task = inflight.get(key)
+        if task is None:
+            async def run():
+                try:
+                    self.fetches += 1
+                    result = await fetch()
+                    self._store(key, payload, result)
+                    return result
+                finally:
+                    inflight.pop(key, None)
+
+            task = loop.create_task(run())
+            inflight[key] = task
+        else:
+            self.coalesced += 1
+        # shield：某个等待者被取消时不影响其他等待者
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def clear(self) -> None:
+        """清空内存和持久化缓存"""
+        self._memory.clear()
+        if self._db is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM search_cache")
+
+    def stats(self) -> dict:
+        """命中统计"""
+        return {
+            **self._memory.stats(),
+            "sqlite_hits": self.sqlite_hits,
+            "fetches": self.fetches,
+            "coalesced": self.coalesced,
+            "persistent": self._db is not None
+        }
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SearchCache:
+    """获取进程内共享的搜索缓存"""
+    global _search_cache
+    if _search_cache is None:
+        with _search_cache_lock:
+            if _search_cache is None:
+                _search_cache = SearchCache()
+    return _search_cache
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+BM25 稀疏倒排索引
+与 FAISS 索引一起由 rag.py 构建，文档编号与 FAISS 位置一致。
+分词对中英文混合文本友好：英文/数字按词切分并转小写，中文连续片段切为单字和相邻双字。
+索引目录下的文件：
+- sparse.json          参数、文档数、平均长度和词表（词 -> 倒排区间和文档频率）
+- sparse.postings.npy  int32，按词拼接的倒排文档编号
+- sparse.tf.npy        uint16，对应的词频
+- sparse.doclen.npy    int32，每个文档的词数
+倒排数组以 mmap 方式打开，查询只读取命中词的区间。
+"""
+
+import os
+import re
+import json
+import math
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SPARSE_VERSION = 1
+HEADER_FILENAME = "sparse.json"
+POSTINGS_FILENAME = "sparse.postings.npy"
+TF_FILENAME = "sparse.tf.npy"
+DOCLEN_FILENAME = "sparse.doclen.npy"
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 倒数排名融合的平滑常数
+RRF_K = 60
+# 稀疏优先：不超过这么多个词、且每个中文片段不超过 CJK_KEYWORD_MAX_CHARS 个字时视为关键词查询
+SPARSE_FAST_PATH_MAX_WORDS = int(os.getenv("SPARSE_FAST_PATH_MAX_WORDS", "3"))
+CJK_KEYWORD_MAX_CHARS = 4
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z0-9]+)*|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+
+
+def split_words(text: str) -> List[str]:
+    """切分为英文单词/数字和中文连续片段"""
+    return _WORD_RE.findall(unicodedata.normalize("NFKC", text).lower())
+
+
+def _is_cjk(word: str) -> bool:
+    return not word[0].isascii()
+
+
+def word_tokens(word: str) -> List[str]:
+    """把一个词展开为索引词：英文原样，中文片段为单字加相邻双字"""
+    if not _is_cjk(word):
+        return [word]
+    return list(word) + [word[i:i + 2] for i in range(len(word) - 1)]
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词"""
+    return [token for word in split_words(text) for token in word_tokens(word)]
+
+
+class SparseIndex:
+    """只读的 BM25 索引"""
+
+    def __init__(self, index_dir: str):
+        with open(os.path.join(index_dir, HEADER_FILENAME), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        if header.get("version") != SPARSE_VERSION:
+            raise ValueError(f"Unsupported sparse index version {header.get('version')} in {index_dir}")
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self.n_docs = header["n_docs"]
+        self.avgdl = header["avgdl"]
+        self.vocab: Dict[str, List[int]] = header["vocab"]
+        self._postings = np.load(os.path.join(index_dir, POSTINGS_FILENAME), mmap_mode="r")
+        self._tf = np.load(os.path.join(index_dir, TF_FILENAME), mmap_mode="r")
+        self._doclen = np.load(os.path.join(index_dir, DOCLEN_FILENAME), mmap_mode="r")
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """返回得分最高的 k 个 (文档编号, BM25 得分)"""
+        docs, scores = [], []
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            start, end, df = entry
+            postings = np.asarray(self._postings[start:end])
+            tf = np.asarray(self._tf[start:end], dtype=np.float32)
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._doclen[postings] / self.avgdl)
+            docs.append(postings)
+            scores.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not docs:
+            return []
+
+        doc_ids, inverse = np.unique(np.concatenate(docs), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(scores))
+        top = np.argsort(-totals, kind="stable")[:k]
+        return [(int(doc_ids[i]), float(totals[i])) for i in top]
+
+    def is_keyword_query(self, query: str, max_words: int = SPARSE_FAST_PATH_MAX_WORDS) -> bool:
+        """
+        是否为短关键词查询（如 "bond"、"Kensington 押金"）：词数少、中文片段短，
+        且所有词都出现在索引中。这类查询直接用稀疏结果，跳过查询嵌入。
+        """
+        words = split_words(query)
+        if not words or len(words) > max_words:
+            return False
+        if any(_is_cjk(word) and len(word) > CJK_KEYWORD_MAX_CHARS for word in words):
+            return False
+        return all(token in self.vocab for word in words for token in word_tokens(word))
+
+
+def write_sparse_index(index_dir: str, texts: Sequence[str], k1: float = BM25_K1, b: float = BM25_B) -> int:
+    """按 FAISS 位置顺序为所有分块构建 BM25 索引，返回词表大小"""
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doclen = np.zeros(len(texts), dtype=np.int32)
+    for doc_id, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doclen[doc_id] = sum(counts.values())
+        for term, count in counts.items():
+            postings.setdefault(term, []).append((doc_id, count))
+
+    vocab: Dict[str, List[int]] = {}
+    all_docs, all_tf = [], []
+    offset = 0
+    for term in sorted(postings):
+        entries = postings[term]
+        vocab[term] = [offset, offset + len(entries), len(entries)]
+        offset += len(entries)
+        all_docs.extend(doc_id for doc_id, _ in entries)
+        all_tf.extend(min(count, np.iinfo(np.uint16).max) for _, count in entries)
+
+    os.makedirs(index_dir, exist_ok=True)
+    arrays = {
+        POSTINGS_FILENAME: np.asarray(all_docs, dtype=np.int32),
+        TF_FILENAME: np.asarray(all_tf, dtype=np.uint16),
+        DOCLEN_FILENAME: doclen
+    }
+    for name, array in arrays.items():
+        tmp_path = os.path.join(index_dir, name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, os.path.join(index_dir, name))
+
+    header = {
+        "version": SPARSE_VERSION,
+        "k1": k1,
+        "b": b,
+        "n_docs": len(texts),
+        "avgdl": float(doclen.mean()) if len(texts) else 0.0,
+        "vocab": vocab
+    }
+    tmp_path = os.path.join(index_dir, HEADER_FILENAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(index_dir, HEADER_FILENAME))
+    return len(vocab)
+
+
+def load_sparse_index(index_dir: str) -> Optional[SparseIndex]:
+    """加载稀疏索引，旧索引目录中没有时返回 None"""
+    if not os.path.isfile(os.path.join(index_dir, HEADER_FILENAME)):
+        return None
+    return SparseIndex(index_dir)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """倒数排名融合：按 sum(1 / (k + rank)) 合并多个排名列表"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+流式统计
+- RunningStats: Welford 在线算法，维护数量、均值、方差、最小值、最大值
+- QuantileSketch: DDSketch 分位数草图，相对误差有界，内存与数据量无关
+两者都可以 merge，用于把并发查询的各区域/各页结果合并；add_many 一次写入一整列 numpy 数组。
+"""
+
+import math
+from typing import Dict, Optional
+
+import numpy as np
+
+# DDSketch 的相对误差：估计的分位数与真实值相差不超过 1%
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+
+class RunningStats:
+    """在线计算 count / mean / variance / min / max，不保存原始数据"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def add_many(self, values) -> None:
+        """批量写入（向量化计算该批的均值和平方和后合并）"""
+        values = np.asarray(values, dtype=float)
+        if values.size == 0:
+            return
+        batch = RunningStats()
+        batch.count = int(values.size)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """合并另一组统计（Chan 并行算法），返回 self"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self) -> float:
+        """样本方差"""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class QuantileSketch:
+    """
+    DDSketch：按对数间隔分桶计数，任意分位数的估计值相对误差不超过 relative_accuracy。
+    只支持非负数（<= 0 的值计入零桶）。
+    """
+
+    def __init__(self, relative_accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + 1
+
+    def add_many(self, values) -> None:
+        """批量写入：一次算出所有值的桶号再按桶计数"""
+        values = np.asarray(values, dtype=float)
+        positive = values[values > 0]
+        self.count += int(values.size)
+        self.zero_count += int(values.size - positive.size)
+        if positive.size == 0:
+            return
+        indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            self.bins[index] = self.bins.get(index, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """合并另一个草图（必须使用相同的相对误差），返回 self"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """估计第 q 分位数 (0 <= q <= 1)，没有数据时返回 None"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # 桶 (gamma^(i-1), gamma^i] 的代表值，保证相对误差
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+
+class PriceStats:
+    """价格的完整流式统计：均值/方差/极值加中位数、p90"""
+
+    def __init__(self):
+        self.running = RunningStats()
+        self.sketch = QuantileSketch()
+
+    def add(self, price: float) -> None:
+        self.running.add(price)
+        self.sketch.add(price)
+
+    def add_many(self, prices) -> None:
+        """批量写入，忽略 NaN"""
+        prices = np.asarray(prices, dtype=float)
+        prices = prices[~np.isnan(prices)]
+        self.running.add_many(prices)
+        self.sketch.add_many(prices)
+
+    def merge(self, other: "PriceStats") -> "PriceStats":
+        self.running.merge(other.running)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """草图估计的分位数，限制在实际的 [min, max] 内（桶代表值可能略超出真实范围）"""
+        value = self.sketch.quantile(q)
+        if value is None:
+            return None
+        return float(min(max(value, self.running.min), self.running.max))
+
+    def summary(self) -> Dict[str, float]:
+        """汇总为 avg/median/p90/min/max/std（保留两位小数），没有价格时均为 0"""
+        if self.running.count == 0:
+            return {"avg_price": 0, "median_price": 0, "p90_price": 0, "min_price": 0, "max_price": 0, "std_price": 0}
+        return {
+            "avg_price": round(self.running.mean, 2),
+            "median_price": round(self.quantile(0.5), 2),
+            "p90_price": round(self.quantile(0.9), 2),
+            "min_price": round(self.running.min, 2),
+            "max_price": round(self.running.max, 2),
+            "std_price": round(self.running.std, 2)
+        }
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Agent 目录下的模块按文件名直接导入（与 streamlit 入口一致）"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Agent"))
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+int8 / ONNX 嵌入后端与全精度 torch 模型的一致性测试
+需要 torch、sentence-transformers 和已下载（或可下载）的嵌入模型，ONNX 另需 optimum[onnxruntime]，缺少时跳过。
+"""
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+
+import embedding_backends
+
+# 参与对比的知识库分块数，控制测试耗时
+PARITY_SAMPLE = 64
+
+
+@pytest.fixture(scope="module")
+def embedding_model():
+    from huggingface_hub import snapshot_download
+    from resources import EMBEDDING_REPO
+
+    try:
+        return snapshot_download(repo_id=EMBEDDING_REPO)
+    except Exception as e:
+        pytest.skip(f"embedding model unavailable: {e}")
+
+
+@pytest.mark.parametrize("backend", ["int8", "onnx"])
+def test_backend_matches_torch(backend, embedding_model):
+    from resources import EMBEDDING_DEVICE
+
+    if backend == "onnx":
+        pytest.importorskip("optimum.onnxruntime")
+    elif EMBEDDING_DEVICE != "cpu":
+        pytest.skip("int8 dynamic quantization is only supported on CPU")
+
+    result = embedding_backends.run_parity_check(backend, limit=PARITY_SAMPLE)
+
+    assert result["min_cosine"] >= embedding_backends.PARITY_THRESHOLD, result
+    assert result["top_k_agreement"] >= embedding_backends.TOP_K_AGREEMENT_THRESHOLD, result
+    assert result["passed"]
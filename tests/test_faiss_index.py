@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""近似索引相对 flat 精确检索的 recall@k，以及小语料时的索引类型退化"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from faiss_index import MIN_TRAIN_PER_CENTROID, build_index, describe_index, recall_at_k, resolve_spec
+
+# 各索引类型在合成语料上的最低 recall@10（PQ 有损压缩，要求较低）
+MIN_RECALL = {"hnsw": 0.95, "ivf-flat": 0.9, "ivf-pq": 0.4}
+
+
+@pytest.fixture(scope="module")
+def corpus() -> np.ndarray:
+    """50 个高斯簇组成的 4000 x 64 合成向量，模拟嵌入的聚簇分布"""
+    rng = np.random.default_rng(1)
+    centers = rng.standard_normal((50, 64)) * 3
+    return (centers[rng.integers(0, 50, 4000)] + rng.standard_normal((4000, 64))).astype(np.float32)
+
+
+@pytest.mark.parametrize("spec", sorted(MIN_RECALL))
+def test_recall_at_k(corpus, spec):
+    result = recall_at_k(corpus, spec, k=10, n_queries=200)
+    assert result["factory"] != "Flat"
+    assert result["recall"] >= MIN_RECALL[spec], result
+
+
+@pytest.mark.parametrize("spec", ["ivf-flat", "ivf-pq"])
+def test_small_corpus_falls_back_to_flat(spec):
+    vectors = np.random.default_rng(0).standard_normal((75, 512)).astype(np.float32)
+    assert resolve_spec(spec, len(vectors), vectors.shape[1]) == "Flat"
+    assert describe_index(build_index(vectors, spec)) == "flat"
+
+
+def test_nlist_has_enough_training_points():
+    for n_vectors in (1000, 5000, 100000):
+        factory = resolve_spec("ivf-pq", n_vectors, 512)
+        nlist = int(factory.split(",")[0][3:])
+        nbits = int(factory.split("x")[1])
+        assert n_vectors >= nlist * MIN_TRAIN_PER_CENTROID
+        assert n_vectors >= (1 << nbits) * MIN_TRAIN_PER_CENTROID
@@ -40,7 +40,8 @@ try:
         def create_report_agent():
             return None
     
-    get_agent = agent.get_agent
+    import resources
+    create_agent = agent.create_agent
 except ImportError as e:
     st.error(f"无法导入Agent模块: {e}")
     st.error(f"Agent目录路径: {agent_dir}")
@@ -56,12 +57,16 @@ st.set_page_config(
     page_icon="🏠"
 )
 
-# 强制重新创建agent对象以确保使用最新版本
-try:
-    st.session_state.agent = get_agent()
-except Exception as e:
-    st.error(f"初始化Agent失败: {e}")
-    st.stop()
+# 嵌入模型和向量库在进程内只加载一次，所有会话共享；每个会话只创建轻量的agent对象
+if 'agent' not in st.session_state:
+    try:
+        if not resources.is_ready():
+            with st.spinner("正在加载知识库，请稍候..."):
+                resources.wait_until_ready()
+        st.session_state.agent = create_agent()
+    except Exception as e:
+        st.error(f"初始化Agent失败: {e}")
+        st.stop()
 
 if 'inquiry_agent' not in st.session_state:
     try:
@@ -100,6 +105,35 @@ if 'consultation_complete' not in st.session_state:
 init_questionnaire_state()
 
 
+def render_streaming_answer(events, answer_placeholder, render_answer, show_function_results=None):
+    """
+    渲染 agent.process_query_stream 的事件：回答片段实时刷新到 answer_placeholder，
+    工具调用完成时调用 show_function_results；返回最终结果（与 process_query 相同）
+    """
+    answer = ""
+    result = {}
+    for event in events:
+        if event["type"] == "token":
+            answer += event["content"]
+            with answer_placeholder.container():
+                render_answer(answer + "▌")
+        elif event["type"] == "function_results":
+            # 之后的片段属于基于查询结果的最终回答
+            answer = ""
+            answer_placeholder.empty()
+            if show_function_results is not None and event["function_results"]:
+                show_function_results(event["function_results"])
+        elif event["type"] == "done":
+            result = event["result"]
+    
+    if result.get("answer"):
+        with answer_placeholder.container():
+            render_answer(result["answer"])
+    else:
+        answer_placeholder.empty()
+    return result
+
+
 def show_workflow_interface():
     """显示智能工作流程界面"""
     st.title("🚀 智能租房流程")
@@ -526,9 +560,6 @@ def show_consultation_stage():
                         inquiry_updated_requirements=inquiry_updated_requirements
                     )
                     
-                    # 使用主Agent进行房源搜索
-                    result = st.session_state.agent.process_query(actual_query, top_k=5)
-                    
                     # 显示搜索结果
                     st.markdown("### 🏠 房源推荐结果")
                     
@@ -536,17 +567,21 @@ def show_consultation_stage():
                     if not query.strip():
                         st.info(f"💡 基于您的需求信息，系统自动生成查询：{actual_query}")
                     
+                    function_area = st.container()
+                    answer_placeholder = st.empty()
+                    
                     # 显示函数调用结果
-                    if result.get('function_results'):
-                        st.markdown("#### 📊 数据库查询结果")
-                        for func_result in result['function_results']:
-                            if 'error' in func_result:
-                                st.error(f"❌ {func_result['name']}: {func_result['error']}")
-                            else:
-                                st.success(f"✅ {func_result['name']}: 查询成功")
+                    def show_function_results(function_results):
+                        with function_area:
+                            st.markdown("#### 📊 数据库查询结果")
+                            for func_result in function_results:
+                                if 'error' in func_result:
+                                    st.error(f"❌ {func_result['name']}: {func_result['error']}")
+                                else:
+                                    st.success(f"✅ {func_result['name']}: 查询成功")
                     
                     # 显示AI推荐
-                    if result['answer']:
+                    def render_answer(answer):
                         st.markdown("#### 🤖 专业推荐")
                         st.markdown(f"""
                         <div style="
@@ -573,11 +608,19 @@ def show_consultation_stage():
                                 overflow-wrap: break-word;
                                 width: 100%;
                             ">
-                                {result['answer']}
+                                {answer}
                             </div>
                         </div>
                         """, unsafe_allow_html=True)
                     
+                    # 使用主Agent进行房源搜索，回答逐段显示
+                    render_streaming_answer(
+                        st.session_state.agent.process_query_stream(actual_query, top_k=5),
+                        answer_placeholder,
+                        render_answer,
+                        show_function_results
+                    )
+                    
                     # 满意度确认
                     st.markdown("---")
                     st.markdown("#### 💭 您对推荐结果满意吗？")
@@ -792,19 +835,11 @@ def show_chat_interface():
         with col_btn2:
             if st.button("重新生成"):
                 if st.session_state.history:
-                    # 获取最后一个用户问题
-                    last_query = None
-                    for i in range(len(st.session_state.history) - 1, -1, -1):
-                        if st.session_state.history[i][0] == "user":
-                            last_query = st.session_state.history[i][1]
-                            break
+                    # 移除最后一轮对话并取出其用户问题（早期轮次的摘要不受影响）
+                    last_query = st.session_state.agent.drop_last_turn()
+                    st.session_state.history = st.session_state.agent.history
                     
                     if last_query:
-                        # 移除最后一轮对话
-                        if len(st.session_state.history) >= 2:
-                            st.session_state.history = st.session_state.history[:-2]
-                            st.session_state.agent.history = st.session_state.agent.history[:-2]
-                        
                         # 重新处理查询
                         query = last_query
                         submit_button = True
@@ -830,31 +865,27 @@ def show_chat_interface():
                         inquiry_updated_requirements=inquiry_updated_requirements
                     )
                     
-                    result = st.session_state.agent.process_query(query, top_k)
-                    
-                    # 更新session state中的历史
-                    st.session_state.history = result['history']
-                    
-                    # 显示结果
-                    st.success("查询处理完成！")
+                    function_area = st.container()
+                    answer_placeholder = st.empty()
                     
                     # 显示函数调用结果（如果有）
-                    if result.get('function_results'):
-                        st.markdown("### 📊 数据库查询结果：")
-                        for func_result in result['function_results']:
-                            if 'error' in func_result:
-                                st.error(f"❌ {func_result['name']}: {func_result['error']}")
-                            else:
-                                st.success(f"✅ {func_result['name']}: 查询成功")
-                                if 'result' in func_result:
-                                    func_res = func_result['result']
-                                    if 'analysis_results' in func_res:
-                                        st.info(f"📈 分析了 {len(func_res['analysis_results'])} 个区域")
-                                    elif 'properties' in func_res:
-                                        st.info(f"🏠 找到 {func_res.get('count', 0)} 套房源")
+                    def show_function_results(function_results):
+                        with function_area:
+                            st.markdown("### 📊 数据库查询结果：")
+                            for func_result in function_results:
+                                if 'error' in func_result:
+                                    st.error(f"❌ {func_result['name']}: {func_result['error']}")
+                                else:
+                                    st.success(f"✅ {func_result['name']}: 查询成功")
+                                    if 'result' in func_result:
+                                        func_res = func_result['result']
+                                        if 'analysis_results' in func_res:
+                                            st.info(f"📈 分析了 {len(func_res['analysis_results'])} 个区域")
+                                        elif 'properties' in func_res:
+                                            st.info(f"🏠 找到 {func_res.get('count', 0)} 套房源")
                     
                     # 显示AI回答
-                    if result['answer']:
+                    def render_answer(answer):
                         st.markdown("### 🤖 AI助手回答：")
                         st.markdown(f"""
                         <div style="
@@ -879,10 +910,24 @@ def show_chat_interface():
                                 word-wrap: break-word;
                                 overflow-wrap: break-word;
                             ">
-                                {result['answer']}
+                                {answer}
                             </div>
                         </div>
                         """, unsafe_allow_html=True)
+                    
+                    # 回答逐段显示，结束后再更新历史
+                    result = render_streaming_answer(
+                        st.session_state.agent.process_query_stream(query, top_k),
+                        answer_placeholder,
+                        render_answer,
+                        show_function_results
+                    )
+                    
+                    # 更新session state中的历史
+                    st.session_state.history = result['history']
+                    
+                    # 显示结果
+                    st.success("查询处理完成！")
                         
                 except Exception as e:
                     st.error("🚨 处理查询时遇到问题")
@@ -18,6 +18,17 @@ st.set_page_config(
 # 导入SQLite相关模块
 import sqlite3
 
+# 在用户输入邀请码期间后台预加载嵌入模型和向量库（进程内只加载一次）
+import sys
+agent_dir = str(Path(__file__).parent.parent / "Agent")
+if agent_dir not in sys.path:
+    sys.path.insert(0, agent_dir)
+try:
+    import resources
+    resources.warm_up(background=True)
+except ImportError as e:
+    print(f"无法预加载共享资源: {e}")
+
 # 数据库文件路径
 db_path = Path(__file__).parent / "qrent_agent.db"
 
@@ -81,11 +81,16 @@ def show_report_interface(key_prefix=""):
             # 更新报告Agent的数据
             if st.session_state.report_agent:
                 inquiry_history = getattr(st.session_state.inquiry_agent, 'conversation_history', []) if st.session_state.inquiry_agent else []
+                # 两个对话的滚动摘要（较早的轮次），报告提示词只使用摘要
+                main_memory = getattr(st.session_state.get('agent'), 'memory', None)
+                inquiry_memory = getattr(st.session_state.inquiry_agent, 'memory', None)
                 
                 st.session_state.report_agent.update_user_data(
                     questionnaire_data=st.session_state.questionnaire_data,
                     main_agent_history=st.session_state.history,
-                    inquiry_agent_history=inquiry_history
+                    inquiry_agent_history=inquiry_history,
+                    main_agent_summary=main_memory.summary if main_memory else "",
+                    inquiry_agent_summary=inquiry_memory.summary if inquiry_memory else ""
                 )
             
             st.markdown("### 可用报告类型")